@@ -25,6 +25,7 @@ setup(name='swift3',
       author_email='openstack@lists.launchpad.net',
       url='https://github.com/fujita/swift3',
       packages=['swift3'],
+      scripts=['bin/swift3-profile-report'],
       requires=['swift(>=1.4)'],
       entry_points={'paste.filter_factory':
                         ['swift3=swift3.middleware:filter_factory']})
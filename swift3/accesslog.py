@@ -0,0 +1,233 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+S3 server access logging.
+
+PUT Bucket logging stores the target bucket and prefix of a bucket in the
+``X-Container-Meta-S3-Logging-Target-Bucket`` and
+``X-Container-Meta-S3-Logging-Target-Prefix`` metadata of its container.
+
+When ``access_log`` is enabled, every S3 request to a bucket is formatted as
+an S3 server access log record and appended to an in memory buffer of the
+worker, so nothing is written to Swift while the request is served.  A
+background green thread flushes the buffer every
+``access_log_flush_interval`` seconds, or as soon as
+``access_log_flush_bytes`` are buffered: the records of each bucket with
+logging enabled are written as one ``<prefix>YYYY-mm-dd-HH-MM-SS-<id>``
+object in its target bucket, the others are dropped.  At most
+``access_log_max_bytes`` are buffered, records are dropped beyond that and
+records still buffered when a worker exits are lost.
+
+The logging configuration of the buckets is read with a pre-authorized
+HEAD of their container when their records are flushed, and cached for
+``access_log_config_ttl`` seconds.  The log objects are written with
+pre-authorized PUTs into the account of the source bucket.
+"""
+
+import time
+import uuid
+from urllib import quote
+
+import eventlet
+from eventlet import Timeout
+from eventlet.event import Event
+
+from swift.common.http import is_success, HTTP_NOT_FOUND
+from swift.common.wsgi import make_pre_authed_env, make_pre_authed_request
+
+LOGGING_BUCKET_HEADER = 'x-container-meta-s3-logging-target-bucket'
+LOGGING_PREFIX_HEADER = 'x-container-meta-s3-logging-target-prefix'
+
+# Resource part of the REST.<method>.<resource> operation of the records.
+OPERATION_RESOURCES = {
+    'GetBucketAcl': 'ACL', 'PutBucketAcl': 'ACL',
+    'GetObjectAcl': 'ACL', 'PutObjectAcl': 'ACL',
+    'GetBucketLocation': 'LOCATION',
+    'GetBucketVersioning': 'VERSIONING', 'PutBucketVersioning': 'VERSIONING',
+    'GetBucketLogging': 'LOGGING_STATUS', 'PutBucketLogging': 'LOGGING_STATUS',
+    'ListObjectVersions': 'BUCKETVERSIONS',
+    'ListMultipartUploads': 'UPLOADS', 'CreateMultipartUpload': 'UPLOADS',
+    'UploadPart': 'PART', 'UploadPartCopy': 'PART',
+    'ListParts': 'UPLOAD', 'CompleteMultipartUpload': 'UPLOAD',
+    'AbortMultipartUpload': 'UPLOAD',
+    'DeleteObjects': 'MULTI_OBJECT_DELETE'}
+
+
+def get_request_line(env):
+    """
+    Returns the request line of a request, before swift3 rewrites it.
+    """
+    uri = quote(env['PATH_INFO'])
+    if env.get('QUERY_STRING'):
+        uri += '?' + env['QUERY_STRING']
+    return '%s %s %s' % (env['REQUEST_METHOD'], uri,
+                         env.get('SERVER_PROTOCOL', 'HTTP/1.1'))
+
+
+def format_record(env, stats, owner, request_line):
+    """
+    Returns the S3 server access log record of a request.
+
+    :param env: WSGI environment of the request, once it was handled
+    :param stats: RequestStats of the request
+    :param owner: account owning the bucket
+    :param request_line: request line returned by get_request_line()
+    """
+    method = request_line.split(' ', 1)[0]
+    if stats.operation in ('CopyObject', 'UploadPartCopy'):
+        method = 'COPY'
+    resource = OPERATION_RESOURCES.get(stats.operation,
+                                       'OBJECT' if stats.key else 'BUCKET')
+    authorization = env.get('HTTP_AUTHORIZATION', '')
+    requester = authorization.split(' ', 1)[-1].rsplit(':', 1)[0]
+    remote_ip = env.get('HTTP_X_FORWARDED_FOR', env.get('REMOTE_ADDR', '-'))
+    backend_time = stats.phases.get('backend')
+    fields = [
+        owner, stats.bucket,
+        time.strftime('[%d/%b/%Y:%H:%M:%S +0000]', time.gmtime(stats.start)),
+        remote_ip.split(',', 1)[0].strip(), requester or '-',
+        env.get('swift3.request_id', '-'),
+        'REST.%s.%s' % (method, resource),
+        quote(stats.key) if stats.key else '-',
+        '"%s"' % request_line, stats.status or '-',
+        env.get('swift3.error_code', '-'), stats.response_bytes or '-', '-',
+        int((time.time() - stats.start) * 1000),
+        '-' if backend_time is None else int(backend_time * 1000),
+        '"%s"' % env.get('HTTP_REFERER', '-'),
+        '"%s"' % env.get('HTTP_USER_AGENT', '-'), '-']
+    return ' '.join(str(field) for field in fields) + '\n'
+
+
+class AccessLogger(object):
+    """
+    Buffers the access log records of the worker and writes them to the
+    target buckets.
+
+    :param app: WSGI application the log objects are written to
+    :param conf: configuration of the swift3 filter
+    :param logger: logger used to report failed writes
+    """
+    def __init__(self, app, conf, logger=None):
+        self.app = app
+        self.flush_interval = float(conf.get('access_log_flush_interval', 300))
+        self.flush_bytes = int(conf.get('access_log_flush_bytes', 1048576))
+        self.max_bytes = int(conf.get('access_log_max_bytes', 16777216))
+        self.config_ttl = float(conf.get('access_log_config_ttl', 60))
+        self.logger = logger
+        # (account, bucket) -> (pre-authorized environment, records)
+        self.buffers = {}
+        self.buffered_bytes = 0
+        # (account, bucket) -> ((target bucket, prefix) or None, expiry)
+        self.configs = {}
+        self.dropped = 0
+        self._wakeup = Event()
+        self._flusher = None
+
+    def _cached_config(self, key):
+        entry = self.configs.get(key)
+        if entry is None or entry[1] < time.time():
+            return None, False
+        return entry[0], True
+
+    def log(self, env, stats, request_line):
+        """
+        Buffers the record of a request handled by swift3.
+        """
+        path = env['PATH_INFO'].split('/', 3)
+        if not stats.bucket or len(path) < 3 or path[1] != 'v1':
+            # Rejected before reaching Swift, the account is unknown.
+            return
+        key = (path[2], stats.bucket)
+        if stats.operation == 'PutBucketLogging':
+            self.configs.pop(key, None)
+        config, cached = self._cached_config(key)
+        if cached and config is None:
+            return
+        record = format_record(env, stats, path[2], request_line)
+        if self.buffered_bytes + len(record) > self.max_bytes:
+            self.dropped += 1
+            if self.logger:
+                self.logger.increment('access_log.dropped')
+            return
+        if key not in self.buffers:
+            self.buffers[key] = (make_pre_authed_env(env), [])
+        self.buffers[key][1].append(record)
+        self.buffered_bytes += len(record)
+        if self._flusher is None:
+            self._flusher = eventlet.spawn(self._run)
+        if self.buffered_bytes >= self.flush_bytes and \
+                not self._wakeup.ready():
+            self._wakeup.send()
+
+    def _run(self):
+        while True:
+            with Timeout(self.flush_interval, False):
+                self._wakeup.wait()
+            self._wakeup = Event()
+            try:
+                self.flush()
+            except Exception:
+                if self.logger:
+                    self.logger.exception('Failed to flush the access logs')
+
+    def get_config(self, env, account, bucket):
+        """
+        Returns the (target bucket, prefix) of a bucket, or None if its
+        logging is disabled or its configuration could not be read.
+        """
+        config, cached = self._cached_config((account, bucket))
+        if cached:
+            return config
+        resp = make_pre_authed_request(
+            env, 'HEAD', '/v1/%s/%s' % (account, bucket),
+            agent='Swift3AccessLog', swift_source='S3L').get_response(
+                self.app)
+        if is_success(resp.status_int) and \
+                resp.headers.get(LOGGING_BUCKET_HEADER):
+            config = (resp.headers[LOGGING_BUCKET_HEADER],
+                      resp.headers.get(LOGGING_PREFIX_HEADER, ''))
+        elif not is_success(resp.status_int) and \
+                resp.status_int != HTTP_NOT_FOUND:
+            if self.logger:
+                self.logger.error('Failed to read the logging configuration '
+                                  'of %s/%s: %s', account, bucket, resp.status)
+            return None
+        self.configs[(account, bucket)] = (config,
+                                           time.time() + self.config_ttl)
+        return config
+
+    def flush(self):
+        """
+        Writes the buffered records to the target buckets.
+        """
+        buffers, self.buffers = self.buffers, {}
+        self.buffered_bytes = 0
+        for (account, bucket), (env, records) in buffers.iteritems():
+            config = self.get_config(env, account, bucket)
+            if config is None:
+                continue
+            target, prefix = config
+            name = '%s%s-%s' % (
+                prefix, time.strftime('%Y-%m-%d-%H-%M-%S', time.gmtime()),
+                uuid.uuid4().hex[:16].upper())
+            resp = make_pre_authed_request(
+                env, 'PUT', '/v1/%s/%s/%s' % (account, target, name),
+                body=''.join(records), agent='Swift3AccessLog',
+                swift_source='S3L').get_response(self.app)
+            if not is_success(resp.status_int) and self.logger:
+                self.logger.error('Failed to write the access log of %s/%s '
+                                  'to %s: %s', account, bucket, target,
+                                  resp.status)
@@ -0,0 +1,133 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per bucket circuit breaker for the backend calls made by swift3.
+
+After ``breaker_threshold`` consecutive backend failures (5xx responses or
+exceptions such as timeouts) on a bucket within ``breaker_window`` seconds,
+the breaker of that bucket opens and every request to the bucket fails
+immediately with ``ServiceUnavailable`` instead of waiting out the proxy
+timeouts.  After ``breaker_open_time`` seconds a single probe request is let
+through (half-open); the breaker closes if it succeeds and opens again
+otherwise.  ``breaker_threshold = 0`` (the default) disables the breakers.
+
+The breakers are kept per worker.
+"""
+
+import time
+
+from utils import BackendUnavailable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpen(BackendUnavailable):
+    """
+    Raised when a backend call is refused by an open breaker.
+    """
+    pass
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.first_failure = 0
+        self.opened_at = 0
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breakers keyed on bucket.
+
+    :param threshold: consecutive failures which open a breaker
+    :param window: seconds within which the failures must happen
+    :param open_time: seconds a breaker stays open before probing
+    :param logger: logger used to emit the state change metrics
+    """
+    def __init__(self, threshold, window=10, open_time=30, logger=None):
+        self.threshold = threshold
+        self.window = window
+        self.open_time = open_time
+        self.logger = logger
+        self.circuits = {}
+
+    def state(self, key):
+        circuit = self.circuits.get(key)
+        return circuit.state if circuit else CLOSED
+
+    def allow(self, key):
+        """
+        Checks that a backend call may be made.
+
+        :raises CircuitOpen: if the breaker of the key is open
+        """
+        circuit = self.circuits.get(key)
+        if circuit is None or circuit.state == CLOSED:
+            return
+        if circuit.state == OPEN and \
+                time.time() - circuit.opened_at >= self.open_time:
+            # Let this call through as the probe.
+            circuit.state = HALF_OPEN
+            return
+        if self.logger:
+            self.logger.increment('breaker.rejected')
+        raise CircuitOpen(key)
+
+    def cancel(self, key):
+        """
+        Forgets a call allowed by allow() which was not made after all.
+        """
+        circuit = self.circuits.get(key)
+        if circuit is not None and circuit.state == HALF_OPEN:
+            # Let the next call probe right away.
+            circuit.state = OPEN
+            circuit.opened_at = time.time() - self.open_time
+
+    def record(self, key, success):
+        """
+        Records the outcome of a backend call allowed by allow().
+        """
+        circuit = self.circuits.get(key)
+        if success:
+            if circuit is not None:
+                if circuit.state != CLOSED and self.logger:
+                    self.logger.increment('breaker.closed')
+                del self.circuits[key]
+            return
+
+        now = time.time()
+        if circuit is None:
+            circuit = self.circuits[key] = _Circuit()
+        if circuit.state == HALF_OPEN:
+            self._open(circuit, now)
+            return
+        if circuit.state == OPEN:
+            return
+        if not circuit.failures or now - circuit.first_failure > self.window:
+            circuit.failures = 0
+            circuit.first_failure = now
+        circuit.failures += 1
+        if circuit.failures >= self.threshold:
+            self._open(circuit, now)
+
+    def _open(self, circuit, now):
+        circuit.state = OPEN
+        circuit.opened_at = now
+        if self.logger:
+            self.logger.increment('breaker.opened')
@@ -0,0 +1,134 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Caches of objects and of missing objects and buckets.
+
+When ``object_cache_size`` is set (in bytes, 0 the default disables the
+cache), GET Object responses of at most ``object_cache_max_object_size``
+bytes are kept in a least recently used cache keyed on account, bucket and
+key.  A cached object is never served blindly: the GET is still sent to
+Swift with ``If-None-Match`` set to the cached ETag, so authorization is
+checked as usual and the object server answers a cheap ``304`` instead of
+reading the object when it did not change.
+
+PUT, DELETE and Complete Multipart Upload requests going through swift3
+invalidate the cached copy of their key.
+
+When ``negative_cache_ttl`` is set (in seconds, 0 the default disables the
+cache), the keys and buckets for which Swift answered 404 are remembered for
+that long and repeated GET and HEAD requests for them are answered with
+``NoSuchKey`` or ``NoSuchBucket`` without a backend call.  As the backend
+does not see these requests, a miss is only reused for the access key which
+got it and only when swift3 verified the signature itself
+(``verify_signature = true``).  PUT requests going through swift3
+invalidate the entry of their key or bucket.  The entries are kept per
+worker, or in ``swift.cache`` with ``negative_cache_shared = true`` so that
+every worker sees the invalidations.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class ObjectCache(object):
+    """
+    Byte bounded LRU cache of (etag, headers, body) of small objects.
+
+    :param max_bytes: maximum total size of the cached bodies
+    :param max_object_size: size of the largest body cached
+    """
+    def __init__(self, max_bytes, max_object_size=65536):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.bytes = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the cached (etag, headers, body) of key, or None.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            # Most recently used entries are kept at the end.
+            self.entries[key] = entry
+        return entry
+
+    def put(self, key, etag, headers, body):
+        if len(body) > self.max_object_size:
+            return
+        self.invalidate(key)
+        self.entries[key] = (etag, headers, body)
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            body = self.entries.popitem(last=False)[1][2]
+            self.bytes -= len(body)
+
+    def invalidate(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[2])
+
+
+class NegativeCache(object):
+    """
+    Remembers which access key got a 404 for a key or bucket.
+
+    :param ttl: seconds a miss is remembered
+    :param shared: keep the entries in swift.cache when it is available
+    :param max_entries: maximum number of entries kept per worker
+    :param prefix: prefix of the memcache keys
+    """
+    def __init__(self, ttl, shared=False, max_entries=10000,
+                 prefix='swift3/negative'):
+        self.ttl = ttl
+        self.shared = shared
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.entries = OrderedDict()
+
+    def _memcache(self, env):
+        return env.get('swift.cache') if self.shared else None
+
+    def get(self, env, key):
+        """
+        Returns the access key which got a 404 for key, or None.
+        """
+        memcache = self._memcache(env)
+        if memcache is not None:
+            return memcache.get('%s/%s' % (self.prefix, key))
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.time():
+            self.entries.pop(key, None)
+            return None
+        return entry[0]
+
+    def set(self, env, key, access_key):
+        memcache = self._memcache(env)
+        if memcache is not None:
+            memcache.set('%s/%s' % (self.prefix, key), access_key,
+                         time=self.ttl)
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = (access_key, time.time() + self.ttl)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, env, key):
+        memcache = self._memcache(env)
+        if memcache is not None:
+            memcache.delete('%s/%s' % (self.prefix, key))
+        else:
+            self.entries.pop(key, None)
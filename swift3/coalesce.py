@@ -0,0 +1,65 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Coalescing of identical concurrent backend reads.
+
+With ``coalesce_reads = true``, the backend calls of GET Bucket and HEAD
+Object are made through a per worker :class:`Coalescer`: while a call is in
+flight, identical calls from the same identity wait for it and share its
+response instead of reaching Swift.  The identity is the access key when
+swift3 verified the signature, and otherwise the Authorization header
+together with the signed string, so a response is only ever shared between
+requests which Swift would authorize in the same way.
+"""
+
+from eventlet.event import Event
+
+
+class Coalescer(object):
+    """
+    Single flight of calls keyed on identical requests.
+
+    :param logger: logger used to emit the shared call metrics
+    """
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.inflight = {}
+        self.shared_calls = 0
+
+    def call(self, key, func, *args):
+        """
+        Returns func(*args), or the result of the call with the same key in
+        flight.  The result is shared as is, so it must not be modified.
+        """
+        event = self.inflight.get(key)
+        if event is not None:
+            result = event.wait()
+            if result is not None:
+                self.shared_calls += 1
+                if self.logger:
+                    self.logger.increment('coalesce.shared')
+                return result
+            # The call failed, make our own.
+            return func(*args)
+
+        event = self.inflight[key] = Event()
+        result = None
+        try:
+            result = func(*args)
+            return result
+        finally:
+            del self.inflight[key]
+            event.send(result)
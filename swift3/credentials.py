@@ -0,0 +1,151 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Credential stores used by swift3 to verify S3 signatures locally.
+
+When ``verify_signature`` is enabled, Swift3Middleware looks up the secret
+key of the access key given in the Authorization header and checks the HMAC
+itself, so requests with a bad signature are rejected without ever reaching
+the auth middleware or the backend.  Positive lookups are kept in a per
+worker :class:`MemoryCredentialStore` for ``credential_cache_ttl`` seconds,
+or until a signature does not match the cached secret, in which case the
+store is asked again before the request is rejected.
+
+The secrets themselves come from one of the following stores, selected with
+``credential_store``:
+
+    * ``memcache``: the secret is read from ``swift.cache`` under the key
+      ``<credential_memcache_prefix>/<access key>``.  Something outside of
+      swift3 (e.g. the auth system) is expected to populate it.
+    * ``file``: the secrets are read from ``credential_file``, one
+      ``<access key> <secret key>`` pair per line.  Mostly useful for tests
+      and small deployments.
+
+Access keys which are unknown to the store are not rejected; the request is
+passed on and the auth middleware gets to decide.
+"""
+
+import os
+import time
+
+
+class CredentialStore(object):
+    """
+    Base class of the credential stores.
+    """
+    def get_secret(self, env, access_key):
+        """
+        Returns the secret key of the access key, or None if unknown.
+
+        :param env: WSGI environment of the current request
+        :param access_key: S3 access key
+        """
+        raise NotImplementedError
+
+
+class MemoryCredentialStore(CredentialStore):
+    """
+    Per worker credential store whose entries expire after ``ttl`` seconds.
+    """
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._secrets = {}
+
+    def get_secret(self, env, access_key):
+        entry = self._secrets.get(access_key)
+        if entry is None:
+            return None
+        secret, expires = entry
+        if expires < time.time():
+            self._secrets.pop(access_key, None)
+            return None
+        return secret
+
+    def set_secret(self, access_key, secret):
+        if len(self._secrets) >= self.max_entries:
+            self._secrets.clear()
+        self._secrets[access_key] = (secret, time.time() + self.ttl)
+
+    def invalidate(self, access_key):
+        self._secrets.pop(access_key, None)
+
+
+class MemcacheCredentialStore(CredentialStore):
+    """
+    Credential store backed by the memcache client found in ``swift.cache``.
+    """
+    def __init__(self, prefix='swift3/credential'):
+        self.prefix = prefix
+
+    def get_secret(self, env, access_key):
+        memcache = env.get('swift.cache')
+        if memcache is None:
+            return None
+        return memcache.get('%s/%s' % (self.prefix, access_key))
+
+
+class FileCredentialStore(CredentialStore):
+    """
+    Credential store reading ``<access key> <secret key>`` lines from a file.
+
+    The file is read again whenever its modification time changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._secrets = {}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime = None
+            self._secrets = {}
+            return
+        if mtime == self._mtime:
+            return
+        secrets = {}
+        with open(self.path) as fp:
+            for line in fp:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    access_key, secret = line.split(None, 1)
+                except ValueError:
+                    continue
+                secrets[access_key] = secret.strip()
+        self._secrets = secrets
+        self._mtime = mtime
+
+    def get_secret(self, env, access_key):
+        self._load()
+        return self._secrets.get(access_key)
+
+
+def get_credential_store(conf):
+    """
+    Returns the credential store configured in the swift3 filter section.
+    """
+    store = conf.get('credential_store', 'memcache').lower()
+    if store == 'file':
+        return FileCredentialStore(
+            conf.get('credential_file', '/etc/swift/s3-credentials'))
+    elif store == 'memcache':
+        return MemcacheCredentialStore(
+            conf.get('credential_memcache_prefix', 'swift3/credential'))
+    raise ValueError('Unknown credential_store: %s' % store)
@@ -0,0 +1,121 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per worker histograms of the S3 requests, in the Prometheus text format.
+
+When ``metrics_path`` is set (for instance to ``/swift3/metrics``), swift3
+keeps, for every S3 operation and response status, histograms of:
+
+    * ``swift3_request_duration_seconds``: the time until the response
+      headers are sent
+    * ``swift3_response_bytes``: the Content-Length of the response
+    * ``swift3_backend_calls``: the number of Swift calls made for the
+      request, which shows the requests amplified into many backend calls
+      (multi-delete, paged listings, multipart uploads...)
+
+and an unsigned GET of ``metrics_path`` returns them in the Prometheus text
+format, along with gauges of the current state of the worker such as the
+depth of the backend call queue of the scheduler.
+The histograms have fixed, exponentially growing buckets, so their memory
+does not depend on the traffic.  They are kept per worker, so every worker
+answers with its own values.  The path is not authenticated, it should
+only be reachable from the monitoring network.
+"""
+
+from bisect import bisect_left
+
+LATENCY_BUCKETS = tuple(0.0005 * 2 ** i for i in range(18))
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(13))
+BACKEND_CALLS_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64, 128, 256, 1024)
+
+HISTOGRAMS = (
+    ('swift3_request_duration_seconds',
+     'Time until the response headers of S3 requests', LATENCY_BUCKETS),
+    ('swift3_response_bytes',
+     'Content-Length of the responses to S3 requests', BYTES_BUCKETS),
+    ('swift3_backend_calls',
+     'Number of Swift calls made for S3 requests', BACKEND_CALLS_BUCKETS))
+
+
+class Histogram(object):
+    """
+    Histogram with fixed bucket upper bounds.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last bucket counts the values above every bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+class MetricsRegistry(object):
+    """
+    Histograms of the S3 requests keyed on operation and status.
+    """
+    def __init__(self):
+        self.histograms = {}
+
+    def observe(self, operation, status, duration, response_bytes,
+                backend_calls):
+        histograms = self.histograms.get((operation, status))
+        if histograms is None:
+            histograms = self.histograms[(operation, status)] = \
+                [Histogram(bounds) for name, doc, bounds in HISTOGRAMS]
+        for histogram, value in zip(histograms, (duration, response_bytes,
+                                                 backend_calls)):
+            histogram.observe(value)
+
+    def render(self, gauges=()):
+        """
+        Returns the histograms in the Prometheus text format.
+
+        :param gauges: list of (name, help, value) gauges to add
+        """
+        lines = []
+        for name, doc, value in gauges:
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %s' % (name, value))
+        for i, (name, doc, bounds) in enumerate(HISTOGRAMS):
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s histogram' % name)
+            for (operation, status), histograms in \
+                    sorted(self.histograms.iteritems()):
+                histogram = histograms[i]
+                labels = 'operation="%s",status="%s"' % (operation, status)
+                cumulative = 0
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' %
+                                 (name, labels, _format_bound(bound),
+                                  cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' %
+                             (name, labels, histogram.count))
+                lines.append('%s_sum{%s} %s' % (name, labels,
+                                                repr(histogram.sum)))
+                lines.append('%s_count{%s} %d' % (name, labels,
+                                                  histogram.count))
+        return '\n'.join(lines) + '\n'
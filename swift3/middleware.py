@@ -28,6 +28,13 @@ The following opperations are currently supported:
     * HEAD Object
     * PUT Object
     * PUT Object (Copy)
+    * Initiate Multipart Upload
+    * Upload Part
+    * Complete Multipart Upload
+    * Abort Multipart Upload
+    * List Multipart Uploads
+    * List Parts
+    * Upload Part Copy
 
 To add this middleware to your configuration, add the swift3 middleware
 in front of the auth middleware, and before any other middleware that
@@ -54,34 +61,334 @@ following for an SAIO setup::
 
 from urllib import unquote, quote
 import base64
+import uuid
+from hashlib import md5
+from StringIO import StringIO
 from xml.sax.saxutils import escape as xml_escape
 from xml.dom.minidom import parseString
 import urlparse
 
-from simplejson import loads
+from simplejson import loads, dumps
 import email.utils
 import datetime
+import time
 
 from swift.common.utils import split_path
-from swift.common.utils import get_logger
+from swift.common.utils import get_logger, config_true_value, \
+    streq_const_time
 from swift.common.wsgi import WSGIContext
 from swift.common.swob import Request, Response
 from swift.common.http import HTTP_OK, HTTP_CREATED, HTTP_ACCEPTED, \
     HTTP_NO_CONTENT, HTTP_UNAUTHORIZED, HTTP_FORBIDDEN, HTTP_NOT_FOUND, \
-    HTTP_CONFLICT, HTTP_UNPROCESSABLE_ENTITY, is_success
+    HTTP_CONFLICT, HTTP_UNPROCESSABLE_ENTITY, HTTP_BAD_REQUEST, \
+    HTTP_NOT_MODIFIED, HTTP_PRECONDITION_FAILED, HTTP_PARTIAL_CONTENT, \
+    is_success
 from swift.obj import server as obj_server
 from swift.container import server as container_server
 
 from utils import get_err_response, MAX_BUCKET_LISTING, get_s3_acl, \
-    acp_to_headers, swift_acl_translate, canonical_string
+    acp_to_headers, swift_acl_translate, object_acl_translate, \
+    canonical_string, get_signature, BackendUnavailable, \
+    validate_content_length, MAX_UPLOAD_SIZE, MAX_PARTS, MIN_PART_SIZE
+from credentials import MemoryCredentialStore, get_credential_store
+from ratelimit import RateLimiter, get_operation_class
+from scheduler import FairScheduler, parse_weights
+from breaker import CircuitBreaker
+from quota import AccountUsageCache, get_usage_from_headers
+from cache import ObjectCache, NegativeCache
+from coalesce import Coalescer
+from prefetch import ListingPrefetcher
+from stats import RequestStats, StatsAggregator, get_operation_name
+from metrics import MetricsRegistry
+from profiling import RequestProfiler
+from tracing import get_request_ids, get_span_sink
+from accesslog import AccessLogger, get_request_line, \
+    LOGGING_BUCKET_HEADER, LOGGING_PREFIX_HEADER
+
+# Request headers which are kept in the sub-requests made by the controllers,
+# so that they are authenticated like the request itself.
+SUB_REQUEST_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_X_AUTH_TOKEN', 'HTTP_HOST',
+                       'HTTP_DATE', 'HTTP_X_AMZ_DATE', 'HTTP_USER_AGENT')
+CONDITIONAL_HEADERS = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH',
+                       'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE')
+
+# Layout of the segments container used by multipart uploads, see
+# MultipartController.
+MULTIUPLOAD_SUFFIX = '+segments'
+UPLOAD_PREFIX = 'u/'
+UPLOAD_ID_SEP = '\x01'
+UPLOAD_ID_SEP_NEXT = '\x02'
+PART_PREFIX = 'p/'
+
+
+class PassThroughResponse(object):
+    """
+    WSGI application answering with a backend response as is.
+
+    Used instead of a swob Response on the object GET path: the backend
+    body iterator (and its close()) is handed straight to the WSGI server,
+    which keeps its chunk sizes and, without a scheduler, any
+    wsgi.file_wrapper of the backend, and no Python code runs per chunk of
+    the body.
+    """
+    def __init__(self, status, headers, app_iter):
+        self.status = status
+        self.status_int = int(status.split(' ', 1)[0])
+        self.headers = headers
+        self.app_iter = app_iter
+
+    def __call__(self, env, start_response):
+        start_response(self.status, self.headers)
+        return self.app_iter
+
+
+class SlotHoldingIter(object):
+    """
+    Backend body iterator keeping the scheduler slot of its backend call
+    until it is closed, so that the scheduler bounds the bodies being read
+    and not only the time to the response headers.
+    """
+    def __init__(self, app_iter, release):
+        self.app_iter = app_iter
+        self.release = release
 
+    def __iter__(self):
+        return iter(self.app_iter)
 
-class ServiceController(WSGIContext):
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            release, self.release = self.release, None
+            if release is not None:
+                release()
+
+
+class Controller(WSGIContext):
+    """
+    Base class of the controllers, every backend call goes through _app_call.
+
+    The handlers check everything which can be decided from the headers
+    before wsgi.input is read, so that a client sending "Expect:
+    100-continue" is rejected before it starts to send the body.
+    """
+    def __init__(self, app, account_name, **kwargs):
+        WSGIContext.__init__(self, app)
+        self.account_name = unquote(account_name)
+        self.scheduler = kwargs.get('scheduler')
+        self.breaker = kwargs.get('breaker')
+        self.usage_cache = kwargs.get('usage_cache')
+        self.object_cache = kwargs.get('object_cache')
+        self.negative_cache = kwargs.get('negative_cache')
+        self.coalescer = kwargs.get('coalescer')
+        self.prefetcher = kwargs.get('prefetcher')
+
+    def _bucket_key(self):
+        return '%s/%s' % (self.account_name, self.container_name)
+
+    def _object_key(self, object_name):
+        return '%s/%s/%s' % (self.account_name, self.container_name,
+                             object_name)
+
+    def _invalidate_object(self, env, object_name):
+        """
+        Forgets what is cached about an object which is being changed.
+        """
+        key = self._object_key(object_name)
+        if self.object_cache is not None:
+            self.object_cache.invalidate(key)
+        if self.negative_cache is not None:
+            self.negative_cache.invalidate(env, key)
+
+    def _known_missing(self, env, *keys):
+        """
+        Returns the first of the keys the backend answered 404 for to the
+        access key of the request, which must have been verified by swift3,
+        or None.
+        """
+        access_key = env.get('swift3.verified_access_key')
+        if self.negative_cache is None or access_key is None:
+            return None
+        for key in keys:
+            if self.negative_cache.get(env, key) == access_key:
+                return key
+        return None
+
+    def _record_missing(self, env, key):
+        access_key = env.get('swift3.verified_access_key')
+        if self.negative_cache is not None and access_key is not None:
+            self.negative_cache.set(env, key, access_key)
+
+    def _sub_env(self, env, method, path, query_string=''):
+        """
+        Returns the environment of a sub-request made on behalf of env.
+        """
+        sub_env = dict((k, v) for k, v in env.iteritems()
+                       if k in SUB_REQUEST_HEADERS or
+                       not k.startswith(('HTTP_', 'CONTENT_')))
+        sub_env['REQUEST_METHOD'] = method
+        sub_env['PATH_INFO'] = path
+        sub_env['QUERY_STRING'] = query_string
+        sub_env['CONTENT_LENGTH'] = '0'
+        sub_env['wsgi.input'] = StringIO('')
+        return sub_env
+
+    def _check_quota(self, env, content_length):
+        """
+        Checks an upload against the usage and quota of the account.
+
+        :returns: error response if the upload would exceed the quota
+        """
+        usage = self.usage_cache.get(env, self.account_name)
+        if usage is None:
+            self._app_call(self._sub_env(env, 'HEAD',
+                                         '/v1/%s' % self.account_name))
+            if not is_success(self._get_status_int()):
+                # Let the backend decide.
+                return None
+            usage = get_usage_from_headers(dict(self._response_headers))
+            self.usage_cache.set(env, self.account_name, *usage)
+        bytes_used, quota = usage
+        if quota is not None and bytes_used + content_length > quota:
+            return get_err_response('QuotaExceeded')
+        return None
+
+    def _has_uploads(self, env):
+        """
+        Tells whether the bucket has a segments container.  Only then can
+        its objects be made of the parts of multipart uploads.
+        """
+        self._app_call(self._sub_env(env, 'HEAD', '/v1/%s/%s%s' % (
+            self.account_name, self.container_name, MULTIUPLOAD_SUFFIX)))
+        return is_success(self._get_status_int())
+
+    def _upload_segments(self, env, path):
+        """
+        Returns the paths of the parts of a multipart upload the object at
+        path is the manifest of, in its segments container, or an empty
+        list.
+        """
+        self._app_call(self._sub_env(env, 'HEAD', path,
+                                     'multipart-manifest=get'))
+        if not is_success(self._get_status_int()) or \
+                not config_true_value(
+                    self._response_header_value('x-static-large-object')):
+            return []
+        body_iter = self._app_call(self._sub_env(
+            env, 'GET', path, 'multipart-manifest=get'))
+        if self._get_status_int() != HTTP_OK:
+            return []
+        prefix = '/%s%s/%s' % (self.container_name, MULTIUPLOAD_SUFFIX,
+                               PART_PREFIX)
+        segments = [segment['name'].encode('utf-8')
+                    for segment in loads(''.join(list(body_iter)))
+                    if segment['name'].startswith(prefix)]
+        if segments:
+            # Older versions of the object may still use the parts.
+            self._app_call(self._sub_env(
+                env, 'HEAD', '/v1/%s/%s' % (self.account_name,
+                                            self.container_name)))
+            if not is_success(self._get_status_int()) or \
+                    self._response_header_value('x-container-versioning'):
+                return []
+        return segments
+
+    def _delete_segments(self, env, segments):
+        for name in segments:
+            self._app_call(self._sub_env(
+                env, 'DELETE', '/v1/%s%s' % (self.account_name, name)))
+
+    def _add_time(self, env, phase, start):
+        """
+        Accounts the time since start to a phase of the request statistics.
+        """
+        stats = env.get('swift3.stats')
+        if stats is not None:
+            stats.add_since(phase, start)
+
+    def _count_listing(self, env, listing):
+        stats = env.get('swift3.stats')
+        if stats is not None:
+            stats.listing_entries += len(listing)
+
+    def _app_call(self, env, hold_slot=False):
+        """
+        Calls the backend.  With hold_slot, the scheduler slot is released
+        when the returned body iterator is closed, which the caller must do.
+        """
+        breaker_key = None
+        if self.breaker is not None and getattr(self, 'container_name', None):
+            breaker_key = '%s/%s' % (self.account_name, self.container_name)
+            self.breaker.allow(breaker_key)
+        if self.scheduler is not None:
+            try:
+                self.scheduler.acquire(self.account_name.split(':', 1)[0])
+            except BaseException:
+                if breaker_key:
+                    self.breaker.cancel(breaker_key)
+                raise
+        stats = env.get('swift3.stats')
+        start = time.time()
+        completed = held = False
+        try:
+            resp = WSGIContext._app_call(self, env)
+            completed = True
+            held = hold_slot and self.scheduler is not None
+        finally:
+            if breaker_key and not completed:
+                # Whatever interrupted the call, it is a failure, so that a
+                # half-open breaker is not left waiting for its probe.
+                self.breaker.record(breaker_key, False)
+            if self.scheduler is not None and not held:
+                self.scheduler.release()
+            if stats is not None:
+                # No status when the backend raised before responding.
+                status = None
+                if self._response_status is not None:
+                    status = self._get_status_int()
+                stats.add_backend_call(start, env['REQUEST_METHOD'],
+                                       env['PATH_INFO'], status)
+        if held:
+            resp = SlotHoldingIter(resp, self.scheduler.release)
+        if breaker_key:
+            self.breaker.record(breaker_key, self._get_status_int() < 500)
+        return resp
+
+    def _buffered_app_call(self, env):
+        body = ''.join(self._app_call(env))
+        return self._response_status, self._response_headers, body
+
+    def _fetch_page(self, env):
+        page = self._buffered_app_call(env)
+        return page if self._get_status_int() == HTTP_OK else None
+
+    def _coalesced_app_call(self, env):
+        """
+        Makes an idempotent backend call, sharing it with the identical calls
+        of the same identity in flight when coalescing is enabled.  The
+        response body is buffered.
+        """
+        if self.coalescer is None:
+            return self._app_call(env)
+        identity = env.get('swift3.verified_access_key') or \
+            (env.get('HTTP_AUTHORIZATION'), env.get('HTTP_X_AUTH_TOKEN'))
+        key = (identity, env['REQUEST_METHOD'], env['PATH_INFO'],
+               env.get('QUERY_STRING', ''), env.get('HTTP_RANGE')) + \
+            tuple(env.get(h) for h in CONDITIONAL_HEADERS)
+        status, headers, body = self.coalescer.call(
+            key, self._buffered_app_call, env)
+        self._response_status = status
+        self._response_headers = list(headers)
+        return [body]
+
+
+class ServiceController(Controller):
     """
     Handles account level requests.
     """
     def __init__(self, env, app, account_name, token, **kwargs):
-        WSGIContext.__init__(self, app)
+        Controller.__init__(self, app, account_name, **kwargs)
         env['HTTP_X_AUTH_TOKEN'] = token
         env['PATH_INFO'] = '/v1/%s' % account_name
 
@@ -99,7 +406,16 @@ class ServiceController(WSGIContext):
             else:
                 return get_err_response('InvalidURI')
 
+        if self.usage_cache is not None:
+            bytes_used, quota = get_usage_from_headers(
+                dict(self._response_headers))
+            self.usage_cache.set(env, self.account_name, bytes_used, quota)
+
+        start = time.time()
         containers = loads(''.join(list(body_iter)))
+        self._add_time(env, 'parse_response', start)
+        self._count_listing(env, containers)
+        start = time.time()
         # we don't keep the creation time of a backet (s3cmd doesn't
         # work without that) so we use something bogus.
         if containers:
@@ -118,18 +434,18 @@ class ServiceController(WSGIContext):
                            % xml_escape(i['name']) for i in containers]))
         resp = Response(status=HTTP_OK, content_type='application/xml',
                         body=body)
+        self._add_time(env, 'render', start)
         return resp
 
 
-class BucketController(WSGIContext):
+class BucketController(Controller):
     """
     Handles bucket request.
     """
     def __init__(self, env, app, account_name, token, container_name,
                  **kwargs):
-        WSGIContext.__init__(self, app)
+        Controller.__init__(self, app, account_name, **kwargs)
         self.container_name = unquote(container_name)
-        self.account_name = unquote(account_name)
         env['HTTP_X_AUTH_TOKEN'] = token
         env['PATH_INFO'] = '/v1/%s/%s' % (account_name, container_name)
         conf = kwargs.get('conf', {})
@@ -151,7 +467,10 @@ class BucketController(WSGIContext):
         max_keys = min(int(args.get('max-keys', MAX_BUCKET_LISTING)),
                        MAX_BUCKET_LISTING)
 
-        if 'acl' in args:
+        if self._known_missing(env, self._bucket_key()):
+            return get_err_response('NoSuchBucket')
+
+        if 'acl' in args or 'logging' in args:
             env['REQUEST_METHOD'] = 'HEAD'
         else:
             # acl request sent with format=json etc confuses swift
@@ -165,21 +484,50 @@ class BucketController(WSGIContext):
         if 'delimiter' in args:
             env['QUERY_STRING'] += '&delimiter=%s' % quote(args['delimiter'])
 
-        body_iter = self._app_call(env)
+        access_key = env.get('swift3.verified_access_key')
+        prefetching = self.prefetcher is not None and access_key and \
+            not [k for k in args
+                 if k not in ('marker', 'prefix', 'delimiter', 'max-keys')]
+        page = None
+        if prefetching:
+            page = self.prefetcher.get(
+                (access_key, env['PATH_INFO'], env['QUERY_STRING']))
+        if page is not None:
+            self._response_status, headers, body = page
+            self._response_headers = list(headers)
+            body_iter = [body]
+        else:
+            body_iter = self._coalesced_app_call(env)
         status = self._get_status_int()
         headers = dict(self._response_headers)
 
-        if 'acl' in args:
+        if 'acl' in args or 'logging' in args:
             env['REQUEST_METHOD'] = 'GET'  # recover HTTP method
 
         if is_success(status) and 'acl' in args:
             return get_s3_acl(headers, container_server.ACL_HEADERS,
                               'container')
 
+        if is_success(status) and 'logging' in args:
+            body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                    '<BucketLoggingStatus '
+                    'xmlns="http://doc.s3.amazonaws.com/2006-03-01">')
+            target = self._response_header_value(LOGGING_BUCKET_HEADER)
+            if target:
+                prefix = self._response_header_value(LOGGING_PREFIX_HEADER)
+                body += ('<LoggingEnabled>'
+                         '<TargetBucket>%s</TargetBucket>'
+                         '<TargetPrefix>%s</TargetPrefix>'
+                         '</LoggingEnabled>' %
+                         (xml_escape(target), xml_escape(prefix or '')))
+            body += '</BucketLoggingStatus>'
+            return Response(body=body, content_type='application/xml')
+
         if status != HTTP_OK:
             if status in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
                 return get_err_response('AccessDenied')
             elif status == HTTP_NOT_FOUND:
+                self._record_missing(env, self._bucket_key())
                 return get_err_response('NoSuchBucket')
             else:
                 return get_err_response('InvalidURI')
@@ -203,14 +551,13 @@ class BucketController(WSGIContext):
                 vers.capitalize())
             return Response(body=body, content_type='application/xml')
 
-        if 'logging' in args:
-            # logging disabled
-            body = ('<?xml version="1.0" encoding="UTF-8"?>'
-                    '<BucketLoggingStatus '
-                    'xmlns="http://doc.s3.amazonaws.com/2006-03-01" />')
-            return Response(body=body, content_type='application/xml')
-
+        start = time.time()
         objects = loads(''.join(list(body_iter)))
+        self._add_time(env, 'parse_response', start)
+        self._count_listing(env, objects)
+        if prefetching and max_keys > 0 and len(objects) == max_keys + 1:
+            self._prefetch_next_page(env, args, max_keys, objects[-1])
+        start = time.time()
         if 'versions' in args:
             obj_list = []
             for obj in objects:
@@ -319,19 +666,39 @@ class BucketController(WSGIContext):
                     xml_escape(self.container_name),
                     ''.join(obj_list),
                     ''.join(prefixes)))
+        self._add_time(env, 'render', start)
         return Response(body=body, content_type='application/xml')
 
+    def _prefetch_next_page(self, env, args, max_keys, last):
+        """
+        Starts fetching the listing page following the entry last, which is
+        the page a client walking the bucket asks for next.
+        """
+        marker = (last.get('name') or last['subdir']).encode('utf-8')
+        query = 'format=json&limit=%s&marker=%s' % (max_keys + 1,
+                                                    quote(marker))
+        if 'prefix' in args:
+            query += '&prefix=%s' % quote(args['prefix'])
+        if 'delimiter' in args:
+            query += '&delimiter=%s' % quote(args['delimiter'])
+        # Use a context of its own, this one is still in use.
+        fetcher = Controller(self.app, self.account_name,
+                             scheduler=self.scheduler, breaker=self.breaker)
+        fetcher.container_name = self.container_name
+        sub_env = self._sub_env(env, 'GET', env['PATH_INFO'], query)
+        # The page is fetched for the next request, not for this one.
+        sub_env.pop('swift3.stats', None)
+        self.prefetcher.prefetch(
+            (env['swift3.verified_access_key'], env['PATH_INFO'], query),
+            fetcher._fetch_page, sub_env)
+
     def PUT(self, env, start_response):
         """
         Handle PUT Bucket request
         """
-        if 'CONTENT_LENGTH' in env:
-            try:
-                content_length = int(env['CONTENT_LENGTH'])
-            except (ValueError, TypeError):
-                return get_err_response('InvalidArgument')
-            if content_length < 0:
-                return get_err_response('InvalidArgument')
+        res = validate_content_length(env)
+        if res:
+            return res
 
         if 'QUERY_STRING' in env:
             args = dict(urlparse.parse_qsl(env['QUERY_STRING'], 1))
@@ -340,9 +707,20 @@ class BucketController(WSGIContext):
 
         acl = 'acl' in args
         if acl:
-            res = acp_to_headers(env, 'container')
-            if res:
-                return res
+            if 'HTTP_X_AMZ_ACL' in env:
+                # Canned ACL, there is no body to read.
+                translated_acl = swift_acl_translate(env['HTTP_X_AMZ_ACL'])
+                if translated_acl == 'Unsupported':
+                    return get_err_response('Unsupported')
+                elif translated_acl == 'InvalidArgument':
+                    return get_err_response('InvalidArgument')
+                del env['HTTP_X_AMZ_ACL']
+                for header, value in translated_acl:
+                    env[header] = value
+            else:
+                res = acp_to_headers(env, 'container')
+                if res:
+                    return res
             env['REQUEST_METHOD'] = 'POST'
 
         versioning = 'versioning' in args
@@ -360,7 +738,14 @@ class BucketController(WSGIContext):
                     'IllegalVersioningConfigurationException')
             env['REQUEST_METHOD'] = 'POST'
 
-        if not acl and not versioning:
+        logging = 'logging' in args
+        if logging:
+            res = self._set_logging_headers(env)
+            if res:
+                return res
+            env['REQUEST_METHOD'] = 'POST'
+
+        if not acl and not versioning and not logging:
             if 'HTTP_X_AMZ_ACL' in env:
                 amz_acl = env['HTTP_X_AMZ_ACL']
                 # Translate the Amazon ACL to something that can be
@@ -379,29 +764,8 @@ class BucketController(WSGIContext):
                 for header, acl in translated_acl:
                     env[header] = acl
 
-            if 'CONTENT_LENGTH' in env:
-                content_length = env['CONTENT_LENGTH']
-                try:
-                    content_length = int(content_length)
-                except (ValueError, TypeError):
-                    return get_err_response('InvalidArgument')
-                if content_length < 0:
-                    return get_err_response('InvalidArgument')
-
-            if 'QUERY_STRING' in env:
-                args = dict(urlparse.parse_qsl(env['QUERY_STRING'], 1))
-                if 'acl' in args:
-                    # We very likely have an XML-based ACL request.
-                    body = env['wsgi.input'].readline().decode()
-                    translated_acl = swift_acl_translate(body, xml=True)
-                    if translated_acl == 'Unsupported':
-                        return get_err_response('Unsupported')
-                    elif translated_acl == 'InvalidArgument':
-                        return get_err_response('InvalidArgument')
-                    for header, acl in translated_acl:
-                        env[header] = acl
-                    env['REQUEST_METHOD'] = 'POST'
-
+        if self.negative_cache is not None:
+            self.negative_cache.invalidate(env, self._bucket_key())
         body_iter = self._app_call(env)
         status = self._get_status_int()
 
@@ -414,11 +778,37 @@ class BucketController(WSGIContext):
                 return get_err_response('InvalidURI')
 
         resp = Response()
-        if not versioning:
+        if not versioning and not logging:
             resp.headers['Location'] = self.container_name
         resp.status = HTTP_OK
         return resp
 
+    def _set_logging_headers(self, env):
+        """
+        Translates the BucketLoggingStatus of a PUT Bucket logging request
+        into container metadata, an empty status disables the logging.
+        """
+        try:
+            dom = parseString(env['wsgi.input'].read())
+            status = dom.getElementsByTagName('BucketLoggingStatus')[0]
+            enabled = status.getElementsByTagName('LoggingEnabled')
+            target = prefix = ''
+            if enabled:
+                target = enabled[0].getElementsByTagName(
+                    'TargetBucket')[0].firstChild.data.encode('utf-8')
+                prefix = enabled[0].getElementsByTagName('TargetPrefix')
+                prefix = prefix[0].firstChild.data.encode('utf-8') \
+                    if prefix and prefix[0].firstChild else ''
+        except Exception:
+            return get_err_response('MalformedXML')
+        if target:
+            self._app_call(self._sub_env(
+                env, 'HEAD', '/v1/%s/%s' % (self.account_name, target)))
+            if not is_success(self._get_status_int()):
+                return get_err_response('InvalidTargetBucketForLogging')
+        env['HTTP_X_CONTAINER_META_S3_LOGGING_TARGET_BUCKET'] = target
+        env['HTTP_X_CONTAINER_META_S3_LOGGING_TARGET_PREFIX'] = prefix
+
     def DELETE(self, env, start_response):
         """
         Handle DELETE Bucket request
@@ -468,6 +858,9 @@ class BucketController(WSGIContext):
                '<DeleteResult ' \
                'xmlns="http://doc.s3.amazonaws.com/2006-03-01">\r\n'
         xml = env['wsgi.input'].read()
+        # Only the buckets which had multipart uploads have objects made of
+        # parts, which saves looking at every deleted object otherwise.
+        check_segments = self._has_uploads(env)
         for key, version in _object_key_iter(xml):
             if version is not None:
                 # TODO: delete the specific version of the object
@@ -479,9 +872,15 @@ class BucketController(WSGIContext):
             tmp_env['REQUEST_METHOD'] = 'DELETE'
             controller = ObjectController(tmp_env, self.app, self.account_name,
                                           env['HTTP_X_AUTH_TOKEN'],
-                                          self.container_name, key)
-            body_iter = controller._app_call(tmp_env)
-            status = controller._get_status_int()
+                                          self.container_name, key,
+                                          scheduler=self.scheduler,
+                                          breaker=self.breaker,
+                                          usage_cache=self.usage_cache,
+                                          object_cache=self.object_cache,
+                                          negative_cache=self.negative_cache,
+                                          coalescer=self.coalescer,
+                                          prefetcher=self.prefetcher)
+            status = controller._delete_object(tmp_env, check_segments)
 
             if status == HTTP_NO_CONTENT or status == HTTP_NOT_FOUND:
                 body += _get_deleted_elem(key)
@@ -496,7 +895,7 @@ class BucketController(WSGIContext):
 
     def POST(self, env, start_response):
         """
-        Handle POST Bucket (Delete/Upload Multiple Objects) request
+        Handle POST Bucket (Delete Multiple Objects) request
         """
         if 'QUERY_STRING' in env:
             args = dict(urlparse.parse_qsl(env['QUERY_STRING'], 1))
@@ -506,45 +905,32 @@ class BucketController(WSGIContext):
         if 'delete' in args:
             return self._delete_multiple_objects(env)
 
-        if 'uploads' in args:
-            # Pass it through, the s3multi upload helper will handle it.
-            return self.app(env, start_response)
-
-        if 'uploadId' in args:
-            # Pass it through, the s3multi upload helper will handle it.
-            return self.app(env, start_response)
-
         return get_err_response('Unsupported')
 
 
-class ObjectController(WSGIContext):
+class ObjectController(Controller):
     """
     Handles requests on objects
     """
     def __init__(self, env, app, account_name, token, container_name,
                  object_name, **kwargs):
-        WSGIContext.__init__(self, app)
-        self.account_name = unquote(account_name)
+        Controller.__init__(self, app, account_name, **kwargs)
         self.container_name = unquote(container_name)
+        self.object_name = unquote(object_name)
         env['HTTP_X_AUTH_TOKEN'] = token
         env['PATH_INFO'] = '/v1/%s/%s/%s' % (account_name, container_name,
                                              object_name)
+        conf = kwargs.get('conf', {})
+        self.max_upload_size = int(conf.get('max_upload_size',
+                                            MAX_UPLOAD_SIZE))
 
     def GETorHEAD(self, env, start_response):
-        if env['REQUEST_METHOD'] == 'HEAD':
-            head = True
-            env['REQUEST_METHOD'] = 'GET'
-        else:
-            head = False
+        head = env['REQUEST_METHOD'] == 'HEAD'
         if 'QUERY_STRING' in env:
             args = dict(urlparse.parse_qsl(env['QUERY_STRING'], 1))
         else:
             args = {}
 
-        # Let s3multi handle it.
-        if 'uploadId' in args:
-            return self.app(env, start_response)
-
         env['QUERY_STRING'] = ''
         if 'acl' in args:
             env['QUERY_STRING'] += 'acl'
@@ -552,10 +938,47 @@ class ObjectController(WSGIContext):
         if 'versionId' in args:
             env['QUERY_STRING'] += 'versionId=%s' % args['versionId']
 
-        app_iter = self._app_call(env)
+        missing = None
+        if not args:
+            missing = self._known_missing(
+                env, self._bucket_key(), self._object_key(self.object_name))
+        if missing == self._bucket_key():
+            return get_err_response('NoSuchBucket')
+        elif missing:
+            return get_err_response('NoSuchKey')
+
+        part_range = parts_count = None
+        if 'partNumber' in args and 'acl' not in args:
+            try:
+                part_number = int(args['partNumber'])
+            except ValueError:
+                return get_err_response('InvalidArgument')
+            if part_number < 1 or part_number > MAX_PARTS or \
+                    'HTTP_RANGE' in env:
+                return get_err_response('InvalidArgument')
+            res = self._get_part_range(env, part_number)
+            if isinstance(res, Response):
+                return res
+            part_range, parts_count = res
+            if part_range:
+                env['HTTP_RANGE'] = 'bytes=%d-%d' % part_range
+
+        cache_key = cached = None
+        if self.object_cache is not None and not head and not args and \
+                'HTTP_RANGE' not in env and \
+                not [k for k in CONDITIONAL_HEADERS if k in env]:
+            cache_key = self._object_key(self.object_name)
+            cached = self.object_cache.get(cache_key)
+            if cached is not None:
+                # Let Swift check the request and whether the object changed.
+                env['HTTP_IF_NONE_MATCH'] = '"%s"' % cached[0]
 
         if head:
+            self._coalesced_app_call(env)
             app_iter = None
+        else:
+            # The slot is held while the body is sent to the client.
+            app_iter = self._app_call(env, hold_slot='acl' not in args)
 
         if 'acl' in args and not head:
             env['REQUEST_METHOD'] = 'GET'  # recover HTTP method
@@ -563,6 +986,20 @@ class ObjectController(WSGIContext):
         status = self._get_status_int()
         headers = dict(self._response_headers)
 
+        if cached is not None:
+            del env['HTTP_IF_NONE_MATCH']
+            if status == HTTP_NOT_MODIFIED:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+                return Response(status=HTTP_OK, headers=cached[1],
+                                body=cached[2])
+            self.object_cache.invalidate(cache_key)
+
+        if not is_success(status) and app_iter is not None and \
+                hasattr(app_iter, 'close'):
+            # No body is sent, the backend response is done with.
+            app_iter.close()
+
         if is_success(status):
             if 'QUERY_STRING' in env:
                 args = dict(urlparse.parse_qsl(env['QUERY_STRING'], 1))
@@ -581,14 +1018,103 @@ class ObjectController(WSGIContext):
                               'content-range', 'content-encoding',
                               'etag', 'last-modified'):
                     new_hdrs[key] = val
+            if parts_count is not None:
+                new_hdrs['x-amz-mp-parts-count'] = str(parts_count)
+            if head and part_range and status == HTTP_OK:
+                # Swift ignores the Range header of HEAD requests.
+                size = self._response_header_value('content-length')
+                for key in new_hdrs.keys():
+                    if key.lower() in ('content-length', 'content-range'):
+                        del new_hdrs[key]
+                first, last = part_range
+                new_hdrs['Content-Range'] = 'bytes %d-%d/%s' % (first, last,
+                                                                size)
+                new_hdrs['Content-Length'] = str(last - first + 1)
+                status = HTTP_PARTIAL_CONTENT
+            etag = self._response_header_value('etag')
+            length = self._response_header_value('content-length')
+            if cache_key and status == HTTP_OK and etag and length and \
+                    int(length) <= self.object_cache.max_object_size:
+                body = ''.join(app_iter)
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+                self.object_cache.put(cache_key, etag.strip('"'), new_hdrs,
+                                      body)
+                return Response(status=status, headers=new_hdrs, body=body)
+            if not head:
+                return PassThroughResponse(self._response_status,
+                                           new_hdrs.items(), app_iter)
             return Response(status=status, headers=new_hdrs, app_iter=app_iter)
+        elif status == HTTP_NOT_MODIFIED:
+            # If-None-Match or If-Modified-Since matched, no body to send.
+            resp = Response(status=status, headers=dict(
+                (key, val) for key, val in headers.iteritems()
+                if key.lower() in ('etag', 'last-modified')))
+            # Nor the default type of swob.
+            del resp.headers['Content-Type']
+            return resp
+        elif status == HTTP_PRECONDITION_FAILED:
+            return get_err_response('PreconditionFailed')
         elif status in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
             return get_err_response('AccessDenied')
         elif status == HTTP_NOT_FOUND:
+            if not args:
+                self._record_missing(env, self._object_key(self.object_name))
             return get_err_response('NoSuchKey')
         else:
             return get_err_response('InvalidURI')
 
+    def _get_part_range(self, env, part_number):
+        """
+        Resolves a part number against the manifest of a large object.
+
+        :returns: ((first byte, last byte), parts count) of the part, with
+                  (None, None) for the single part of a plain object, or an
+                  error response
+        """
+        path = env['PATH_INFO']
+        self._app_call(self._sub_env(env, 'HEAD', path, env['QUERY_STRING']))
+        status = self._get_status_int()
+        if not is_success(status):
+            if status in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
+                return get_err_response('AccessDenied')
+            elif status == HTTP_NOT_FOUND:
+                return get_err_response('NoSuchKey')
+            return get_err_response('InvalidURI')
+        headers = dict((k.lower(), v) for k, v in self._response_headers)
+
+        if config_true_value(headers.get('x-static-large-object')):
+            body_iter = self._app_call(self._sub_env(
+                env, 'GET', path, 'multipart-manifest=get'))
+            if self._get_status_int() != HTTP_OK:
+                return get_err_response('InvalidURI')
+            sizes = []
+            for segment in loads(''.join(list(body_iter))):
+                if segment.get('range'):
+                    first, last = segment['range'].split('-')
+                    sizes.append(int(last) - int(first) + 1)
+                else:
+                    sizes.append(int(segment['bytes']))
+        elif 'x-object-manifest' in headers:
+            container, prefix = \
+                unquote(headers['x-object-manifest']).split('/', 1)
+            body_iter = self._app_call(self._sub_env(
+                env, 'GET', '/v1/%s/%s' % (self.account_name, container),
+                'format=json&prefix=%s' % quote(prefix)))
+            if self._get_status_int() != HTTP_OK:
+                return get_err_response('InvalidURI')
+            sizes = [int(o['bytes']) for o in loads(''.join(list(body_iter)))]
+        else:
+            # A plain object has a single part, the whole object.
+            if part_number != 1:
+                return get_err_response('InvalidPartNumber')
+            return None, None
+
+        if part_number > len(sizes):
+            return get_err_response('InvalidPartNumber')
+        first = sum(sizes[:part_number - 1])
+        return (first, first + sizes[part_number - 1] - 1), len(sizes)
+
     def HEAD(self, env, start_response):
         """
         Handle HEAD Object request
@@ -610,11 +1136,37 @@ class ObjectController(WSGIContext):
         else:
             args = {}
 
+        res = validate_content_length(env)
+        if res:
+            return res
+
+        translated_acl = None
+        if 'HTTP_X_AMZ_ACL' in env:
+            translated_acl = object_acl_translate(env.pop('HTTP_X_AMZ_ACL'))
+            if translated_acl == 'Unsupported':
+                return get_err_response('Unsupported')
+            elif translated_acl == 'InvalidArgument':
+                return get_err_response('InvalidArgument')
+            for header, value in translated_acl:
+                env[header] = value
+
         acl = 'acl' in args
+        content_length = None
+        if not acl and 'CONTENT_LENGTH' in env and \
+                'HTTP_X_AMZ_COPY_SOURCE' not in env:
+            content_length = int(env['CONTENT_LENGTH'])
+            if content_length > self.max_upload_size:
+                return get_err_response('EntityTooLarge')
+            if self.usage_cache is not None:
+                res = self._check_quota(env, content_length)
+                if res:
+                    return res
+
         if acl:
-            res = acp_to_headers(env, 'object')
-            if res:
-                return res
+            if translated_acl is None:
+                res = acp_to_headers(env, 'object')
+                if res:
+                    return res
             env['QUERY_STRING'] = 'acl'
             env['REQUEST_METHOD'] = 'POST'
         else:
@@ -631,9 +1183,18 @@ class ObjectController(WSGIContext):
                         return get_err_response('InvalidDigest')
                     if env['HTTP_ETAG'] == '':
                         return get_err_response('SignatureDoesNotMatch')
+                    if len(env['HTTP_ETAG']) != 32:
+                        # Not an MD5 digest, the upload could only fail.
+                        return get_err_response('InvalidDigest')
                 elif key == 'HTTP_X_AMZ_COPY_SOURCE':
                     env['HTTP_X_COPY_FROM'] = value
 
+        # The parts of a multipart object which is overwritten go with it.
+        segments = []
+        if not acl and self._has_uploads(env):
+            segments = self._upload_segments(env, env['PATH_INFO'])
+
+        self._invalidate_object(env, self.object_name)
         body_iter = self._app_call(env)
         status = self._get_status_int()
 
@@ -648,16 +1209,21 @@ class ObjectController(WSGIContext):
                 return get_err_response('InvalidDigest')
             else:
                 return get_err_response('InvalidURI')
+        etag = self._response_header_value('etag')
+        self._delete_segments(env, segments)
 
         if not acl and 'HTTP_X_COPY_FROM' in env:
             body = '<CopyObjectResult>' \
                    '<ETag>"%s"</ETag>' \
-                   '</CopyObjectResult>' % self._response_header_value('etag')
+                   '</CopyObjectResult>' % etag
             return Response(status=HTTP_OK, body=body)
 
+        if content_length and self.usage_cache is not None:
+            self.usage_cache.add_bytes(env, self.account_name, content_length)
+
         kwargs = {'status': HTTP_OK}
         if not acl:
-            kwargs['etag'] = self._response_header_value('etag')
+            kwargs['etag'] = etag
 
         return Response(**kwargs)
 
@@ -668,8 +1234,7 @@ class ObjectController(WSGIContext):
         """
         Handle DELETE Object request
         """
-        body_iter = self._app_call(env)
-        status = self._get_status_int()
+        status = self._delete_object(env)
 
         if status != HTTP_NO_CONTENT:
             if status in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
@@ -683,6 +1248,570 @@ class ObjectController(WSGIContext):
         resp.status = HTTP_NO_CONTENT
         return resp
 
+    def _delete_object(self, env, check_segments=None):
+        """
+        Deletes the object and, when it is the manifest of a completed
+        multipart upload, the parts it was assembled from.  check_segments
+        tells whether the bucket has multipart uploads when it is known.
+
+        :returns: status of the DELETE of the object
+        """
+        if check_segments is None:
+            check_segments = self._has_uploads(env)
+        segments = []
+        if check_segments:
+            segments = self._upload_segments(env, env['PATH_INFO'])
+        self._invalidate_object(env, self.object_name)
+        self._app_call(env)
+        status = self._get_status_int()
+        if status == HTTP_NO_CONTENT:
+            self._delete_segments(env, segments)
+        return status
+
+
+class MultipartController(Controller):
+    """
+    Handles multipart upload requests.
+
+    The parts are stored as segments in the ``<bucket>+segments`` container
+    and a completed upload becomes a static large object manifest, so no
+    data is copied on completion.  The segments container holds:
+
+        * ``u/<key>\\x01<upload id>``: one empty object per upload in
+          progress, carrying the Content-Type and metadata of the upload.
+          The separator sorts before any printable character so a listing
+          of ``u/`` returns the uploads in key order.
+        * ``p/<upload id>/<part number>``: the parts, the part number being
+          zero padded so that they are listed in order.
+    """
+    def __init__(self, env, app, account_name, token, container_name,
+                 object_name=None, **kwargs):
+        Controller.__init__(self, app, account_name, **kwargs)
+        self.container_name = unquote(container_name)
+        self.object_name = unquote(object_name) if object_name else None
+        env['HTTP_X_AUTH_TOKEN'] = token
+        if object_name:
+            env['PATH_INFO'] = '/v1/%s/%s/%s' % (account_name, container_name,
+                                                 object_name)
+        else:
+            env['PATH_INFO'] = '/v1/%s/%s' % (account_name, container_name)
+        conf = kwargs.get('conf', {})
+        self.max_upload_size = int(conf.get('max_upload_size',
+                                            MAX_UPLOAD_SIZE))
+        self.min_part_size = int(conf.get('min_part_size', MIN_PART_SIZE))
+
+    def _bucket_path(self):
+        return '/v1/%s/%s' % (self.account_name, self.container_name)
+
+    def _segments_path(self, name=''):
+        path = '/v1/%s/%s%s' % (self.account_name, self.container_name,
+                                MULTIUPLOAD_SUFFIX)
+        if name:
+            path += '/' + name
+        return path
+
+    def _upload_record(self, key, upload_id):
+        return '%s%s%s%s' % (UPLOAD_PREFIX, key, UPLOAD_ID_SEP, upload_id)
+
+    def _upload_name(self, upload_id):
+        return self._upload_record(self.object_name, upload_id)
+
+    def _part_name(self, upload_id, part_number):
+        return '%s%s/%05d' % (PART_PREFIX, upload_id, part_number)
+
+    def _get_upload(self, env, upload_id):
+        """
+        Returns the headers of the upload record, or None if the upload does
+        not exist.
+        """
+        if not upload_id or '/' in upload_id:
+            return None
+        self._app_call(self._sub_env(
+            env, 'HEAD', self._segments_path(self._upload_name(upload_id))))
+        if not is_success(self._get_status_int()):
+            return None
+        return dict(self._response_headers)
+
+    def _list_parts(self, env, upload_id, marker=0, limit=MAX_PARTS):
+        """
+        Returns the listing of the parts of an upload, or None on error.
+        """
+        prefix = '%s%s/' % (PART_PREFIX, upload_id)
+        query = 'format=json&prefix=%s&limit=%d' % (quote(prefix), limit)
+        if marker:
+            query += '&marker=%s' % quote(self._part_name(upload_id, marker))
+        body_iter = self._app_call(self._sub_env(env, 'GET',
+                                                 self._segments_path(), query))
+        if self._get_status_int() != HTTP_OK:
+            return None
+        parts = loads(''.join(list(body_iter)))
+        for part in parts:
+            part['name'] = part['name'].encode('utf-8')
+            part['part_number'] = int(part['name'][len(prefix):])
+        return parts
+
+    def _error_response(self, status, not_found='NoSuchUpload'):
+        if status in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
+            return get_err_response('AccessDenied')
+        elif status == HTTP_NOT_FOUND:
+            return get_err_response(not_found)
+        return get_err_response('InvalidURI')
+
+    def _initiate(self, env):
+        """
+        Handle Initiate Multipart Upload request
+        """
+        self._app_call(self._sub_env(env, 'HEAD', self._bucket_path()))
+        status = self._get_status_int()
+        if not is_success(status):
+            return self._error_response(status, 'NoSuchBucket')
+
+        self._app_call(self._sub_env(env, 'PUT', self._segments_path()))
+        status = self._get_status_int()
+        if status not in (HTTP_CREATED, HTTP_ACCEPTED, HTTP_NO_CONTENT):
+            return self._error_response(status, 'NoSuchBucket')
+
+        upload_id = uuid.uuid4().hex
+        sub_env = self._sub_env(
+            env, 'PUT', self._segments_path(self._upload_name(upload_id)))
+        for key, value in env.iteritems():
+            if key.startswith('HTTP_X_AMZ_META_'):
+                sub_env['HTTP_X_OBJECT_META_' + key[16:]] = value
+        if env.get('CONTENT_TYPE'):
+            sub_env['CONTENT_TYPE'] = env['CONTENT_TYPE']
+        self._app_call(sub_env)
+        status = self._get_status_int()
+        if status != HTTP_CREATED:
+            return self._error_response(status, 'NoSuchBucket')
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<InitiateMultipartUploadResult '
+                'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                '<Bucket>%s</Bucket>'
+                '<Key>%s</Key>'
+                '<UploadId>%s</UploadId>'
+                '</InitiateMultipartUploadResult>' %
+                (xml_escape(self.container_name),
+                 xml_escape(self.object_name), upload_id))
+        return Response(status=HTTP_OK, body=body,
+                        content_type='application/xml')
+
+    def _complete(self, env, upload_id):
+        """
+        Handle Complete Multipart Upload request
+        """
+        upload = self._get_upload(env, upload_id)
+        if upload is None:
+            return get_err_response('NoSuchUpload')
+
+        try:
+            dom = parseString(env['wsgi.input'].read())
+            requested = []
+            for part in dom.getElementsByTagName('Part'):
+                number = int(part.getElementsByTagName('PartNumber')[0]
+                             .firstChild.data)
+                etag = part.getElementsByTagName('ETag')[0].firstChild.data
+                requested.append((number, etag.strip().strip('"')))
+        except Exception:
+            return get_err_response('MalformedXML')
+        if not requested:
+            return get_err_response('MalformedXML')
+
+        parts = self._list_parts(env, upload_id)
+        if parts is None:
+            return get_err_response('NoSuchUpload')
+        parts = dict((part['part_number'], part) for part in parts)
+
+        manifest = []
+        last_number = 0
+        for number, etag in requested:
+            if number <= last_number:
+                return get_err_response('InvalidPartOrder')
+            last_number = number
+            part = parts.pop(number, None)
+            if part is None or part['hash'] != etag:
+                return get_err_response('InvalidPart')
+            manifest.append({'path': '/%s%s/%s' % (self.container_name,
+                                                   MULTIUPLOAD_SUFFIX,
+                                                   part['name']),
+                             'etag': part['hash'],
+                             'size_bytes': part['bytes']})
+        for segment in manifest[:-1]:
+            if segment['size_bytes'] < self.min_part_size:
+                return get_err_response('EntityTooSmall')
+
+        # The ETag Swift serves for a static large object.  Listings show
+        # the hash of the manifest unless it is overridden.
+        etag = md5(''.join(segment['etag']
+                           for segment in manifest)).hexdigest()
+        body = dumps(manifest)
+        sub_env = self._sub_env(env, 'PUT', env['PATH_INFO'],
+                                'multipart-manifest=put')
+        sub_env['CONTENT_LENGTH'] = str(len(body))
+        sub_env['wsgi.input'] = StringIO(body)
+        sub_env['HTTP_X_OBJECT_SYSMETA_CONTAINER_UPDATE_OVERRIDE_ETAG'] = etag
+        for key, value in upload.iteritems():
+            _key = key.lower()
+            if _key == 'content-type':
+                sub_env['CONTENT_TYPE'] = value
+            elif _key.startswith('x-object-meta-'):
+                sub_env['HTTP_' + key.upper().replace('-', '_')] = value
+        # The parts of the object which is overwritten, but not ours.
+        own = '/%s%s/%s%s/' % (self.container_name, MULTIUPLOAD_SUFFIX,
+                               PART_PREFIX, upload_id)
+        segments = [name for name in
+                    self._upload_segments(env, env['PATH_INFO'])
+                    if not name.startswith(own)]
+        self._invalidate_object(env, self.object_name)
+        self._app_call(sub_env)
+        status = self._get_status_int()
+        if status != HTTP_CREATED:
+            if status == HTTP_BAD_REQUEST:
+                return get_err_response('InvalidPart')
+            return self._error_response(status, 'NoSuchBucket')
+        self._delete_segments(env, segments)
+
+        self._app_call(self._sub_env(
+            env, 'DELETE', self._segments_path(self._upload_name(upload_id))))
+        # Parts which were uploaded but not used are not kept.
+        for part in parts.itervalues():
+            self._app_call(self._sub_env(
+                env, 'DELETE', self._segments_path(part['name'])))
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<CompleteMultipartUploadResult '
+                'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                '<Location>/%s/%s</Location>'
+                '<Bucket>%s</Bucket>'
+                '<Key>%s</Key>'
+                '<ETag>"%s"</ETag>'
+                '</CompleteMultipartUploadResult>' %
+                (xml_escape(quote(self.container_name)),
+                 xml_escape(quote(self.object_name)),
+                 xml_escape(self.container_name),
+                 xml_escape(self.object_name), etag))
+        return Response(status=HTTP_OK, body=body,
+                        content_type='application/xml')
+
+    def _list_uploads(self, env, args):
+        """
+        Handle List Multipart Uploads request
+        """
+        try:
+            max_uploads = int(args.get('max-uploads', MAX_BUCKET_LISTING))
+        except ValueError:
+            return get_err_response('InvalidArgument')
+        if max_uploads < 0:
+            return get_err_response('InvalidArgument')
+        max_uploads = min(max_uploads, MAX_BUCKET_LISTING)
+        prefix = args.get('prefix', '')
+        delimiter = args.get('delimiter', '')
+        key_marker = args.get('key-marker', '')
+        upload_id_marker = args.get('upload-id-marker', '')
+
+        # One listing of the upload records answers the request, the client
+        # markers map directly to the backend marker.
+        query = 'format=json&limit=%d&prefix=%s' % (
+            max_uploads + 1, quote(UPLOAD_PREFIX + prefix))
+        if delimiter:
+            query += '&delimiter=%s' % quote(delimiter)
+        if key_marker:
+            if upload_id_marker:
+                marker = self._upload_record(key_marker, upload_id_marker)
+            else:
+                # Skip every upload of key_marker.
+                marker = UPLOAD_PREFIX + key_marker + UPLOAD_ID_SEP_NEXT
+            query += '&marker=%s' % quote(marker)
+
+        body_iter = self._app_call(self._sub_env(env, 'GET',
+                                                 self._segments_path(), query))
+        status = self._get_status_int()
+        if status == HTTP_NOT_FOUND:
+            # No upload was ever initiated in this bucket.
+            self._app_call(self._sub_env(env, 'HEAD', self._bucket_path()))
+            status = self._get_status_int()
+            if not is_success(status):
+                return self._error_response(status, 'NoSuchBucket')
+            listing = []
+        elif status != HTTP_OK:
+            return self._error_response(status, 'NoSuchBucket')
+        else:
+            listing = loads(''.join(list(body_iter)))
+
+        truncated = len(listing) > max_uploads
+        listing = listing[:max_uploads]
+        uploads = []
+        prefixes = []
+        next_key_marker = next_upload_id_marker = ''
+        for i in listing:
+            if 'subdir' in i:
+                name = i['subdir'].encode('utf-8')[len(UPLOAD_PREFIX):]
+                prefixes.append('<CommonPrefixes>'
+                                '<Prefix>%s</Prefix>'
+                                '</CommonPrefixes>' % xml_escape(name))
+                next_key_marker, next_upload_id_marker = name, ''
+                continue
+            key, upload_id = i['name'].encode('utf-8')[
+                len(UPLOAD_PREFIX):].rsplit(UPLOAD_ID_SEP, 1)
+            owner = xml_escape(i.get('owner', self.account_name))
+            uploads.append(
+                '<Upload>'
+                '<Key>%s</Key>'
+                '<UploadId>%s</UploadId>'
+                '<Initiator>'
+                '<ID>%s</ID>'
+                '<DisplayName>%s</DisplayName>'
+                '</Initiator>'
+                '<Owner>'
+                '<ID>%s</ID>'
+                '<DisplayName>%s</DisplayName>'
+                '</Owner>'
+                '<StorageClass>STANDARD</StorageClass>'
+                '<Initiated>%sZ</Initiated>'
+                '</Upload>' %
+                (xml_escape(key), xml_escape(upload_id), owner, owner, owner,
+                 owner, i['last_modified']))
+            next_key_marker, next_upload_id_marker = key, upload_id
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<ListMultipartUploadsResult '
+                'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                '<Bucket>%s</Bucket>'
+                '<KeyMarker>%s</KeyMarker>'
+                '<UploadIdMarker>%s</UploadIdMarker>'
+                '<NextKeyMarker>%s</NextKeyMarker>'
+                '<NextUploadIdMarker>%s</NextUploadIdMarker>'
+                '<Delimiter>%s</Delimiter>'
+                '<Prefix>%s</Prefix>'
+                '<MaxUploads>%d</MaxUploads>'
+                '<IsTruncated>%s</IsTruncated>'
+                '%s'
+                '%s'
+                '</ListMultipartUploadsResult>' % (
+                xml_escape(self.container_name),
+                xml_escape(key_marker),
+                xml_escape(upload_id_marker),
+                xml_escape(next_key_marker),
+                xml_escape(next_upload_id_marker),
+                xml_escape(delimiter),
+                xml_escape(prefix),
+                max_uploads,
+                'true' if truncated else 'false',
+                ''.join(uploads),
+                ''.join(prefixes)))
+        return Response(body=body, content_type='application/xml')
+
+    def _list_parts_result(self, env, args):
+        """
+        Handle List Parts request
+        """
+        try:
+            max_parts = int(args.get('max-parts', MAX_BUCKET_LISTING))
+            part_number_marker = int(args.get('part-number-marker', 0))
+        except ValueError:
+            return get_err_response('InvalidArgument')
+        if max_parts < 0 or part_number_marker < 0:
+            return get_err_response('InvalidArgument')
+        max_parts = min(max_parts, MAX_BUCKET_LISTING)
+
+        upload_id = args['uploadId']
+        if self._get_upload(env, upload_id) is None:
+            return get_err_response('NoSuchUpload')
+        parts = self._list_parts(env, upload_id, part_number_marker,
+                                 max_parts + 1)
+        if parts is None:
+            return get_err_response('NoSuchUpload')
+
+        truncated = len(parts) > max_parts
+        parts = parts[:max_parts]
+        owner = xml_escape(self.account_name)
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<ListPartsResult '
+                'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                '<Bucket>%s</Bucket>'
+                '<Key>%s</Key>'
+                '<UploadId>%s</UploadId>'
+                '<Initiator>'
+                '<ID>%s</ID>'
+                '<DisplayName>%s</DisplayName>'
+                '</Initiator>'
+                '<Owner>'
+                '<ID>%s</ID>'
+                '<DisplayName>%s</DisplayName>'
+                '</Owner>'
+                '<StorageClass>STANDARD</StorageClass>'
+                '<PartNumberMarker>%d</PartNumberMarker>'
+                '<NextPartNumberMarker>%d</NextPartNumberMarker>'
+                '<MaxParts>%d</MaxParts>'
+                '<IsTruncated>%s</IsTruncated>'
+                '%s'
+                '</ListPartsResult>' % (
+                xml_escape(self.container_name),
+                xml_escape(self.object_name),
+                xml_escape(upload_id),
+                owner, owner, owner, owner,
+                part_number_marker,
+                parts[-1]['part_number'] if parts else 0,
+                max_parts,
+                'true' if truncated else 'false',
+                ''.join('<Part>'
+                        '<PartNumber>%d</PartNumber>'
+                        '<LastModified>%sZ</LastModified>'
+                        '<ETag>&quot;%s&quot;</ETag>'
+                        '<Size>%d</Size>'
+                        '</Part>' %
+                        (part['part_number'], part['last_modified'],
+                         part['hash'], part['bytes']) for part in parts)))
+        return Response(body=body, content_type='application/xml')
+
+    def GET(self, env, start_response):
+        """
+        Handle List Multipart Uploads and List Parts requests
+        """
+        args = dict(urlparse.parse_qsl(env.get('QUERY_STRING', ''), 1))
+        if self.object_name is None:
+            return self._list_uploads(env, args)
+        if 'uploadId' in args:
+            return self._list_parts_result(env, args)
+        return get_err_response('InvalidURI')
+
+    def POST(self, env, start_response):
+        """
+        Handle Initiate and Complete Multipart Upload requests
+        """
+        args = dict(urlparse.parse_qsl(env.get('QUERY_STRING', ''), 1))
+        if 'uploads' in args:
+            return self._initiate(env)
+        if 'uploadId' in args:
+            return self._complete(env, args['uploadId'])
+        return get_err_response('InvalidURI')
+
+    def PUT(self, env, start_response):
+        """
+        Handle Upload Part and Upload Part Copy requests
+        """
+        args = dict(urlparse.parse_qsl(env.get('QUERY_STRING', ''), 1))
+        try:
+            part_number = int(args['partNumber'])
+        except (KeyError, ValueError):
+            return get_err_response('InvalidArgument')
+        if part_number < 1 or part_number > MAX_PARTS:
+            return get_err_response('InvalidArgument')
+
+        res = validate_content_length(env)
+        if res:
+            return res
+        content_length = int(env.get('CONTENT_LENGTH') or 0)
+        if content_length > self.max_upload_size:
+            return get_err_response('EntityTooLarge')
+        if self.usage_cache is not None and \
+                'HTTP_X_AMZ_COPY_SOURCE' not in env:
+            res = self._check_quota(env, content_length)
+            if res:
+                return res
+        if 'HTTP_CONTENT_MD5' in env:
+            try:
+                etag = env['HTTP_CONTENT_MD5'].decode('base64').encode('hex')
+            except Exception:
+                return get_err_response('InvalidDigest')
+            if len(etag) != 32:
+                return get_err_response('InvalidDigest')
+            env['HTTP_ETAG'] = etag
+
+        upload_id = args.get('uploadId')
+        if self._get_upload(env, upload_id) is None:
+            return get_err_response('NoSuchUpload')
+
+        copy_source = env.get('HTTP_X_AMZ_COPY_SOURCE')
+        if copy_source:
+            res = self._prepare_copy(env, copy_source)
+            if res:
+                return res
+
+        env['PATH_INFO'] = self._segments_path(
+            self._part_name(upload_id, part_number))
+        env['QUERY_STRING'] = ''
+        self._app_call(env)
+        status = self._get_status_int()
+        if status != HTTP_CREATED:
+            if status == HTTP_UNPROCESSABLE_ENTITY:
+                return get_err_response('InvalidDigest')
+            if copy_source and status == HTTP_NOT_FOUND:
+                return get_err_response('NoSuchKey')
+            return self._error_response(status)
+
+        if copy_source:
+            body = ('<CopyPartResult>'
+                    '<LastModified>%s</LastModified>'
+                    '<ETag>"%s"</ETag>'
+                    '</CopyPartResult>' %
+                    (datetime.datetime.utcnow().strftime(
+                        '%Y-%m-%dT%H:%M:%S.000Z'),
+                     self._response_header_value('etag')))
+            return Response(status=HTTP_OK, body=body,
+                            content_type='application/xml')
+
+        return Response(status=HTTP_OK,
+                        etag=self._response_header_value('etag'))
+
+    def _prepare_copy(self, env, copy_source):
+        """
+        Turns an Upload Part Copy request into a Swift server side copy of
+        the source object, or of the x-amz-copy-source-range bytes of it.
+        Returns an error response if the copy cannot be made.
+        """
+        source = unquote(copy_source.split('?', 1)[0]).lstrip('/')
+        if '/' not in source:
+            return get_err_response('InvalidArgument')
+        self._app_call(self._sub_env(env, 'HEAD', '/v1/%s/%s' %
+                                     (self.account_name, source)))
+        status = self._get_status_int()
+        if not is_success(status):
+            return self._error_response(status, 'NoSuchKey')
+        size = int(self._response_header_value('content-length') or 0)
+
+        copy_range = env.get('HTTP_X_AMZ_COPY_SOURCE_RANGE')
+        if copy_range:
+            try:
+                unit, value = copy_range.split('=', 1)
+                first, last = [int(x) for x in value.split('-', 1)]
+            except ValueError:
+                return get_err_response('InvalidArgument')
+            if unit != 'bytes' or first > last or last >= size:
+                return get_err_response('InvalidArgument')
+            size = last - first + 1
+            # The copy middleware only reads this range of the source.
+            env['HTTP_RANGE'] = 'bytes=%d-%d' % (first, last)
+        if size > self.max_upload_size:
+            return get_err_response('EntityTooLarge')
+
+        env['HTTP_X_COPY_FROM'] = '/' + quote(source)
+        env['CONTENT_LENGTH'] = '0'
+        env.pop('HTTP_ETAG', None)
+
+    def DELETE(self, env, start_response):
+        """
+        Handle Abort Multipart Upload request
+        """
+        args = dict(urlparse.parse_qsl(env.get('QUERY_STRING', ''), 1))
+        upload_id = args.get('uploadId')
+        if not upload_id or '/' in upload_id:
+            return get_err_response('NoSuchUpload')
+
+        self._app_call(self._sub_env(
+            env, 'DELETE', self._segments_path(self._upload_name(upload_id))))
+        status = self._get_status_int()
+        if status != HTTP_NO_CONTENT:
+            return self._error_response(status)
+
+        for part in self._list_parts(env, upload_id) or []:
+            self._app_call(self._sub_env(
+                env, 'DELETE', self._segments_path(part['name'])))
+
+        resp = Response()
+        resp.status = HTTP_NO_CONTENT
+        return resp
+
 
 class Swift3Middleware(object):
     """Swift3 S3 compatibility midleware"""
@@ -690,7 +1819,101 @@ class Swift3Middleware(object):
         self.app = app
         self.conf = conf
         self.logger = get_logger(self.conf, log_route='swift3')
+        if conf.get('log_statsd_host'):
+            self.metrics = self.logger
+        else:
+            self.metrics = StatsAggregator()
+        self.metrics_path = conf.get('metrics_path', '')
+        self.histograms = MetricsRegistry() if self.metrics_path else None
+        self.slow_request_threshold = float(
+            conf.get('slow_request_threshold', 0))
+        if conf.get('profile_dir'):
+            self.profiler = RequestProfiler(conf)
+        else:
+            self.profiler = None
+        self.trans_id_suffix = conf.get('trans_id_suffix', '')
+        self.span_sink = get_span_sink(conf)
+        if config_true_value(conf.get('access_log', 'false')):
+            self.access_logger = AccessLogger(app, conf, self.logger)
+        else:
+            self.access_logger = None
         self.location = conf.get('location', 'US').upper()
+        self.verify_signature = config_true_value(
+            conf.get('verify_signature', 'false'))
+        if self.verify_signature:
+            self.credential_store = get_credential_store(conf)
+            self.credential_cache = MemoryCredentialStore(
+                int(conf.get('credential_cache_ttl', 300)))
+        self.ratelimiter = RateLimiter(conf)
+        max_inflight = int(conf.get('scheduler_max_inflight', 0))
+        if max_inflight > 0:
+            self.scheduler = FairScheduler(
+                max_inflight,
+                float(conf.get('scheduler_queue_timeout', 10)),
+                parse_weights(conf.get('scheduler_weights', '')),
+                self.logger)
+        else:
+            self.scheduler = None
+        threshold = int(conf.get('breaker_threshold', 0))
+        if threshold > 0:
+            self.breaker = CircuitBreaker(
+                threshold, float(conf.get('breaker_window', 10)),
+                float(conf.get('breaker_open_time', 30)), self.logger)
+        else:
+            self.breaker = None
+        if config_true_value(conf.get('check_account_quota', 'false')):
+            self.usage_cache = AccountUsageCache(
+                int(conf.get('account_usage_ttl', 60)))
+        else:
+            self.usage_cache = None
+        object_cache_size = int(conf.get('object_cache_size', 0))
+        if object_cache_size > 0:
+            self.object_cache = ObjectCache(
+                object_cache_size,
+                int(conf.get('object_cache_max_object_size', 65536)))
+        else:
+            self.object_cache = None
+        negative_cache_ttl = float(conf.get('negative_cache_ttl', 0))
+        if negative_cache_ttl > 0:
+            self.negative_cache = NegativeCache(
+                negative_cache_ttl, config_true_value(
+                    conf.get('negative_cache_shared', 'false')))
+        else:
+            self.negative_cache = None
+        if config_true_value(conf.get('coalesce_reads', 'false')):
+            self.coalescer = Coalescer(self.logger)
+        else:
+            self.coalescer = None
+        if config_true_value(conf.get('listing_prefetch', 'false')):
+            self.prefetcher = ListingPrefetcher(
+                float(conf.get('listing_prefetch_ttl', 5)),
+                int(conf.get('listing_prefetch_max_pages', 100)),
+                self.logger)
+        else:
+            self.prefetcher = None
+
+    def check_signature(self, env, access_key, string_to_sign, signature):
+        """
+        Checks a signature against the secret key of an access key, caching
+        the secrets found in the credential store.  A cached secret which
+        does not match is dropped and the store is asked again, so that a
+        rotated key is picked up before the cache entry expires.
+
+        :returns: True if the signature matches, False if it does not and
+                  None if the access key is unknown
+        """
+        secret = self.credential_cache.get_secret(env, access_key)
+        if secret is not None:
+            if streq_const_time(get_signature(secret, string_to_sign),
+                                signature):
+                return True
+            self.credential_cache.invalidate(access_key)
+        secret = self.credential_store.get_secret(env, access_key)
+        if secret is None:
+            return None
+        self.credential_cache.set_secret(access_key, secret)
+        return streq_const_time(get_signature(secret, string_to_sign),
+                                signature)
 
     def get_controller(self, env, path):
         container, obj = split_path(path, 0, 2, True)
@@ -702,26 +1925,81 @@ class Swift3Middleware(object):
             args = {}
 
         if container and obj:
-            if env['REQUEST_METHOD'] == 'POST':
-                if 'uploads' or 'uploadId' in args:
-                    return BucketController, d
+            if 'uploads' in args or 'uploadId' in args:
+                return MultipartController, d
             return ObjectController, d
         elif container:
+            if 'uploads' in args:
+                return MultipartController, d
             return BucketController, d
 
         return ServiceController, d
 
     def __call__(self, env, start_response):
+        # Signed requests of the path are S3 requests of an object.
+        if self.metrics_path and env['PATH_INFO'] == self.metrics_path and \
+                'HTTP_AUTHORIZATION' not in env and \
+                'AWSAccessKeyId' not in Request(env).params:
+            gauges = []
+            if self.scheduler is not None:
+                gauges = self.scheduler.gauges()
+            return Response(body=self.histograms.render(gauges),
+                            content_type='text/plain; version=0.0.4')(
+                                env, start_response)
+
+        stats = env['swift3.stats'] = RequestStats()
+        if self.span_sink is not None:
+            stats.spans = []
+        request_id, host_id = get_request_ids(env, self.trans_id_suffix)
+        if self.access_logger is not None:
+            request_line = get_request_line(env)
+        app_start_response = start_response
+
+        def start_response(status, headers, *args):
+            stats.status = int(status.split(' ', 1)[0])
+            for key, value in headers:
+                if key.lower() == 'content-length':
+                    stats.response_bytes = int(value)
+            if 'HTTP_AUTHORIZATION' in env:
+                # An S3 request, not one passed through to Swift.
+                headers = list(headers) + [('x-amz-request-id', request_id),
+                                           ('x-amz-id-2', host_id)]
+            return app_start_response(status, headers, *args)
+
+        profile = None
+        if self.profiler is not None and self.profiler.should_profile(env):
+            profile = self.profiler.start()
         try:
-            return self.handle_request(env, start_response)
+            resp = self.handle_request(env, start_response)
         except Exception, e:
             self.logger.exception(e)
-        return get_err_response('ServiceUnavailable')(env, start_response)
+            resp = get_err_response('ServiceUnavailable')(env,
+                                                          start_response)
+        if profile is not None:
+            self.profiler.stop(profile, stats)
+        if stats.operation:
+            stats.emit(self.metrics)
+            if self.slow_request_threshold and \
+                    time.time() - stats.start >= self.slow_request_threshold:
+                self.logger.warning('Slow request: %s', stats.describe())
+            if self.histograms is not None:
+                self.histograms.observe(
+                    stats.operation, stats.status, time.time() - stats.start,
+                    stats.response_bytes, stats.backend_calls)
+            if self.access_logger is not None:
+                self.access_logger.log(env, stats, request_line)
+            if self.span_sink is not None:
+                try:
+                    self.span_sink.export(request_id, stats)
+                except Exception:
+                    self.logger.exception('Failed to export spans')
+        return resp
 
     def handle_request(self, env, start_response):
         req = Request(env)
         self.logger.debug('Calling Swift3 Middleware')
-        self.logger.debug(req.__dict__)
+        # Only formatted when debug logging is enabled.
+        self.logger.debug('%s', req.__dict__)
 
         if 'AWSAccessKeyId' in req.params:
             try:
@@ -751,9 +2029,20 @@ class Swift3Middleware(object):
             controller, path_parts = self.get_controller(env, env['PATH_INFO'])
         except ValueError:
             return get_err_response('InvalidURI')(env, start_response)
-
-        if 'Date' in req.headers:
-            date = email.utils.parsedate(req.headers['Date'])
+        stats = env['swift3.stats']
+        stats.operation = get_operation_name(
+            req.method, path_parts['container_name'],
+            path_parts['object_name'], req.params, req.headers)
+        stats.bucket = path_parts['container_name']
+        stats.key = path_parts['object_name']
+
+        if 'X-Amz-Date' in req.headers and 'AWSAccessKeyId' not in req.params:
+            # Signed instead of Date, which may then be anything.
+            date_header = req.headers['X-Amz-Date']
+        else:
+            date_header = req.headers.get('Date')
+        if date_header is not None:
+            date = email.utils.parsedate(date_header)
             if date is None and 'Expires' in req.params:
                 d = email.utils.formatdate(float(req.params['Expires']))
                 date = email.utils.parsedate(d)
@@ -772,14 +2061,56 @@ class Swift3Middleware(object):
             if d1 - d2 > delta or d2 - d1 > delta:
                 return get_err_response('RequestTimeTooSkewed')(env,
                                                                 start_response)
-
-        token = base64.urlsafe_b64encode(canonical_string(req))
+        elif self.verify_signature:
+            return get_err_response('AccessDenied')(env, start_response)
+        stats.mark('parse')
+
+        string_to_sign = canonical_string(req)
+        stats.mark('canonical')
+
+        if self.verify_signature:
+            valid = self.check_signature(env, account, string_to_sign,
+                                         signature)
+            if valid is None:
+                # Unknown to us, let the auth middleware decide.
+                self.logger.debug('No local credential for %s', account)
+            elif valid:
+                env['swift3.verified_access_key'] = account
+            else:
+                return get_err_response('SignatureDoesNotMatch')(
+                    env, start_response)
+
+        if self.ratelimiter and (not self.verify_signature or
+                                 'swift3.verified_access_key' in env):
+            op_class = get_operation_class(
+                req.method, path_parts['container_name'],
+                path_parts['object_name'], req.params)
+            retry_after = self.ratelimiter.get_retry_after(env, account,
+                                                           op_class)
+            if retry_after:
+                resp = get_err_response('SlowDown')
+                resp.headers['Retry-After'] = str(retry_after)
+                return resp(env, start_response)
+
+        stats.mark('auth')
+        token = base64.urlsafe_b64encode(string_to_sign)
 
         controller = controller(env, self.app, account, token, conf=self.conf,
-                                **path_parts)
+                                scheduler=self.scheduler, breaker=self.breaker,
+                                usage_cache=self.usage_cache,
+                                object_cache=self.object_cache,
+                                negative_cache=self.negative_cache,
+                                coalescer=self.coalescer,
+                                prefetcher=self.prefetcher, **path_parts)
 
         if hasattr(controller, req.method):
-            res = getattr(controller, req.method)(env, start_response)
+            try:
+                res = getattr(controller, req.method)(env, start_response)
+            except BackendUnavailable:
+                return get_err_response('ServiceUnavailable')(env,
+                                                              start_response)
+            finally:
+                stats.mark('dispatch')
         else:
             return get_err_response('InvalidURI')(env, start_response)
         return res(env, start_response)
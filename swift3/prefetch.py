@@ -0,0 +1,97 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Speculative prefetch of the next page of bucket listings.
+
+With ``listing_prefetch = true``, a truncated GET Bucket response starts the
+backend listing of the following page in a green thread, keyed on the
+marker the client is expected to send next.  The page is kept for
+``listing_prefetch_ttl`` seconds, and the client's follow-up request is
+answered from it (waiting for it if it is still in flight).  At most
+``listing_prefetch_max_pages`` pages are held per worker.
+
+As the follow-up request does not reach Swift, prefetched pages are only
+used for requests whose signature swift3 verified itself
+(``verify_signature = true``) and only for the access key which caused the
+prefetch.
+
+The ``prefetch.issued``, ``prefetch.hits`` and ``prefetch.wasted`` counters
+are emitted to tune the feature, and also kept in the prefetcher.
+"""
+
+import time
+
+import eventlet
+
+
+class ListingPrefetcher(object):
+    """
+    Holds the listing pages fetched ahead of the requests.
+
+    :param ttl: seconds a page is held
+    :param max_pages: maximum number of pages held at once
+    :param logger: logger used to emit the counters
+    """
+    def __init__(self, ttl=5, max_pages=100, logger=None):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.logger = logger
+        self.pages = {}
+        self.issued = 0
+        self.hits = 0
+        self.wasted = 0
+
+    def _count(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+        if self.logger:
+            self.logger.increment('prefetch.%s' % name)
+
+    def _expire(self):
+        now = time.time()
+        for key, (expires, thread) in self.pages.items():
+            if expires < now:
+                del self.pages[key]
+                self._count('wasted')
+
+    def prefetch(self, key, func, *args):
+        """
+        Starts func(*args) in the background unless key is already held.
+        func must return the page, or None if it could not be fetched.
+        """
+        self._expire()
+        if key in self.pages or len(self.pages) >= self.max_pages:
+            return
+        self.pages[key] = (time.time() + self.ttl,
+                           eventlet.spawn(func, *args))
+        self._count('issued')
+
+    def get(self, key):
+        """
+        Returns the page held for key, or None.
+        """
+        self._expire()
+        entry = self.pages.pop(key, None)
+        if entry is None:
+            return None
+        try:
+            page = entry[1].wait()
+        except Exception:
+            page = None
+        if page is None:
+            self._count('wasted')
+        else:
+            self._count('hits')
+        return page
@@ -0,0 +1,130 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sampled cProfile profiling of the S3 requests.
+
+Setting ``profile_dir`` enables the profiler.  A request is profiled when:
+
+    * it is one of every ``profile_sample_rate`` requests (0, the default,
+      samples none), or
+    * its operation is in ``profile_operations`` (a comma separated list of
+      S3 operation names such as ``ListObjects``), or
+    * its bucket is in ``profile_buckets``.
+
+The profile of a request is kept only if the request took at least
+``profile_slow_threshold`` seconds (0 by default), so that combined with a
+sample rate of 1 only the slow requests are kept.  Profiles are written as
+``<operation>-<time>-<pid>.prof`` in ``profile_dir`` and only the
+``profile_max_files`` most recent files are kept.
+
+cProfile profiles a whole OS thread, and all the green threads of a worker
+share one: the profiles of overlapping requests would clobber each other.
+Only one request per worker is therefore profiled at a time, requests
+picked while a profile is running are not profiled.  A profile also
+includes whatever the other green threads ran while its request was
+waiting on the backend.
+
+``bin/swift3-profile-report`` merges the dumps into a report of the
+functions taking the most time.
+"""
+
+import cProfile
+import os
+import time
+import urlparse
+
+from swift.common.swob import HeaderEnvironProxy
+from swift.common.utils import split_path
+
+from stats import get_operation_name
+
+
+def _split_list(value):
+    return set(item.strip() for item in value.split(',') if item.strip())
+
+
+class RequestProfiler(object):
+    """
+    Picks the requests to profile and writes their profiles.
+    """
+    def __init__(self, conf):
+        self.directory = conf['profile_dir']
+        self.sample_rate = int(conf.get('profile_sample_rate', 0))
+        self.operations = _split_list(conf.get('profile_operations', ''))
+        self.buckets = _split_list(conf.get('profile_buckets', ''))
+        self.slow_threshold = float(conf.get('profile_slow_threshold', 0))
+        self.max_files = int(conf.get('profile_max_files', 100))
+        self.requests = 0
+        # Profile of the request being profiled, if any.
+        self.active = None
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def should_profile(self, env):
+        self.requests += 1
+        if self.active is not None:
+            return False
+        if self.sample_rate and self.requests % self.sample_rate == 0:
+            return True
+        if not self.operations and not self.buckets:
+            return False
+        try:
+            container, obj = split_path(env['PATH_INFO'], 0, 2, True)
+        except ValueError:
+            return False
+        if container in self.buckets:
+            return True
+        if self.operations:
+            args = dict(urlparse.parse_qsl(env.get('QUERY_STRING', ''), 1))
+            return get_operation_name(env['REQUEST_METHOD'], container, obj,
+                                      args, HeaderEnvironProxy(env)) \
+                in self.operations
+        return False
+
+    def start(self):
+        profile = self.active = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, stats):
+        """
+        Stops profile and writes it if the request was slow enough.
+
+        :param stats: RequestStats of the request
+        """
+        profile.disable()
+        if profile is self.active:
+            self.active = None
+        if time.time() - stats.start < self.slow_threshold:
+            return
+        path = os.path.join(self.directory, '%s-%d-%d.prof' % (
+            stats.operation or 'Unknown', int(stats.start * 1000),
+            os.getpid()))
+        profile.dump_stats(path)
+        self._rotate()
+
+    def _rotate(self):
+        files = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory)
+                 if name.endswith('.prof')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:-self.max_files]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
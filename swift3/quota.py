@@ -0,0 +1,92 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Account usage cache used to reject uploads into accounts over quota.
+
+When ``check_account_quota`` is enabled, PUT Object compares the
+Content-Length of the upload with the account quota (the
+``X-Account-Meta-Quota-Bytes`` metadata used by the Swift account_quotas
+middleware) and the ``X-Account-Bytes-Used`` of the account before any of
+the body is read.  Both values are taken from the account responses seen by
+swift3 and kept for ``account_usage_ttl`` seconds, in ``swift.cache`` when
+it is available and per worker otherwise.
+"""
+
+import time
+
+
+def get_usage_from_headers(headers):
+    """
+    Returns (bytes used, quota) from the headers of an account response.
+    The quota is None if the account has none.
+
+    :param headers: dict of the response headers
+    """
+    headers = dict((k.lower(), v) for k, v in headers.iteritems())
+    try:
+        bytes_used = int(headers.get('x-account-bytes-used', 0))
+    except ValueError:
+        bytes_used = 0
+    try:
+        quota = int(headers['x-account-meta-quota-bytes'])
+    except (KeyError, ValueError):
+        quota = None
+    return bytes_used, quota
+
+
+class AccountUsageCache(object):
+    """
+    Caches (bytes used, quota) per access key.
+    """
+    def __init__(self, ttl=60, prefix='swift3/account_usage'):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._usage = {}
+
+    def get(self, env, account):
+        memcache = env.get('swift.cache')
+        if memcache is not None:
+            usage = memcache.get('%s/%s' % (self.prefix, account))
+            return tuple(usage) if usage else None
+        entry = self._usage.get(account)
+        if entry is None or entry[1] < time.time():
+            self._usage.pop(account, None)
+            return None
+        return entry[0]
+
+    def set(self, env, account, bytes_used, quota):
+        memcache = env.get('swift.cache')
+        if memcache is not None:
+            memcache.set('%s/%s' % (self.prefix, account),
+                         [bytes_used, quota], time=self.ttl)
+        else:
+            self._usage[account] = ((bytes_used, quota),
+                                    time.time() + self.ttl)
+
+    def add_bytes(self, env, account, nbytes):
+        """
+        Accounts for an upload until the next account response is seen.
+        """
+        memcache = env.get('swift.cache')
+        if memcache is not None:
+            usage = self.get(env, account)
+            if usage is not None:
+                self.set(env, account, usage[0] + nbytes, usage[1])
+            return
+        entry = self._usage.get(account)
+        if entry is not None:
+            (bytes_used, quota), expires = entry
+            self._usage[account] = ((bytes_used + nbytes, quota), expires)
@@ -0,0 +1,137 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per access key rate limiting for swift3.
+
+Each access key gets one token bucket per operation class (``list``,
+``read``, ``write`` and ``delete``).  The rates are set in requests per
+second with the ``ratelimit_<class>`` options, 0 (the default) disables
+limiting for that class.  ``ratelimit_buffer_seconds`` is the size of the
+bucket, i.e. how many seconds worth of requests a client may burst.
+
+The buckets are kept in ``swift.cache`` when it is available so that all
+proxy workers share them, and in a per worker dict otherwise.  Like the
+Swift ratelimit middleware, a bucket is stored as the next time (in
+milliseconds) at which a request is allowed, which memcache can update
+atomically with ``incr``.  The per worker buckets are also used while
+memcache can not be reached.
+
+When ``verify_signature`` is enabled, only the requests whose signature
+swift3 verified are charged to their access key.  Otherwise the access key
+is only checked later by the auth middleware, so a client can spend the
+tokens of any access key it knows by sending requests with a bad
+signature.
+
+Limited requests are answered with an S3 ``SlowDown`` error and a
+``Retry-After`` header.
+"""
+
+import math
+import time
+
+from swift.common.memcached import MemcacheConnectionError
+
+OPERATION_CLASSES = ('list', 'read', 'write', 'delete')
+
+
+def get_operation_class(method, container, obj, args):
+    """
+    Returns the rate limiting class of a request.
+
+    :param method: HTTP method of the request
+    :param container: bucket name or None
+    :param obj: object name or None
+    :param args: dict of the query parameters
+    """
+    if method == 'DELETE' or (method == 'POST' and 'delete' in args):
+        return 'delete'
+    if method == 'GET':
+        if obj or 'acl' in args:
+            return 'read'
+        return 'list'
+    if method == 'HEAD':
+        return 'read'
+    return 'write'
+
+
+class RateLimiter(object):
+    """
+    Token buckets keyed on access key and operation class.
+    """
+    def __init__(self, conf):
+        self.rates = {}
+        for op_class in OPERATION_CLASSES:
+            rate = float(conf.get('ratelimit_%s' % op_class, 0))
+            if rate > 0:
+                self.rates[op_class] = rate
+        self.buffer_ms = int(
+            float(conf.get('ratelimit_buffer_seconds', 5)) * 1000)
+        self.prefix = conf.get('ratelimit_memcache_prefix',
+                               'swift3/ratelimit')
+        self._buckets = {}
+
+    def __nonzero__(self):
+        return bool(self.rates)
+
+    def _local_incr(self, key, now_ms, interval_ms):
+        next_ms = max(self._buckets.get(key, now_ms), now_ms) + interval_ms
+        self._buckets[key] = next_ms
+        return next_ms
+
+    def _local_decr(self, key, interval_ms):
+        self._buckets[key] -= interval_ms
+
+    def get_retry_after(self, env, access_key, op_class):
+        """
+        Takes a token from the bucket of the access key.
+
+        :returns: 0 if the request is allowed, else the number of seconds the
+                  client should wait before retrying.
+        """
+        rate = self.rates.get(op_class)
+        if not rate:
+            return 0
+        interval_ms = int(1000 / rate) or 1
+        now_ms = int(time.time() * 1000)
+        key = '%s/%s/%s' % (self.prefix, access_key, op_class)
+        memcache = env.get('swift.cache')
+        expires = int(self.buffer_ms / 1000) + 60
+        if memcache is not None:
+            try:
+                next_ms = memcache.incr(key, delta=interval_ms, time=expires)
+                if next_ms - interval_ms < now_ms:
+                    # The bucket is full, start over from now.
+                    next_ms = now_ms + interval_ms
+                    memcache.set(key, str(next_ms), serialize=False,
+                                 time=expires)
+            except MemcacheConnectionError:
+                memcache = None
+        if memcache is None:
+            next_ms = self._local_incr(key, now_ms, interval_ms)
+
+        wait_ms = next_ms - interval_ms - now_ms - self.buffer_ms
+        if wait_ms <= 0:
+            return 0
+        # Give the token back, rejected requests should not push the
+        # bucket further into the future.
+        if memcache is not None:
+            try:
+                memcache.decr(key, delta=interval_ms, time=expires)
+            except MemcacheConnectionError:
+                pass
+        else:
+            self._local_decr(key, interval_ms)
+        return int(math.ceil(wait_ms / 1000.0))
@@ -0,0 +1,187 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Weighted fair scheduling of the backend calls made by swift3.
+
+Every backend call made by a swift3 controller takes a slot from the per
+worker :class:`FairScheduler`, which a GET Object keeps until the object has
+been sent.  At most ``scheduler_max_inflight`` calls are in flight at once
+(0, the default, disables the scheduler).  Excess calls wait in one queue
+per account and the queues are served in weighted round robin, so an
+account sending thousands of concurrent listings or deletes only gets its
+share of the backend.
+
+Weights are given with ``scheduler_weights`` as a comma separated list of
+``<account>=<weight>`` (the account is the part of the access key before
+the ``:``); unlisted accounts have a weight of 1.  A call that waits more
+than ``scheduler_queue_timeout`` seconds is shed and the request fails with
+``ServiceUnavailable``.
+
+The number of calls in flight and waiting for a slot are exported as the
+``swift3_scheduler_inflight`` and ``swift3_scheduler_queued`` gauges of the
+``metrics_path`` endpoint.
+"""
+
+import sys
+import time
+from collections import deque
+
+from eventlet import Timeout
+from eventlet.event import Event
+
+from utils import BackendUnavailable
+
+
+class SchedulerTimeout(BackendUnavailable):
+    """
+    Raised when a backend call waited too long for a slot.
+    """
+    pass
+
+
+def parse_weights(value):
+    """
+    Parses ``scheduler_weights`` into a dict of account to weight.
+    """
+    weights = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        account, weight = item.rsplit('=', 1)
+        weights[account.strip()] = max(int(weight), 1)
+    return weights
+
+
+class FairScheduler(object):
+    """
+    Bounds the in-flight backend calls of a worker and queues the excess.
+
+    :param max_inflight: maximum number of concurrent backend calls
+    :param queue_timeout: seconds a call may wait for a slot, 0 for no limit
+    :param weights: dict of account to weight
+    :param logger: logger used to emit the queue wait time metrics
+    """
+    def __init__(self, max_inflight, queue_timeout=0, weights=None,
+                 logger=None):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self.weights = weights or {}
+        self.logger = logger
+        self.inflight = 0
+        self.queues = {}
+        self.active = deque()
+        self.credits = {}
+        self.queued_calls = 0
+        self.shed_calls = 0
+        self.wait_time = 0.0
+
+    def stats(self):
+        """
+        Returns a dict with the current state of the scheduler.
+        """
+        return {'inflight': self.inflight,
+                'queued': sum(len(q) for q in self.queues.itervalues()),
+                'queues': dict((account, len(q)) for account, q in
+                               self.queues.iteritems()),
+                'queued_calls': self.queued_calls,
+                'shed_calls': self.shed_calls,
+                'wait_time': self.wait_time}
+
+    def gauges(self):
+        """
+        Returns the (name, help, value) gauges of the scheduler.
+        """
+        return [('swift3_scheduler_inflight',
+                 'Backend calls in flight', self.inflight),
+                ('swift3_scheduler_queued',
+                 'Backend calls waiting for a slot',
+                 sum(len(q) for q in self.queues.itervalues()))]
+
+    def _remove_waiter(self, account, event):
+        queue = self.queues.get(account)
+        if queue is None:
+            return
+        try:
+            queue.remove(event)
+        except ValueError:
+            pass
+        if not queue:
+            del self.queues[account]
+            self.active.remove(account)
+            self.credits.pop(account, None)
+
+    def acquire(self, account):
+        """
+        Takes a slot for a backend call of the account, waiting if needed.
+
+        :raises SchedulerTimeout: if no slot was available in time
+        """
+        if self.inflight < self.max_inflight and not self.active:
+            self.inflight += 1
+            return
+        event = Event()
+        if account not in self.queues:
+            self.queues[account] = deque()
+            self.active.append(account)
+            self.credits[account] = self.weights.get(account, 1)
+        self.queues[account].append(event)
+        self.queued_calls += 1
+        start = time.time()
+        timeout = Timeout(self.queue_timeout or None)
+        try:
+            event.wait()
+        except BaseException:
+            # Whatever interrupted the wait, the slot must not be lost.
+            exc_info = sys.exc_info()
+            if event.ready():
+                # We got the slot just as we were interrupted, hand it on.
+                self.release()
+            else:
+                self._remove_waiter(account, event)
+            if exc_info[1] is not timeout:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            self.shed_calls += 1
+            if self.logger:
+                self.logger.increment('scheduler.shed')
+            raise SchedulerTimeout(account)
+        finally:
+            timeout.cancel()
+            waited = time.time() - start
+            self.wait_time += waited
+            if self.logger:
+                self.logger.timing('scheduler.queue_wait', waited * 1000)
+
+    def release(self):
+        """
+        Releases a slot, handing it to the next account in line if any.
+        """
+        while self.active:
+            account = self.active[0]
+            queue = self.queues[account]
+            event = queue.popleft()
+            self.credits[account] -= 1
+            if not queue:
+                self.active.popleft()
+                del self.queues[account]
+                del self.credits[account]
+            elif self.credits[account] <= 0:
+                self.credits[account] = self.weights.get(account, 1)
+                self.active.rotate(-1)
+            # The slot goes straight to the waiter, inflight is unchanged.
+            event.send()
+            return
+        self.inflight -= 1
@@ -0,0 +1,198 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per request latency instrumentation.
+
+Every S3 request gets a :class:`RequestStats` in ``env['swift3.stats']``
+which accumulates the time spent in each phase of the request:
+
+    * ``parse``: parsing of the Authorization and Date headers
+    * ``canonical``: building the string to sign
+    * ``auth``: signature verification and rate limiting
+    * ``dispatch``: the controller, including the three phases below
+    * ``backend``: the calls to Swift, up to their response headers
+    * ``parse_response``: parsing of backend listings and request bodies
+    * ``render``: rendering of the XML responses
+
+Requests taking more than ``slow_request_threshold`` seconds are logged
+with a warning holding their operation, bucket, key, status, backend
+status, number of backend calls, listing entries, bytes sent and phase
+timings.
+
+When the request is done, the phases are emitted as
+``<operation>.<phase>`` timings, along with the ``<operation>.request``
+total, where the operation is the S3 operation name (``GetObject``,
+``ListObjects``, ``DeleteObjects``...).  They go to the StatsD client of
+the Swift logger when ``log_statsd_host`` is set, and otherwise to an in
+process :class:`StatsAggregator`.
+
+When span export is enabled (see :mod:`swift3.tracing`), ``spans`` also
+lists the (name, start, end, attributes) of every phase and backend call.
+"""
+
+import time
+from urllib import quote
+
+BUCKET_GET_OPERATIONS = (('acl', 'GetBucketAcl'),
+                         ('location', 'GetBucketLocation'),
+                         ('versioning', 'GetBucketVersioning'),
+                         ('logging', 'GetBucketLogging'),
+                         ('uploads', 'ListMultipartUploads'),
+                         ('versions', 'ListObjectVersions'))
+
+
+def get_operation_name(method, container, obj, args, headers):
+    """
+    Returns the S3 operation name of a request.
+
+    :param method: HTTP method of the request
+    :param container: bucket name or None
+    :param obj: object name or None
+    :param args: dict of the query parameters
+    :param headers: headers of the request
+    """
+    copy = 'x-amz-copy-source' in headers
+    if not container:
+        return 'ListBuckets' if method == 'GET' else 'Unknown'
+    if not obj:
+        if method == 'GET':
+            for arg, name in BUCKET_GET_OPERATIONS:
+                if arg in args:
+                    return name
+            return 'ListObjects'
+        if method == 'PUT':
+            if 'acl' in args:
+                return 'PutBucketAcl'
+            if 'versioning' in args:
+                return 'PutBucketVersioning'
+            if 'logging' in args:
+                return 'PutBucketLogging'
+            return 'CreateBucket'
+        if method == 'POST' and 'delete' in args:
+            return 'DeleteObjects'
+        return {'DELETE': 'DeleteBucket',
+                'HEAD': 'HeadBucket'}.get(method, 'Unknown')
+    if method == 'GET':
+        if 'acl' in args:
+            return 'GetObjectAcl'
+        return 'ListParts' if 'uploadId' in args else 'GetObject'
+    if method == 'PUT':
+        if 'acl' in args:
+            return 'PutObjectAcl'
+        if 'uploadId' in args:
+            return 'UploadPartCopy' if copy else 'UploadPart'
+        return 'CopyObject' if copy else 'PutObject'
+    if method == 'POST':
+        if 'uploads' in args:
+            return 'CreateMultipartUpload'
+        if 'uploadId' in args:
+            return 'CompleteMultipartUpload'
+        return 'Unknown'
+    if method == 'DELETE':
+        return 'AbortMultipartUpload' if 'uploadId' in args \
+            else 'DeleteObject'
+    return 'HeadObject' if method == 'HEAD' else 'Unknown'
+
+
+class RequestStats(object):
+    """
+    Phase timings of one S3 request.
+    """
+    def __init__(self):
+        self.start = self.last_mark = time.time()
+        self.operation = None
+        self.phases = {}
+        self.backend_calls = 0
+        self.bucket = None
+        self.key = None
+        self.status = None
+        self.response_bytes = 0
+        self.backend_status = None
+        self.listing_entries = 0
+        self.spans = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_since(self, phase, start):
+        now = time.time()
+        self.add(phase, now - start)
+        if self.spans is not None:
+            self.spans.append((phase, start, now, {}))
+
+    def add_backend_call(self, start, method, path, status):
+        """
+        Accounts a backend call started at start.
+        """
+        now = time.time()
+        self.add('backend', now - start)
+        self.backend_calls += 1
+        self.backend_status = status
+        if self.spans is not None:
+            self.spans.append(('backend', start, now, {
+                'method': method, 'path': path, 'status': status}))
+
+    def mark(self, phase):
+        """
+        Accounts the time since the previous mark to phase.
+        """
+        self.add_since(phase, self.last_mark)
+        self.last_mark = time.time()
+
+    def describe(self):
+        """
+        Returns a one line key=value summary of the request.
+        """
+        fields = [('operation', self.operation), ('bucket', self.bucket),
+                  ('key', self.key), ('status', self.status),
+                  ('backend_status', self.backend_status),
+                  ('backend_calls', self.backend_calls),
+                  ('listing_entries', self.listing_entries),
+                  ('bytes_out', self.response_bytes),
+                  ('total', '%.4f' % (time.time() - self.start))]
+        fields.extend((phase, '%.4f' % seconds)
+                      for phase, seconds in sorted(self.phases.iteritems()))
+        return ' '.join('%s=%s' % (name, quote(str(value), safe='/:'))
+                        for name, value in fields if value is not None)
+
+    def emit(self, metrics):
+        """
+        Sends the timings to metrics, a Swift logger or a StatsAggregator.
+        """
+        for phase, seconds in self.phases.iteritems():
+            metrics.timing('%s.%s' % (self.operation, phase), seconds * 1000)
+        metrics.timing_since('%s.request' % self.operation, self.start)
+
+
+class StatsAggregator(object):
+    """
+    Keeps the count, total and maximum of every timing metric, and the
+    value of every counter, for when no StatsD server is configured.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    def timing(self, metric, timing_ms):
+        count, total, maximum = self.timings.get(metric, (0, 0.0, 0.0))
+        self.timings[metric] = (count + 1, total + timing_ms,
+                                max(maximum, timing_ms))
+
+    def timing_since(self, metric, orig_time):
+        self.timing(metric, (time.time() - orig_time) * 1000)
+
+    def increment(self, metric):
+        self.counters[metric] = self.counters.get(metric, 0) + 1
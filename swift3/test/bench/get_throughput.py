@@ -0,0 +1,82 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the GET Object throughput of swift3 against a fake backend
+streaming large bodies, next to the throughput of the backend alone.
+
+    python -m swift3.test.bench.get_throughput [size in MB] [chunk in KB]
+
+run from the top of the source tree.
+"""
+
+import sys
+import time
+
+from swift.common.swob import Request
+
+from swift3 import middleware as swift3
+
+
+class StreamingBackend(object):
+    """
+    Answers every GET with a body of size bytes in chunk_size chunks.
+    """
+    def __init__(self, size, chunk_size):
+        self.size = size
+        self.chunk = 'x' * chunk_size
+
+    def _body(self):
+        left = self.size
+        chunk = self.chunk
+        while left > 0:
+            if left < len(chunk):
+                chunk = chunk[:left]
+            left -= len(chunk)
+            yield chunk
+
+    def __call__(self, env, start_response):
+        start_response('200 OK', [
+            ('Content-Length', str(self.size)),
+            ('Content-Type', 'application/octet-stream'),
+            ('Etag', 'd41d8cd98f00b204e9800998ecf8427e')])
+        return self._body()
+
+
+def run(app, size):
+    req = Request.blank('/bucket/object',
+                        headers={'Authorization': 'AWS test:tester:hmac'})
+    start = time.time()
+    received = 0
+    body = app(req.environ, lambda status, headers: None)
+    for chunk in body:
+        received += len(chunk)
+    if hasattr(body, 'close'):
+        body.close()
+    elapsed = time.time() - start
+    assert received == size, received
+    return size / elapsed / 1024 / 1024
+
+
+def main(args):
+    size = int(args[0] if args else 1024) * 1024 * 1024
+    chunk_size = int(args[1] if len(args) > 1 else 64) * 1024
+    backend = StreamingBackend(size, chunk_size)
+    print 'backend: %.1f MB/s' % run(backend, size)
+    print 'swift3:  %.1f MB/s' % run(swift3.filter_factory({})(backend), size)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
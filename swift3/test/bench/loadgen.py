@@ -0,0 +1,288 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Load generator driving Swift3Middleware in process.
+
+``--concurrency`` green threads send a weighted mix of signature (version
+2) checked S3 requests to a swift3 filter in front of the in memory
+:class:`~swift3.test.unit.helpers.FakeSwift`, for ``--duration`` seconds:
+
+    * ``GET`` and ``HEAD`` Object of random existing keys
+    * ``PUT`` Object of new keys, sized after ``--sizes``
+    * ``LIST``: GET Bucket of up to 1000 keys from a random marker
+    * ``DELETE``: multi-delete of ``--delete-keys`` existing keys
+
+Object sizes follow ``fixed:<bytes>``, ``uniform:<min>-<max>`` or
+``lognormal:<median>,<sigma>`` (capped at ``--max-size``).  The backend
+answers after ``--backend-latency`` seconds.
+
+The throughput, the p50, p99 and p99.9 latencies and the peak resident set
+size seen at the end of the requests are reported per operation.
+
+    python -m swift3.test.bench.loadgen --concurrency 100 --duration 30 \\
+        --mix GET=60,PUT=20,HEAD=10,LIST=5,DELETE=5 --sizes lognormal:65536,1
+
+run from the top of the source tree.
+"""
+
+import email.utils
+import math
+import optparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from hashlib import md5
+
+import eventlet
+
+from swift.common.swob import Request
+
+from swift3 import middleware as swift3
+from swift3.test.unit.helpers import FakeSwift
+from swift3.utils import canonical_string, get_signature
+
+ACCESS_KEY = 'test:tester'
+SECRET = 'secret'
+BUCKET = 'bench'
+OPERATIONS = ('GET', 'PUT', 'HEAD', 'LIST', 'DELETE')
+
+
+def parse_sizes(value, max_size):
+    """
+    Returns a function returning random object sizes.
+    """
+    kind, _, args = value.partition(':')
+    if kind == 'fixed':
+        size = int(args)
+        return lambda: size
+    if kind == 'uniform':
+        low, high = [int(x) for x in args.split('-')]
+        return lambda: random.randint(low, high)
+    if kind == 'lognormal':
+        median, sigma = [float(x) for x in args.split(',')]
+        mu = math.log(median)
+        return lambda: min(int(random.lognormvariate(mu, sigma)), max_size)
+    raise ValueError('Unknown size distribution: %s' % value)
+
+
+def parse_mix(value):
+    """
+    Returns the list of (operation, weight) of ``--mix``.
+    """
+    mix = []
+    for item in value.split(','):
+        operation, weight = item.split('=')
+        if operation.upper() not in OPERATIONS:
+            raise ValueError('Unknown operation: %s' % operation)
+        mix.append((operation.upper(), float(weight)))
+    return mix
+
+
+def get_rss():
+    """
+    Returns the current resident set size in KB.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * \
+                resource.getpagesize() / 1024
+    except IOError:
+        # Only the peak is available, in KB on Linux and bytes on OS X.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    rank = int(math.ceil(fraction * len(values))) - 1
+    return values[max(rank, 0)]
+
+
+class OperationStats(object):
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.peak_rss = 0
+
+
+class LoadGenerator(object):
+    """
+    Sends the requests of the workers and keeps the per operation stats.
+    """
+    def __init__(self, app, mix, sizes, delete_keys=10):
+        self.app = app
+        self.operations = [operation for operation, weight in mix]
+        total = sum(weight for operation, weight in mix)
+        self.thresholds = []
+        cumulated = 0.0
+        for operation, weight in mix:
+            cumulated += weight / total
+            self.thresholds.append(cumulated)
+        self.sizes = sizes
+        self.delete_keys = delete_keys
+        self.keys = []
+        self.next_key = 0
+        self.stats = dict((operation, OperationStats())
+                          for operation in self.operations)
+
+    def new_key(self):
+        self.next_key += 1
+        return 'object%010d' % self.next_key
+
+    def _pick_operation(self):
+        draw = random.random()
+        for operation, threshold in zip(self.operations, self.thresholds):
+            if draw < threshold:
+                return operation
+        return self.operations[-1]
+
+    def _signed_request(self, path, method, body=None, headers=None):
+        headers = dict(headers or {})
+        headers['Date'] = email.utils.formatdate(usegmt=True)
+        req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                            headers=headers, body=body)
+        req.headers['Authorization'] = 'AWS %s:%s' % (
+            ACCESS_KEY, get_signature(SECRET, canonical_string(req)))
+        return req
+
+    def build_request(self, operation):
+        """
+        Returns the request of an operation, or None if it can not be made.
+        """
+        if operation == 'PUT':
+            key = self.new_key()
+            self.keys.append(key)
+            return self._signed_request('/%s/%s' % (BUCKET, key), 'PUT',
+                                        'x' * self.sizes())
+        if not self.keys:
+            return None
+        if operation in ('GET', 'HEAD'):
+            return self._signed_request(
+                '/%s/%s' % (BUCKET, random.choice(self.keys)), operation)
+        if operation == 'LIST':
+            return self._signed_request('/%s?marker=%s' % (
+                BUCKET, random.choice(self.keys)), 'GET')
+        keys = [self.keys.pop(random.randrange(len(self.keys)))
+                for i in range(min(self.delete_keys, len(self.keys)))]
+        body = '<Delete>%s</Delete>' % ''.join(
+            '<Object><Key>%s</Key></Object>' % key for key in keys)
+        return self._signed_request(
+            '/%s?delete' % BUCKET, 'POST', body,
+            {'Content-MD5': md5(body).digest().encode('base64').strip()})
+
+    def run_one(self):
+        operation = self._pick_operation()
+        req = self.build_request(operation)
+        if req is None:
+            return
+        status = []
+        start = time.time()
+        body = self.app(req.environ,
+                        lambda s, h, exc_info=None: status.append(s))
+        for chunk in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+        stats = self.stats[operation]
+        stats.latencies.append(time.time() - start)
+        if not status or int(status[0].split()[0]) >= 300:
+            stats.errors += 1
+        stats.peak_rss = max(stats.peak_rss, get_rss())
+
+    def worker(self, deadline):
+        while time.time() < deadline:
+            self.run_one()
+            # Let the other workers in even if the backend never blocks.
+            eventlet.sleep(0)
+
+    def run(self, concurrency, duration):
+        deadline = time.time() + duration
+        pool = eventlet.GreenPool(concurrency)
+        for i in range(concurrency):
+            pool.spawn_n(self.worker, deadline)
+        pool.waitall()
+
+    def report(self, elapsed):
+        lines = ['%-8s %9s %8s %7s %9s %9s %9s %10s' % (
+            'op', 'requests', 'req/s', 'errors', 'p50 ms', 'p99 ms',
+            'p99.9 ms', 'peak RSS')]
+        for operation in OPERATIONS:
+            if operation not in self.stats:
+                continue
+            stats = self.stats[operation]
+            latencies = sorted(stats.latencies)
+            lines.append('%-8s %9d %8.1f %7d %9.2f %9.2f %9.2f %7d KB' % (
+                operation, len(latencies), len(latencies) / elapsed,
+                stats.errors,
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                percentile(latencies, 0.999) * 1000,
+                stats.peak_rss))
+        return '\n'.join(lines)
+
+
+def main(args):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--concurrency', type='int', default=50)
+    parser.add_option('--duration', type='float', default=10)
+    parser.add_option('--mix', default='GET=60,PUT=20,HEAD=10,LIST=5,DELETE=5')
+    parser.add_option('--sizes', default='lognormal:16384,1.5')
+    parser.add_option('--max-size', type='int', default=16 * 1024 * 1024)
+    parser.add_option('--objects', type='int', default=1000,
+                      help='objects created before the run')
+    parser.add_option('--delete-keys', type='int', default=10)
+    parser.add_option('--backend-latency', type='float', default=0.001)
+    parser.add_option('--seed', type='int')
+    options, _ = parser.parse_args(args)
+    random.seed(options.seed)
+
+    backend = FakeSwift(latency=options.backend_latency)
+    backend.create_container(ACCESS_KEY, BUCKET)
+    fd, credentials = tempfile.mkstemp()
+    os.write(fd, '%s %s\n' % (ACCESS_KEY, SECRET))
+    os.close(fd)
+    try:
+        app = swift3.filter_factory({'verify_signature': 'true',
+                                     'credential_store': 'file',
+                                     'credential_file': credentials})(backend)
+        generator = LoadGenerator(
+            app, parse_mix(options.mix),
+            parse_sizes(options.sizes, options.max_size), options.delete_keys)
+        for i in range(options.objects):
+            key = generator.new_key()
+            generator.keys.append(key)
+            backend.put_object(ACCESS_KEY, BUCKET, key,
+                               'x' * generator.sizes())
+
+        start = time.time()
+        generator.run(options.concurrency, options.duration)
+        elapsed = time.time() - start
+    finally:
+        os.unlink(credentials)
+    print generator.report(elapsed)
+    total = sum(len(s.latencies) for s in generator.stats.itervalues())
+    print 'total: %d requests, %.1f req/s, %d green threads' % (
+        total, total / elapsed, options.concurrency)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
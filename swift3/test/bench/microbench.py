@@ -0,0 +1,225 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmarks of the swift3 hot paths.
+
+Every benchmark is run ``--repeat`` times for ``--duration`` seconds and
+the best run is reported in operations per second, along with the number
+of GC tracked objects per operation which reference counting alone does not
+free: cyclic garbage (such as minidom documents) which costs collector
+passes, and objects kept by caches or leaked.
+
+The results are compared with the baseline stored in ``baseline.json``
+next to this file, and the script exits with status 1 when an operation
+got slower than the baseline by more than ``--tolerance`` or retains more
+objects.  The baseline depends on the machine, refresh it with ``--save``
+on the machine the comparisons are made on.
+
+    python -m swift3.test.bench.microbench [--save] [--tolerance 0.25]
+        [--baseline FILE] [benchmark ...]
+
+run from the top of the source tree.
+"""
+
+import gc
+import optparse
+import os
+import sys
+import time
+
+import simplejson
+
+from swift.common.swob import Request
+from swift.container import server as container_server
+
+from swift3 import middleware as swift3
+from swift3.utils import canonical_string, get_err_response, get_s3_acl, \
+    parse_access_control_policy, validate_bucket_name
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+ACP = ('<AccessControlPolicy><Owner><ID>test:tester</ID></Owner>'
+       '<AccessControlList>%s</AccessControlList></AccessControlPolicy>' %
+       ''.join('<Grant><Grantee xmlns:xsi="http://www.w3.org/2001/'
+               'XMLSchema-instance" xsi:type="CanonicalUser">'
+               '<ID>user%d</ID></Grantee><Permission>READ</Permission>'
+               '</Grant>' % i for i in range(5)))
+
+
+class CannedBackend(object):
+    """
+    Answers listings with a canned page, object GETs with a small body and
+    everything else with 204.
+    """
+    def __init__(self, entries=1000):
+        self.listing = simplejson.dumps([
+            {'name': 'object%06d' % i, 'bytes': 1024,
+             'hash': 'd41d8cd98f00b204e9800998ecf8427e',
+             'last_modified': '2011-01-05T02:19:14.275290',
+             'content_type': 'application/octet-stream'}
+            for i in range(entries)])
+
+    def __call__(self, env, start_response):
+        parts = env['PATH_INFO'].split('/')
+        if env['REQUEST_METHOD'] == 'GET' and len(parts) == 4:
+            start_response('200 OK', [('Content-Length',
+                                       str(len(self.listing)))])
+            return [self.listing]
+        if env['REQUEST_METHOD'] == 'GET':
+            start_response('200 OK', [
+                ('Content-Length', '4'),
+                ('Etag', '8d777f385d3dfec8815d20f7496026dc')])
+            return ['data']
+        start_response('204 No Content', [])
+        return []
+
+
+def _s3_request(path, method='GET', body=None):
+    req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                        headers={'Authorization': 'AWS test:tester:hmac'},
+                        body=body)
+    return req.environ
+
+
+def _round_trip(app, path, method='GET', body=None):
+    def run():
+        env = _s3_request(path, method, body)
+        ''.join(app(env, lambda status, headers, exc_info=None: None))
+    return run
+
+
+def make_benchmarks():
+    """
+    Returns a dict of benchmark name to a function running one operation.
+    """
+    req = Request.blank('/bucket/object', headers={
+        'Content-Type': 'text/plain', 'Content-MD5': 'abc',
+        'Date': 'Tue, 27 Mar 2007 19:36:42 +0000',
+        'X-Amz-Meta-Foo': 'bar', 'X-Amz-Acl': 'private'})
+    acl_headers = {'x-container-read': '.r:*,test:tester',
+                   'x-container-write': 'test:tester',
+                   'x-container-owner': 'test:tester'}
+    app = swift3.filter_factory({})(CannedBackend())
+    delete_body = '<Delete>%s</Delete>' % ''.join(
+        '<Object><Key>object%06d</Key></Object>' % i for i in range(1000))
+    return {
+        'canonical_string': lambda: canonical_string(req),
+        'get_err_response': lambda: get_err_response('NoSuchKey').body,
+        'get_s3_acl': lambda: get_s3_acl(
+            acl_headers, container_server.ACL_HEADERS, 'container'),
+        'parse_access_control_policy':
+        lambda: parse_access_control_policy(ACP),
+        'validate_bucket_name':
+        lambda: validate_bucket_name('my-bucket.example-1'),
+        'list_objects_1000': _round_trip(app, '/bucket'),
+        'delete_objects_1000': _round_trip(app, '/bucket?delete', 'POST',
+                                           delete_body),
+        'get_object': _round_trip(app, '/bucket/object'),
+    }
+
+
+def measure(func, duration, repeat):
+    """
+    Returns (operations per second, objects left per operation).
+    """
+    func()
+    best = 0.0
+    for i in range(repeat):
+        ops = 0
+        start = time.time()
+        elapsed = 0
+        while elapsed < duration:
+            func()
+            ops += 1
+            elapsed = time.time() - start
+        best = max(best, ops / elapsed)
+
+    calls = 100
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        for i in range(calls):
+            func()
+        retained = float(gc.get_count()[0] - before) / calls
+    finally:
+        gc.enable()
+    return best, retained
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the list of regressions of results against baseline.
+    """
+    regressions = []
+    for name, result in sorted(results.iteritems()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result['ops_per_sec'] < expected['ops_per_sec'] * (1 - tolerance):
+            regressions.append('%s: %.0f ops/s, baseline %.0f ops/s' % (
+                name, result['ops_per_sec'], expected['ops_per_sec']))
+        if result['objects_per_op'] > expected['objects_per_op'] + 1:
+            regressions.append('%s: %.1f objects/op, baseline %.1f' % (
+                name, result['objects_per_op'], expected['objects_per_op']))
+    return regressions
+
+
+def main(args):
+    parser = optparse.OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--baseline', default=BASELINE)
+    parser.add_option('--save', action='store_true',
+                      help='store the results as the new baseline')
+    parser.add_option('--tolerance', type='float', default=0.25,
+                      help='allowed slowdown (default: %default)')
+    parser.add_option('--duration', type='float', default=1.0)
+    parser.add_option('--repeat', type='int', default=3)
+    options, names = parser.parse_args(args)
+
+    benchmarks = make_benchmarks()
+    results = {}
+    print '%-30s %12s %12s' % ('benchmark', 'ops/s', 'objects/op')
+    for name in names or sorted(benchmarks):
+        ops, objects = measure(benchmarks[name], options.duration,
+                               options.repeat)
+        results[name] = {'ops_per_sec': round(ops, 1),
+                         'objects_per_op': round(objects, 1)}
+        print '%-30s %12.1f %12.1f' % (name, ops, objects)
+
+    if options.save:
+        baseline = {}
+        if os.path.exists(options.baseline):
+            with open(options.baseline) as f:
+                baseline = simplejson.load(f)
+        baseline.update(results)
+        with open(options.baseline, 'w') as f:
+            simplejson.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print 'No baseline in %s, run with --save' % options.baseline
+        return 0
+    with open(options.baseline) as f:
+        regressions = compare(results, simplejson.load(f), options.tolerance)
+    for regression in regressions:
+        print 'REGRESSION %s' % regression
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
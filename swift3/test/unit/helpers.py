@@ -0,0 +1,464 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In memory stand-in for the Swift proxy behind swift3.
+
+:class:`FakeSwift` keeps accounts, containers and objects in memory and
+answers the requests swift3 makes the way a Swift cluster with the slo and
+versioning middlewares would: sorted container and account listings with
+prefix, delimiter, marker, end_marker and limit, container metadata and
+ACL headers, object versions, static and dynamic large objects, Range and
+conditional requests.  Latency and errors can be injected into every call,
+so that the middleware can be tested and measured without a cluster.
+"""
+
+import bisect
+import cgi
+import random
+import time
+from datetime import datetime
+from email.utils import formatdate
+from hashlib import md5
+from urllib import unquote
+
+import eventlet
+import simplejson
+
+from swift.common.swob import Request, Response
+from swift.common.utils import split_path
+
+
+class FakeObject(object):
+    """
+    One version of an object, or a delete marker.
+    """
+    def __init__(self, body, headers, version_id, deleted=False):
+        self.body = body
+        self.headers = headers
+        self.version_id = version_id
+        self.deleted = deleted
+        self.timestamp = time.time()
+        self.etag = md5(body).hexdigest()
+
+    def listing_entry(self, name):
+        size, etag = len(self.body), self.etag
+        if self.headers.get('X-Static-Large-Object') == 'True':
+            # The slo middleware lists the size of the whole object, and
+            # middlewares may override the hash of the manifest.
+            size = sum(s['bytes'] for s in simplejson.loads(self.body))
+        etag = self.headers.get(
+            'X-Object-Sysmeta-Container-Update-Override-Etag', etag)
+        return {'name': name, 'bytes': size, 'hash': etag,
+                'last_modified': datetime.utcfromtimestamp(
+                    self.timestamp).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                'content_type': self.headers.get(
+                    'Content-Type', 'application/octet-stream')}
+
+
+class FakeContainer(object):
+    """
+    Metadata and objects of a container, the names are kept sorted.
+    """
+    def __init__(self, headers=None):
+        self.headers = dict(headers or {})
+        self.names = []
+        self.versions = {}
+
+    def latest(self, name):
+        versions = self.versions.get(name)
+        if not versions or versions[-1].deleted:
+            return None
+        return versions[-1]
+
+    def add(self, name, obj, keep_versions):
+        if name not in self.versions:
+            bisect.insort(self.names, name)
+            self.versions[name] = []
+        if not keep_versions:
+            del self.versions[name][:]
+        self.versions[name].append(obj)
+
+    def remove(self, name):
+        del self.versions[name]
+        del self.names[bisect.bisect_left(self.names, name)]
+
+    def stats(self):
+        count = bytes_used = 0
+        for name in self.names:
+            obj = self.latest(name)
+            if obj is not None:
+                count += 1
+                bytes_used += len(obj.body)
+        return count, bytes_used
+
+
+def _meta_headers(env, prefixes):
+    return dict((key[5:].replace('_', '-').title(), value)
+                for key, value in env.iteritems()
+                if key.startswith(prefixes))
+
+
+def _update_meta(headers, env, prefixes):
+    for key, value in _meta_headers(env, prefixes).iteritems():
+        if value:
+            headers[key] = value
+        else:
+            headers.pop(key, None)
+
+
+def _listing(names, args, entry):
+    """
+    Returns the listing of sorted names, entry(name) returns the entries
+    of a name.
+    """
+    prefix = args.get('prefix', '')
+    marker = args.get('marker', '')
+    end_marker = args.get('end_marker')
+    delimiter = args.get('delimiter')
+    limit = min(int(args.get('limit', 10000)), 10000)
+    listing = []
+    if marker >= prefix:
+        start = bisect.bisect_right(names, marker)
+    else:
+        start = bisect.bisect_left(names, prefix)
+    for name in names[start:]:
+        if not name.startswith(prefix) or \
+                (end_marker and name >= end_marker):
+            break
+        if delimiter and delimiter in name[len(prefix):]:
+            subdir = name[:name.index(delimiter, len(prefix)) + 1]
+            if subdir <= marker or \
+                    (listing and listing[-1].get('subdir') == subdir):
+                continue
+            listing.append({'subdir': subdir})
+        else:
+            listing.extend(entry(name))
+        if len(listing) >= limit:
+            del listing[limit:]
+            break
+    return listing
+
+
+class FakeSwift(object):
+    """
+    In memory Swift proxy.
+
+    :param latency: seconds every call waits before it is answered, or a
+                    callable returning them given the WSGI environment
+    :param error_rate: fraction of the calls answered with a 503
+    :param seed: seed of the error injection
+    """
+    def __init__(self, latency=0, error_rate=0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.accounts = {}
+        self.calls = []
+        self._version = 0
+
+    def _next_version(self):
+        self._version += 1
+        return '%016d' % self._version
+
+    def _account(self, account):
+        return self.accounts.setdefault(account, ({}, {}))
+
+    def create_container(self, account, container, headers=None):
+        """
+        Creates a container, headers are its metadata.
+        """
+        containers = self._account(account)[1]
+        containers[container] = FakeContainer(headers)
+        return containers[container]
+
+    def put_object(self, account, container, name, body, headers=None):
+        """
+        Stores an object into an existing container.
+        """
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'application/octet-stream')
+        cont = self._account(account)[1][container]
+        cont.add(name, FakeObject(body, headers, self._next_version()),
+                 cont.headers.get('X-Container-Versioning') == 'enabled')
+
+    def get_object(self, account, container, name):
+        """
+        Returns the latest version of an object, or None.
+        """
+        cont = self._account(account)[1].get(container)
+        return cont.latest(name) if cont else None
+
+    def __call__(self, env, start_response):
+        method = env['REQUEST_METHOD']
+        self.calls.append((method, env['PATH_INFO'],
+                           env.get('QUERY_STRING', '')))
+        latency = self.latency(env) if callable(self.latency) \
+            else self.latency
+        if latency:
+            eventlet.sleep(latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return Response(status=503)(env, start_response)
+
+        version, account, container, obj = \
+            split_path(env['PATH_INFO'], 2, 4, True)
+        args = dict(cgi.parse_qsl(env.get('QUERY_STRING', ''), True))
+        if obj is not None:
+            handler = self._object
+        elif container is not None:
+            handler = self._container
+        else:
+            handler = self._account_request
+        resp = handler(Request(env), args, account, container, obj)
+        return resp(env, start_response)
+
+    def _listing_response(self, req, listing):
+        if req.params.get('format') == 'json':
+            return Response(body=simplejson.dumps(listing),
+                            content_type='application/json; charset=utf-8')
+        if not listing:
+            return Response(status=204)
+        body = ''.join('%s\n' % (entry.get('name') or entry['subdir'])
+                       for entry in listing)
+        return Response(body=body.encode('utf-8'),
+                        content_type='text/plain; charset=utf-8')
+
+    def _account_request(self, req, args, account, container, obj):
+        meta, containers = self._account(account)
+        if req.method == 'POST':
+            _update_meta(meta, req.environ, ('HTTP_X_ACCOUNT_META_',))
+            return Response(status=204)
+        if req.method not in ('GET', 'HEAD'):
+            return Response(status=405)
+
+        def entry(name):
+            count, bytes_used = containers[name].stats()
+            return [{'name': name, 'count': count, 'bytes': bytes_used}]
+
+        stats = [c.stats() for c in containers.itervalues()]
+        headers = dict(meta)
+        headers.update({
+            'X-Account-Container-Count': str(len(containers)),
+            'X-Account-Object-Count': str(sum(s[0] for s in stats)),
+            'X-Account-Bytes-Used': str(sum(s[1] for s in stats))})
+        if req.method == 'HEAD':
+            return Response(status=204, headers=headers)
+        resp = self._listing_response(
+            req, _listing(sorted(containers), args, entry))
+        resp.headers.update(headers)
+        return resp
+
+    def _container(self, req, args, account, container, obj):
+        containers = self._account(account)[1]
+        prefixes = ('HTTP_X_CONTAINER_META_', 'HTTP_X_CONTAINER_READ',
+                    'HTTP_X_CONTAINER_WRITE', 'HTTP_X_CONTAINER_VERSIONING',
+                    'HTTP_X_VERSIONS_LOCATION')
+        cont = containers.get(container)
+        if req.method == 'PUT':
+            if cont is not None:
+                _update_meta(cont.headers, req.environ, prefixes)
+                return Response(status=202)
+            self.create_container(account, container,
+                                  _meta_headers(req.environ, prefixes))
+            return Response(status=201)
+        if cont is None:
+            return Response(status=404)
+        if req.method == 'POST':
+            _update_meta(cont.headers, req.environ, prefixes)
+            return Response(status=204)
+        if req.method == 'DELETE':
+            if cont.stats()[0]:
+                return Response(status=409)
+            del containers[container]
+            return Response(status=204)
+        if req.method not in ('GET', 'HEAD'):
+            return Response(status=405)
+
+        count, bytes_used = cont.stats()
+        headers = dict(cont.headers)
+        headers.update({'X-Container-Object-Count': str(count),
+                        'X-Container-Bytes-Used': str(bytes_used)})
+        if req.method == 'HEAD':
+            return Response(status=204, headers=headers)
+
+        if 'versions' in args:
+            def entry(name):
+                versions = cont.versions[name]
+                entries = []
+                for obj in reversed(versions):
+                    item = obj.listing_entry(name)
+                    item.update({'version_id': obj.version_id,
+                                 'deleted': obj.deleted,
+                                 'is_latest': obj is versions[-1],
+                                 'owner': account})
+                    entries.append(item)
+                return entries
+        else:
+            def entry(name):
+                obj = cont.latest(name)
+                return [obj.listing_entry(name)] if obj else []
+        resp = self._listing_response(req, _listing(cont.names, args, entry))
+        resp.headers.update(headers)
+        return resp
+
+    def _find(self, account, container, name, version_id=None):
+        cont = self._account(account)[1].get(container)
+        if cont is None or name not in cont.versions:
+            return None
+        if version_id is None:
+            return cont.latest(name)
+        for obj in cont.versions[name]:
+            if obj.version_id == version_id and not obj.deleted:
+                return obj
+        return None
+
+    def _large_object_body(self, account, obj):
+        """
+        Returns the assembled body of a large object, or None.
+        """
+        if obj.headers.get('X-Static-Large-Object') == 'True':
+            parts = []
+            for segment in simplejson.loads(obj.body):
+                container, name = segment['name'].lstrip('/').split('/', 1)
+                part = self._find(account, container, name)
+                if part is None:
+                    return None
+                parts.append(part.body)
+            return ''.join(parts)
+        if 'X-Object-Manifest' in obj.headers:
+            container, prefix = obj.headers['X-Object-Manifest'].split('/', 1)
+            cont = self._account(account)[1].get(container)
+            if cont is None:
+                return ''
+            return ''.join(cont.latest(name).body for name in cont.names
+                           if name.startswith(prefix) and cont.latest(name))
+        return None
+
+    def _object(self, req, args, account, container, name):
+        cont = self._account(account)[1].get(container)
+        if cont is None:
+            return Response(status=404)
+        if req.method == 'PUT':
+            return self._put_object(req, args, account, cont, name)
+        if req.method == 'DELETE':
+            obj = cont.latest(name)
+            if obj is None:
+                return Response(status=404)
+            if cont.headers.get('X-Container-Versioning') == 'enabled':
+                cont.add(name, FakeObject('', {}, self._next_version(),
+                                          deleted=True), True)
+            else:
+                cont.remove(name)
+            if args.get('multipart-manifest') == 'delete' and \
+                    obj.headers.get('X-Static-Large-Object') == 'True':
+                for segment in simplejson.loads(obj.body):
+                    seg_container, seg_name = \
+                        segment['name'].lstrip('/').split('/', 1)
+                    seg_cont = self._account(account)[1].get(seg_container)
+                    if seg_cont and seg_cont.latest(seg_name):
+                        seg_cont.remove(seg_name)
+            return Response(status=204)
+
+        obj = self._find(account, container, name, args.get('versionId'))
+        if obj is None:
+            return Response(status=404)
+        if req.method == 'POST':
+            content_type = obj.headers.get('Content-Type')
+            obj.headers = dict(
+                (k, v) for k, v in obj.headers.iteritems()
+                if not k.startswith('X-Object-Meta-'))
+            obj.headers.update(_meta_headers(req.environ,
+                                             ('HTTP_X_OBJECT_META_',)))
+            if content_type:
+                obj.headers['Content-Type'] = content_type
+            return Response(status=202)
+        if req.method not in ('GET', 'HEAD'):
+            return Response(status=405)
+
+        body = obj.body
+        etag = obj.etag
+        if args.get('multipart-manifest') != 'get':
+            large_body = self._large_object_body(account, obj)
+            if large_body is not None:
+                body = large_body
+                if 'X-Static-Large-Object' in obj.headers:
+                    etag = '"%s"' % md5(''.join(
+                        s['hash'] for s in simplejson.loads(obj.body))
+                    ).hexdigest()
+        headers = dict(obj.headers)
+        headers.update({'Etag': etag,
+                        'Last-Modified': formatdate(obj.timestamp,
+                                                    usegmt=True),
+                        'X-Timestamp': '%.5f' % obj.timestamp})
+        if req.if_none_match and etag.strip('"') in req.if_none_match:
+            return Response(status=304, headers=headers)
+        if req.if_match and etag.strip('"') not in req.if_match:
+            return Response(status=412, headers=headers)
+        # swob answers Range requests from the body.
+        return Response(status=200, headers=headers, body=body, request=req,
+                        conditional_response=True)
+
+    def _put_object(self, req, args, account, cont, name):
+        body = req.environ['wsgi.input'].read()
+        headers = _meta_headers(req.environ, ('HTTP_X_OBJECT_META_',
+                                              'HTTP_X_OBJECT_SYSMETA_',
+                                              'HTTP_X_OBJECT_MANIFEST'))
+        headers['Content-Type'] = req.environ.get(
+            'CONTENT_TYPE') or 'application/octet-stream'
+        if 'X-Object-Manifest' in headers:
+            headers['X-Object-Manifest'] = headers.pop('X-Object-Manifest')
+        copy_from = req.headers.get('X-Copy-From')
+        if copy_from:
+            src_container, src_name = \
+                unquote(copy_from).lstrip('/').split('/', 1)
+            src = self._find(account, src_container, src_name)
+            if src is None:
+                return Response(status=404)
+            body = src.body
+            if args.get('multipart-manifest') == 'get':
+                if 'X-Static-Large-Object' in src.headers:
+                    headers['X-Static-Large-Object'] = 'True'
+            else:
+                large_body = self._large_object_body(account, src)
+                if large_body is not None:
+                    body = large_body
+            if req.range:
+                ranges = req.range.ranges_for_length(len(body))
+                if not ranges:
+                    return Response(status=416)
+                body = body[ranges[0][0]:ranges[0][1]]
+            if not any(k.startswith('X-Object-Meta-') for k in headers):
+                headers.update((k, v) for k, v in src.headers.iteritems()
+                               if k.startswith('X-Object-Meta-'))
+        if args.get('multipart-manifest') == 'put':
+            manifest = []
+            for segment in simplejson.loads(body):
+                seg_container, seg_name = \
+                    segment['path'].lstrip('/').split('/', 1)
+                part = self._find(account, seg_container, seg_name)
+                if part is None or part.etag != segment['etag'] or \
+                        len(part.body) != segment['size_bytes']:
+                    return Response(status=400)
+                manifest.append({'name': segment['path'],
+                                 'hash': part.etag,
+                                 'bytes': len(part.body)})
+            body = simplejson.dumps(manifest)
+            headers['X-Static-Large-Object'] = 'True'
+        etag = md5(body).hexdigest()
+        if req.headers.get('Etag', etag).strip('"') != etag:
+            return Response(status=422)
+        cont.add(name, FakeObject(body, headers, self._next_version()),
+                 cont.headers.get('X-Container-Versioning') == 'enabled')
+        return Response(status=201, headers={'Etag': etag})
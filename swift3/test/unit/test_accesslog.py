@@ -0,0 +1,134 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+
+import eventlet
+
+from swift.common.swob import Request, Response
+
+from swift3.accesslog import AccessLogger, format_record, get_request_line
+from swift3.stats import RequestStats
+
+
+class FakeBackend(object):
+    def __init__(self, target='logs'):
+        self.target = target
+        self.calls = []
+
+    def __call__(self, env, start_response):
+        self.calls.append((env['REQUEST_METHOD'], env['PATH_INFO'],
+                           env['wsgi.input'].read()))
+        if env['REQUEST_METHOD'] == 'HEAD':
+            headers = {}
+            if self.target:
+                headers['X-Container-Meta-S3-Logging-Target-Bucket'] = \
+                    self.target
+            return Response(status=204, headers=headers)(env, start_response)
+        return Response(status=201)(env, start_response)
+
+
+def _request(path='/v1/AUTH_test/bucket/obj', operation='GetObject'):
+    env = Request.blank(path, headers={
+        'Authorization': 'AWS test:tester:hmac',
+        'User-Agent': 'boto'}).environ
+    env['REMOTE_ADDR'] = '10.0.0.1'
+    stats = RequestStats()
+    stats.operation = operation
+    stats.bucket = 'bucket'
+    stats.key = 'obj'
+    stats.status = 200
+    stats.response_bytes = 4
+    return env, stats
+
+
+class TestAccessLog(unittest.TestCase):
+    def test_format_record(self):
+        env = Request.blank('/bucket/my obj?acl').environ
+        line = get_request_line(env)
+        self.assertEquals(line, 'GET /bucket/my%20obj?acl HTTP/1.0')
+        env, stats = _request()
+        stats.operation = 'GetObjectAcl'
+        stats.key = 'my obj'
+        env['swift3.request_id'] = 'tx1'
+        fields = format_record(env, stats, 'AUTH_test', line).split(' ')
+        self.assertEquals(fields[:2], ['AUTH_test', 'bucket'])
+        self.assertEquals(fields[4:9], ['10.0.0.1', 'test:tester', 'tx1',
+                                        'REST.GET.ACL', 'my%20obj'])
+        self.assertEquals(fields[12:15], ['200', '-', '4'])
+        self.assertEquals(fields[-3:], ['"-"', '"boto"', '-\n'])
+
+    def test_buffer_and_flush(self):
+        app = FakeBackend()
+        logger = AccessLogger(app, {})
+        for i in range(3):
+            env, stats = _request()
+            logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        self.assertEquals(app.calls, [])
+        self.assertTrue(logger.buffered_bytes > 0)
+        logger.flush()
+        self.assertEquals(logger.buffered_bytes, 0)
+        self.assertEquals([c[:2] for c in app.calls][0],
+                          ('HEAD', '/v1/AUTH_test/bucket'))
+        self.assertEquals(app.calls[1][0], 'PUT')
+        self.assertTrue(app.calls[1][1].startswith('/v1/AUTH_test/logs/'))
+        self.assertEquals(len(app.calls[1][2].splitlines()), 3)
+
+        # Requests rejected before reaching Swift have no known account.
+        env, stats = _request('/bucket/obj')
+        logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        self.assertEquals(logger.buffers, {})
+
+    def test_logging_disabled(self):
+        app = FakeBackend(target=None)
+        logger = AccessLogger(app, {})
+        env, stats = _request()
+        logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        logger.flush()
+        self.assertEquals([c[0] for c in app.calls], ['HEAD'])
+        # Known to be disabled, the records are not even buffered.
+        logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        self.assertEquals(logger.buffers, {})
+        # Until the configuration changes.
+        stats.operation = 'PutBucketLogging'
+        logger.log(env, stats, 'PUT /bucket?logging HTTP/1.1')
+        self.assertEquals(len(logger.buffers), 1)
+
+    def test_max_bytes(self):
+        logger = AccessLogger(FakeBackend(), {'access_log_max_bytes': '300'})
+        for i in range(10):
+            env, stats = _request()
+            logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        self.assertTrue(logger.buffered_bytes <= 300)
+        self.assertTrue(logger.dropped > 0)
+
+    def test_flush_on_size(self):
+        app = FakeBackend()
+        logger = AccessLogger(app, {'access_log_flush_bytes': '1',
+                                    'access_log_flush_interval': '60'})
+        env, stats = _request()
+        logger.log(env, stats, 'GET /bucket/obj HTTP/1.1')
+        self.assertEquals(app.calls, [])
+        start = time.time()
+        while len(app.calls) < 2 and time.time() - start < 5:
+            eventlet.sleep(0.01)
+        self.assertEquals([c[0] for c in app.calls], ['HEAD', 'PUT'])
+        logger._flusher.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift3 import breaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        cb = breaker.CircuitBreaker(3, window=10, open_time=30)
+        for i in range(2):
+            cb.allow('a/b')
+            cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.CLOSED)
+        cb.record('a/b', True)
+        # a success resets the count
+        for i in range(2):
+            cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.CLOSED)
+        cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.OPEN)
+        self.assertRaises(breaker.CircuitOpen, cb.allow, 'a/b')
+        # other buckets are not affected
+        cb.allow('a/c')
+
+    def test_window(self):
+        cb = breaker.CircuitBreaker(2, window=-1)
+        for i in range(5):
+            cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.CLOSED)
+
+    def test_half_open(self):
+        cb = breaker.CircuitBreaker(1, open_time=0)
+        cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.OPEN)
+        cb.allow('a/b')
+        self.assertEquals(cb.state('a/b'), breaker.HALF_OPEN)
+        # only one probe at a time
+        self.assertRaises(breaker.CircuitOpen, cb.allow, 'a/b')
+        cb.record('a/b', False)
+        self.assertEquals(cb.state('a/b'), breaker.OPEN)
+        cb.allow('a/b')
+        cb.cancel('a/b')
+        self.assertEquals(cb.state('a/b'), breaker.OPEN)
+        cb.allow('a/b')
+        cb.record('a/b', True)
+        self.assertEquals(cb.state('a/b'), breaker.CLOSED)
+        self.assertEquals(cb.circuits, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift3.cache import ObjectCache, NegativeCache
+from test_ratelimit import FakeMemcache
+
+
+class TestObjectCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ObjectCache(10, max_object_size=5)
+        cache.put('a', 'e', {}, 'aaaa')
+        cache.put('b', 'e', {}, 'bbbb')
+        self.assertEquals(cache.get('a'), ('e', {}, 'aaaa'))
+        cache.put('c', 'e', {}, 'cccc')
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('a'), ('e', {}, 'aaaa'))
+        self.assertEquals(cache.bytes, 8)
+
+    def test_too_large(self):
+        cache = ObjectCache(10, max_object_size=5)
+        cache.put('a', 'e', {}, 'aaaaaa')
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(cache.bytes, 0)
+
+    def test_invalidate(self):
+        cache = ObjectCache(10)
+        cache.put('a', 'e', {}, 'aaaa')
+        cache.put('a', 'e', {}, 'aa')
+        self.assertEquals(cache.bytes, 2)
+        cache.invalidate('a')
+        cache.invalidate('b')
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(cache.bytes, 0)
+
+
+class TestNegativeCache(unittest.TestCase):
+    def test_local(self):
+        cache = NegativeCache(60, max_entries=2)
+        cache.set({}, 'a/b', 'test:tester')
+        self.assertEquals(cache.get({}, 'a/b'), 'test:tester')
+        cache.invalidate({}, 'a/b')
+        self.assertEquals(cache.get({}, 'a/b'), None)
+        for key in ('a/1', 'a/2', 'a/3'):
+            cache.set({}, key, 'test:tester')
+        self.assertEquals(cache.get({}, 'a/1'), None)
+        self.assertEquals(cache.get({}, 'a/3'), 'test:tester')
+
+    def test_expired(self):
+        cache = NegativeCache(-1)
+        cache.set({}, 'a/b', 'test:tester')
+        self.assertEquals(cache.get({}, 'a/b'), None)
+
+    def test_shared(self):
+        env = {'swift.cache': FakeMemcache()}
+        cache = NegativeCache(60, shared=True)
+        cache.set(env, 'a/b', 'test:tester')
+        self.assertEquals(cache.entries, {})
+        self.assertEquals(cache.get(env, 'a/b'), 'test:tester')
+        cache.invalidate(env, 'a/b')
+        self.assertEquals(cache.get(env, 'a/b'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
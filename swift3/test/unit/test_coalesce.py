@@ -0,0 +1,63 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import eventlet
+
+from swift3.coalesce import Coalescer
+
+
+class TestCoalescer(unittest.TestCase):
+    def test_shares_inflight_call(self):
+        coalescer = Coalescer()
+        calls = []
+
+        def func(value):
+            calls.append(value)
+            eventlet.sleep(0.01)
+            return value
+
+        threads = [eventlet.spawn(coalescer.call, key, func, key)
+                   for key in ('a', 'a', 'b', 'a')]
+        self.assertEquals([t.wait() for t in threads], ['a', 'a', 'b', 'a'])
+        self.assertEquals(calls, ['a', 'b'])
+        self.assertEquals(coalescer.shared_calls, 2)
+        self.assertEquals(coalescer.inflight, {})
+
+        # calls made after completion are not shared
+        self.assertEquals(coalescer.call('a', func, 'c'), 'c')
+
+    def test_failed_call_not_shared(self):
+        coalescer = Coalescer()
+        calls = []
+
+        def func(fail):
+            calls.append(fail)
+            eventlet.sleep(0.01)
+            if fail:
+                raise ValueError()
+            return 'ok'
+
+        first = eventlet.spawn(coalescer.call, 'a', func, True)
+        second = eventlet.spawn(coalescer.call, 'a', func, False)
+        self.assertRaises(ValueError, first.wait)
+        self.assertEquals(second.wait(), 'ok')
+        self.assertEquals(calls, [True, False])
+        self.assertEquals(coalescer.inflight, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import tempfile
+
+from swift3 import credentials
+
+
+class FakeMemcache(object):
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+
+class TestCredentials(unittest.TestCase):
+    def test_memory_store_expires(self):
+        store = credentials.MemoryCredentialStore(ttl=-1)
+        store.set_secret('test:tester', 'testing')
+        self.assertEquals(store.get_secret({}, 'test:tester'), None)
+
+        store = credentials.MemoryCredentialStore(ttl=60)
+        store.set_secret('test:tester', 'testing')
+        self.assertEquals(store.get_secret({}, 'test:tester'), 'testing')
+        store.invalidate('test:tester')
+        self.assertEquals(store.get_secret({}, 'test:tester'), None)
+
+    def test_memcache_store(self):
+        memcache = FakeMemcache()
+        memcache.store['swift3/credential/test:tester'] = 'testing'
+        store = credentials.MemcacheCredentialStore()
+        env = {'swift.cache': memcache}
+        self.assertEquals(store.get_secret(env, 'test:tester'), 'testing')
+        self.assertEquals(store.get_secret(env, 'test:other'), None)
+        self.assertEquals(store.get_secret({}, 'test:tester'), None)
+
+    def test_file_store(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, '# comment\ntest:tester testing\nbroken\n')
+        os.close(fd)
+        try:
+            store = credentials.get_credential_store(
+                {'credential_store': 'file', 'credential_file': path})
+            self.assertEquals(store.get_secret({}, 'test:tester'), 'testing')
+            self.assertEquals(store.get_secret({}, 'broken'), None)
+        finally:
+            os.unlink(path)
+        self.assertEquals(store.get_secret({}, 'test:tester'), None)
+
+    def test_unknown_store(self):
+        self.assertRaises(ValueError, credentials.get_credential_store,
+                          {'credential_store': 'ldap'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+from hashlib import md5
+import unittest
+import xml.dom.minidom
+
+import simplejson
+
+from swift.common.swob import Request
+
+from swift3 import middleware as swift3
+from helpers import FakeSwift
+
+
+class TestFakeSwift(unittest.TestCase):
+    def setUp(self):
+        self.swift = FakeSwift()
+        self.swift.create_container('AUTH_test', 'bucket')
+        for name in ('a', 'b/1', 'b/2', 'c/1', 'd'):
+            self.swift.put_object('AUTH_test', 'bucket', name, name * 10)
+
+    def _request(self, path, method='GET', **kwargs):
+        return Request.blank(path, environ={'REQUEST_METHOD': method},
+                             **kwargs).get_response(self.swift)
+
+    def _names(self, query):
+        resp = self._request('/v1/AUTH_test/bucket?format=json&' + query)
+        self.assertEquals(resp.status_int, 200)
+        return [o.get('name') or o['subdir']
+                for o in simplejson.loads(resp.body)]
+
+    def test_container_listing(self):
+        self.assertEquals(self._names(''), ['a', 'b/1', 'b/2', 'c/1', 'd'])
+        self.assertEquals(self._names('delimiter=/'), ['a', 'b/', 'c/', 'd'])
+        self.assertEquals(self._names('delimiter=/&marker=b/'),
+                          ['c/', 'd'])
+        self.assertEquals(self._names('prefix=b/&limit=1'), ['b/1'])
+        self.assertEquals(self._names('marker=a&end_marker=c'),
+                          ['b/1', 'b/2'])
+        resp = self._request('/v1/AUTH_test/bucket', 'HEAD')
+        self.assertEquals(resp.headers['X-Container-Object-Count'], '5')
+        self.assertEquals(resp.headers['X-Container-Bytes-Used'], '110')
+
+    def test_account_listing(self):
+        self.swift.create_container('AUTH_test', 'another')
+        resp = self._request('/v1/AUTH_test?format=json')
+        self.assertEquals([(c['name'], c['count'])
+                           for c in simplejson.loads(resp.body)],
+                          [('another', 0), ('bucket', 5)])
+        self.assertEquals(resp.headers['X-Account-Container-Count'], '2')
+
+    def test_container_metadata(self):
+        resp = self._request('/v1/AUTH_test/bucket', 'POST', headers={
+            'X-Container-Read': '.r:*', 'X-Container-Meta-Color': 'blue'})
+        self.assertEquals(resp.status_int, 204)
+        resp = self._request('/v1/AUTH_test/bucket', 'HEAD')
+        self.assertEquals(resp.headers['X-Container-Read'], '.r:*')
+        self.assertEquals(resp.headers['X-Container-Meta-Color'], 'blue')
+        self._request('/v1/AUTH_test/bucket', 'POST',
+                      headers={'X-Container-Meta-Color': ''})
+        resp = self._request('/v1/AUTH_test/bucket', 'HEAD')
+        self.assertFalse('X-Container-Meta-Color' in resp.headers)
+        resp = self._request('/v1/AUTH_test/bucket', 'DELETE')
+        self.assertEquals(resp.status_int, 409)
+
+    def test_range_and_conditional(self):
+        resp = self._request('/v1/AUTH_test/bucket/d',
+                             headers={'Range': 'bytes=2-4'})
+        self.assertEquals(resp.status_int, 206)
+        self.assertEquals(resp.body, 'ddd')
+        self.assertEquals(resp.headers['Content-Range'], 'bytes 2-4/10')
+        resp = self._request('/v1/AUTH_test/bucket/d',
+                             headers={'Range': 'bytes=20-30'})
+        self.assertEquals(resp.status_int, 416)
+        etag = self._request('/v1/AUTH_test/bucket/d', 'HEAD').etag
+        resp = self._request('/v1/AUTH_test/bucket/d',
+                             headers={'If-None-Match': etag})
+        self.assertEquals(resp.status_int, 304)
+        resp = self._request('/v1/AUTH_test/bucket/d',
+                             headers={'If-Match': '"nope"'})
+        self.assertEquals(resp.status_int, 412)
+
+    def test_versions(self):
+        self._request('/v1/AUTH_test/bucket', 'POST',
+                      headers={'X-Container-Versioning': 'enabled'})
+        self._request('/v1/AUTH_test/bucket/a', 'PUT', body='new')
+        self.assertEquals(self._request('/v1/AUTH_test/bucket/a').body, 'new')
+        self._request('/v1/AUTH_test/bucket/a', 'DELETE')
+        self.assertEquals(self._request('/v1/AUTH_test/bucket/a').status_int,
+                          404)
+        self.assertEquals(self._names('prefix=a'), [])
+        resp = self._request(
+            '/v1/AUTH_test/bucket?format=json&prefix=a&versions')
+        versions = simplejson.loads(resp.body)
+        self.assertEquals([(v['deleted'], v['is_latest'], v['bytes'])
+                           for v in versions],
+                          [(True, True, 0), (False, False, 3),
+                           (False, False, 10)])
+        resp = self._request('/v1/AUTH_test/bucket/a?versionId=%s' %
+                             versions[1]['version_id'])
+        self.assertEquals(resp.body, 'new')
+
+    def test_static_large_object(self):
+        manifest = simplejson.dumps([
+            {'path': '/bucket/a', 'etag': md5('a' * 10).hexdigest(),
+             'size_bytes': 10},
+            {'path': '/bucket/d', 'etag': md5('d' * 10).hexdigest(),
+             'size_bytes': 10}])
+        resp = self._request('/v1/AUTH_test/bucket/slo?multipart-manifest=put',
+                             'PUT', body=manifest)
+        self.assertEquals(resp.status_int, 201)
+        resp = self._request('/v1/AUTH_test/bucket?format=json&prefix=slo')
+        entry = simplejson.loads(resp.body)[0]
+        self.assertEquals(entry['bytes'], 20)
+        self.assertEquals(self._request('/v1/AUTH_test/bucket/slo').body,
+                          'a' * 10 + 'd' * 10)
+
+        self._request('/v1/AUTH_test/bucket/copy', 'PUT',
+                      headers={'X-Copy-From': '/bucket/slo'})
+        resp = self._request('/v1/AUTH_test/bucket/copy')
+        self.assertEquals(resp.body, 'a' * 10 + 'd' * 10)
+        self.assertFalse('X-Static-Large-Object' in resp.headers)
+        self._request('/v1/AUTH_test/bucket/copy?multipart-manifest=get',
+                      'PUT', headers={'X-Copy-From': '/bucket/slo'})
+        resp = self._request('/v1/AUTH_test/bucket/copy')
+        self.assertEquals(resp.body, 'a' * 10 + 'd' * 10)
+        self.assertEquals(resp.headers['X-Static-Large-Object'], 'True')
+
+    def test_latency_and_errors(self):
+        swift = FakeSwift(latency=0.01, error_rate=0.5, seed=1)
+        swift.create_container('AUTH_test', 'bucket')
+        start = time.time()
+        statuses = [Request.blank('/v1/AUTH_test/bucket').get_response(
+            swift).status_int for i in range(20)]
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertTrue(0 < statuses.count(503) < 20)
+        self.assertTrue(set(statuses) <= set([204, 503]))
+
+    def test_swift3_multipart_upload(self):
+        # Without an auth middleware the account is the access key.
+        self.swift.create_container('test:tester', 'bucket')
+        app = swift3.filter_factory({'min_part_size': '1'})(self.swift)
+
+        def s3(path, method='GET', body=None):
+            req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                                headers={'Authorization':
+                                         'AWS test:tester:hmac'},
+                                body=body)
+            resp = req.get_response(app)
+            return resp.status_int, resp.body
+
+        status, body = s3('/bucket/big?uploads', 'POST')
+        self.assertEquals(status, 200)
+        upload_id = xml.dom.minidom.parseString(body).getElementsByTagName(
+            'UploadId')[0].firstChild.data
+        etags = []
+        for number in (1, 2):
+            req = Request.blank(
+                '/bucket/big?partNumber=%d&uploadId=%s' % (number, upload_id),
+                environ={'REQUEST_METHOD': 'PUT'}, body=str(number) * 5,
+                headers={'Authorization': 'AWS test:tester:hmac'})
+            resp = req.get_response(app)
+            self.assertEquals(resp.status_int, 200)
+            etags.append(resp.etag)
+        body = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % \
+            ''.join('<Part><PartNumber>%d</PartNumber><ETag>%s</ETag></Part>'
+                    % (i + 1, etag) for i, etag in enumerate(etags))
+        status, _ = s3('/bucket/big?uploadId=%s' % upload_id, 'POST', body)
+        self.assertEquals(status, 200)
+        self.assertEquals(s3('/bucket/big'), (200, '1111122222'))
+        status, body = s3('/bucket?delimiter=/&prefix=b')
+        self.assertEquals(status, 200)
+        keys = [k.firstChild.data for k in xml.dom.minidom.parseString(
+            body).getElementsByTagName('Key')]
+        self.assertEquals(keys, ['big'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift3 import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = metrics.Histogram((1, 10))
+        for value in (0, 1, 5, 100):
+            histogram.observe(value)
+        self.assertEquals(histogram.counts, [2, 1, 1])
+        self.assertEquals((histogram.count, histogram.sum), (4, 106))
+
+    def test_render(self):
+        registry = metrics.MetricsRegistry()
+        registry.observe('GetObject', 200, 0.003, 1000, 1)
+        registry.observe('GetObject', 200, 0.5, 10, 1)
+        registry.observe('DeleteObjects', 200, 0.1, 100, 40)
+        lines = registry.render().splitlines()
+        self.assertTrue('# TYPE swift3_backend_calls histogram' in lines)
+        self.assertTrue('swift3_request_duration_seconds_bucket{'
+                        'operation="GetObject",status="200",le="0.004"} 1'
+                        in lines)
+        self.assertTrue('swift3_request_duration_seconds_count{'
+                        'operation="GetObject",status="200"} 2' in lines)
+        self.assertTrue('swift3_backend_calls_bucket{'
+                        'operation="DeleteObjects",status="200",le="32.0"} 0'
+                        in lines)
+        self.assertTrue('swift3_backend_calls_bucket{'
+                        'operation="DeleteObjects",status="200",le="+Inf"} 1'
+                        in lines)
+
+    def test_render_gauges(self):
+        registry = metrics.MetricsRegistry()
+        lines = registry.render([('swift3_queued', 'Queued calls', 3)])
+        self.assertTrue('# TYPE swift3_queued gauge\nswift3_queued 3\n'
+                        in lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift3.prefetch import ListingPrefetcher
+
+
+class TestListingPrefetcher(unittest.TestCase):
+    def test_hit(self):
+        prefetcher = ListingPrefetcher(ttl=60)
+        prefetcher.prefetch('a', lambda: 'page')
+        prefetcher.prefetch('a', lambda: 'other')
+        self.assertEquals(prefetcher.issued, 1)
+        self.assertEquals(prefetcher.get('a'), 'page')
+        self.assertEquals(prefetcher.get('a'), None)
+        self.assertEquals((prefetcher.hits, prefetcher.wasted), (1, 0))
+
+    def test_wasted(self):
+        prefetcher = ListingPrefetcher(ttl=-1)
+        prefetcher.prefetch('a', lambda: 'page')
+        self.assertEquals(prefetcher.get('a'), None)
+        self.assertEquals(prefetcher.pages, {})
+
+        def fail():
+            raise ValueError()
+        prefetcher.ttl = 60
+        prefetcher.prefetch('b', fail)
+        prefetcher.prefetch('c', lambda: None)
+        self.assertEquals(prefetcher.get('b'), None)
+        self.assertEquals(prefetcher.get('c'), None)
+        self.assertEquals((prefetcher.hits, prefetcher.wasted), (0, 3))
+
+    def test_max_pages(self):
+        prefetcher = ListingPrefetcher(ttl=60, max_pages=1)
+        prefetcher.prefetch('a', lambda: 'page')
+        prefetcher.prefetch('b', lambda: 'page')
+        self.assertEquals(prefetcher.pages.keys(), ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from swift.common.swob import Request
+
+from swift3.profiling import RequestProfiler
+from swift3.stats import RequestStats
+
+
+class TestRequestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _env(self, path, method='GET'):
+        return Request.blank(path, environ={'REQUEST_METHOD': method}).environ
+
+    def test_should_profile(self):
+        profiler = RequestProfiler({'profile_dir': self.directory,
+                                    'profile_sample_rate': '3',
+                                    'profile_operations': 'ListObjects',
+                                    'profile_buckets': 'hot'})
+        self.assertEquals(
+            [profiler.should_profile(self._env('/b/o')) for i in range(3)],
+            [False, False, True])
+        self.assertTrue(profiler.should_profile(self._env('/b')))
+        self.assertFalse(profiler.should_profile(self._env('/b', 'PUT')))
+        self.assertTrue(profiler.should_profile(self._env('/hot/o', 'PUT')))
+
+    def test_one_profile_at_a_time(self):
+        profiler = RequestProfiler({'profile_dir': self.directory,
+                                    'profile_sample_rate': '1'})
+        profile = profiler.start()
+        self.assertFalse(profiler.should_profile(self._env('/b/o')))
+        profiler.stop(profile, RequestStats())
+        self.assertTrue(profiler.should_profile(self._env('/b/o')))
+
+    def test_dump_and_rotate(self):
+        profiler = RequestProfiler({'profile_dir': self.directory,
+                                    'profile_max_files': '2'})
+        for i in range(3):
+            stats = RequestStats()
+            stats.operation = 'GetObject'
+            stats.start -= i
+            profiler.stop(profiler.start(), stats)
+        files = os.listdir(self.directory)
+        self.assertEquals(len(files), 2)
+        self.assertTrue(all(f.startswith('GetObject-') for f in files))
+
+    def test_slow_threshold(self):
+        profiler = RequestProfiler({'profile_dir': self.directory,
+                                    'profile_slow_threshold': '1'})
+        stats = RequestStats()
+        profiler.stop(profiler.start(), stats)
+        self.assertEquals(os.listdir(self.directory), [])
+        stats.start -= 2
+        profiler.stop(profiler.start(), stats)
+        self.assertEquals(len(os.listdir(self.directory)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift.common.memcached import MemcacheConnectionError
+
+from swift3 import ratelimit
+
+
+class FakeMemcache(object):
+    def __init__(self):
+        self.store = {}
+
+    def incr(self, key, delta=1, time=0):
+        self.store[key] = int(self.store.get(key, 0)) + delta
+        return self.store[key]
+
+    def decr(self, key, delta=1, time=0):
+        return self.incr(key, -delta, time)
+
+    def set(self, key, value, serialize=True, time=0):
+        self.store[key] = value
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class DownMemcache(object):
+    def incr(self, key, delta=1, time=0):
+        raise MemcacheConnectionError('No memcached connections succeeded.')
+
+    decr = set = incr
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_operation_class(self):
+        get_class = ratelimit.get_operation_class
+        self.assertEquals(get_class('GET', None, None, {}), 'list')
+        self.assertEquals(get_class('GET', 'b', None, {}), 'list')
+        self.assertEquals(get_class('GET', 'b', None, {'acl': ''}), 'read')
+        self.assertEquals(get_class('GET', 'b', 'o', {}), 'read')
+        self.assertEquals(get_class('HEAD', 'b', 'o', {}), 'read')
+        self.assertEquals(get_class('PUT', 'b', 'o', {}), 'write')
+        self.assertEquals(get_class('DELETE', 'b', 'o', {}), 'delete')
+        self.assertEquals(get_class('POST', 'b', None, {'delete': ''}),
+                          'delete')
+
+    def test_disabled(self):
+        limiter = ratelimit.RateLimiter({})
+        self.assertFalse(limiter)
+        for i in range(100):
+            self.assertEquals(
+                limiter.get_retry_after({}, 'test:tester', 'read'), 0)
+
+    def _test_burst(self, env):
+        limiter = ratelimit.RateLimiter({'ratelimit_write': '1',
+                                         'ratelimit_buffer_seconds': '2'})
+        self.assertTrue(limiter)
+        for i in range(3):
+            self.assertEquals(
+                limiter.get_retry_after(env, 'test:tester', 'write'), 0)
+        self.assertEquals(
+            limiter.get_retry_after(env, 'test:tester', 'write'), 1)
+        # other keys and classes have their own buckets
+        self.assertEquals(
+            limiter.get_retry_after(env, 'test:other', 'write'), 0)
+        self.assertEquals(
+            limiter.get_retry_after(env, 'test:tester', 'read'), 0)
+
+    def test_local_burst(self):
+        self._test_burst({})
+
+    def test_memcache_burst(self):
+        memcache = FakeMemcache()
+        self._test_burst({'swift.cache': memcache})
+        self.assertTrue(
+            'swift3/ratelimit/test:tester/write' in memcache.store)
+
+    def test_memcache_down(self):
+        # the buckets of the worker are used instead
+        self._test_burst({'swift.cache': DownMemcache()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import eventlet
+from eventlet import Timeout
+from greenlet import GreenletExit
+
+from swift3 import scheduler
+
+
+class TestFairScheduler(unittest.TestCase):
+    def test_parse_weights(self):
+        self.assertEquals(scheduler.parse_weights(''), {})
+        self.assertEquals(scheduler.parse_weights('a=2, b = 3,c=0'),
+                          {'a': 2, 'b': 3, 'c': 1})
+
+    def test_inflight_limit(self):
+        sched = scheduler.FairScheduler(2)
+        sched.acquire('a')
+        sched.acquire('b')
+        self.assertEquals(sched.stats()['inflight'], 2)
+        sched.release()
+        sched.release()
+        self.assertEquals(sched.stats()['inflight'], 0)
+
+    def test_weighted_round_robin(self):
+        sched = scheduler.FairScheduler(1, weights={'heavy': 2})
+        order = []
+
+        def call(account):
+            sched.acquire(account)
+            order.append(account)
+            sched.release()
+
+        sched.acquire('x')
+        pool = eventlet.GreenPool()
+        for i in range(4):
+            pool.spawn(call, 'heavy')
+        for i in range(2):
+            pool.spawn(call, 'light')
+        eventlet.sleep(0)
+        self.assertEquals(sched.stats()['queues'], {'heavy': 4, 'light': 2})
+        self.assertEquals(sched.gauges(), [
+            ('swift3_scheduler_inflight', 'Backend calls in flight', 1),
+            ('swift3_scheduler_queued', 'Backend calls waiting for a slot',
+             6)])
+        sched.release()
+        pool.waitall()
+        self.assertEquals(order, ['heavy', 'heavy', 'light',
+                                  'heavy', 'heavy', 'light'])
+        self.assertEquals(sched.stats()['inflight'], 0)
+        self.assertEquals(sched.stats()['queued_calls'], 6)
+
+    def test_queue_timeout(self):
+        sched = scheduler.FairScheduler(1, queue_timeout=0.01)
+        sched.acquire('a')
+        self.assertRaises(scheduler.SchedulerTimeout, sched.acquire, 'b')
+        stats = sched.stats()
+        self.assertEquals(stats['queued'], 0)
+        self.assertEquals(stats['shed_calls'], 1)
+        sched.release()
+        self.assertEquals(sched.stats()['inflight'], 0)
+
+
+    def test_interrupted_wait(self):
+        sched = scheduler.FairScheduler(1)
+        sched.acquire('a')
+        for exc in (Timeout(), GreenletExit()):
+            waiter = eventlet.spawn(sched.acquire, 'b')
+            eventlet.sleep(0)
+            self.assertEquals(sched.stats()['queued'], 1)
+            waiter.kill(exc)
+            self.assertEquals(sched.stats()['queued'], 0)
+        # the slot is not handed to a dead waiter
+        sched.release()
+        self.assertEquals(sched.stats()['inflight'], 0)
+        sched.acquire('a')
+        self.assertEquals(sched.stats()['inflight'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
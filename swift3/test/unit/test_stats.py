@@ -0,0 +1,76 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from swift3 import stats
+
+
+class TestStats(unittest.TestCase):
+    def test_operation_name(self):
+        name = stats.get_operation_name
+        self.assertEquals(name('GET', None, None, {}, {}), 'ListBuckets')
+        self.assertEquals(name('GET', 'b', None, {}, {}), 'ListObjects')
+        self.assertEquals(name('GET', 'b', None, {'acl': ''}, {}),
+                          'GetBucketAcl')
+        self.assertEquals(name('GET', 'b', None, {'uploads': ''}, {}),
+                          'ListMultipartUploads')
+        self.assertEquals(name('POST', 'b', None, {'delete': ''}, {}),
+                          'DeleteObjects')
+        self.assertEquals(name('PUT', 'b', None, {}, {}), 'CreateBucket')
+        self.assertEquals(name('GET', 'b', 'o', {}, {}), 'GetObject')
+        self.assertEquals(name('HEAD', 'b', 'o', {}, {}), 'HeadObject')
+        self.assertEquals(name('PUT', 'b', 'o', {}, {}), 'PutObject')
+        self.assertEquals(name('PUT', 'b', 'o', {},
+                               {'x-amz-copy-source': '/b/s'}), 'CopyObject')
+        self.assertEquals(name('PUT', 'b', 'o', {'uploadId': 'x'},
+                               {'x-amz-copy-source': '/b/s'}),
+                          'UploadPartCopy')
+        self.assertEquals(name('POST', 'b', 'o', {'uploadId': 'x'}, {}),
+                          'CompleteMultipartUpload')
+        self.assertEquals(name('DELETE', 'b', 'o', {'uploadId': 'x'}, {}),
+                          'AbortMultipartUpload')
+        self.assertEquals(name('DELETE', 'b', 'o', {}, {}), 'DeleteObject')
+
+    def test_request_stats(self):
+        request_stats = stats.RequestStats()
+        request_stats.operation = 'GetObject'
+        request_stats.mark('parse')
+        request_stats.add('backend', 0.5)
+        request_stats.add('backend', 0.25)
+        aggregator = stats.StatsAggregator()
+        request_stats.emit(aggregator)
+        self.assertEquals(aggregator.timings['GetObject.backend'],
+                          (1, 750.0, 750.0))
+        self.assertEquals(sorted(aggregator.timings),
+                          ['GetObject.backend', 'GetObject.parse',
+                           'GetObject.request'])
+
+    def test_describe(self):
+        request_stats = stats.RequestStats()
+        request_stats.operation = 'GetObject'
+        request_stats.bucket = 'bucket'
+        request_stats.key = 'a b'
+        request_stats.status = 200
+        request_stats.add('backend', 0.5)
+        line = request_stats.describe()
+        self.assertTrue(line.startswith(
+            'operation=GetObject bucket=bucket key=a%20b status=200 '
+            'backend_calls=0 listing_entries=0 bytes_out=0 total='))
+        self.assertTrue(line.endswith(' backend=0.5000'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,15 +17,23 @@ import unittest
 from datetime import datetime
 import cgi
 import hashlib
+import os
+import tempfile
+import time
+import email.utils
+from StringIO import StringIO
 
 import xml.dom.minidom
 import simplejson
+import eventlet
 
 from swift.common.swob import Request, Response, HTTPUnauthorized, \
     HTTPCreated,HTTPNoContent, HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
     HTTPConflict, HTTPForbidden
 
 from swift3 import middleware as swift3
+from swift3.utils import get_signature
+from helpers import FakeSwift
 
 
 class FakeApp(object):
@@ -130,6 +138,16 @@ class FakeAppBucket(FakeApp):
         return []
 
 
+class UnreadableInput(object):
+    """
+    wsgi.input which must not be read, like one waiting for 100 Continue.
+    """
+    def read(self, *args):
+        raise AssertionError('wsgi.input was read')
+
+    readline = read
+
+
 class FakeAppObject(FakeApp):
     def __init__(self, status=200):
         FakeApp.__init__(self)
@@ -187,6 +205,27 @@ class FakeAppObject(FakeApp):
         return []
 
 
+def fake_swift(containers=None):
+    """
+    Returns a FakeSwift holding containers, a dict of container name to a
+    dict of object name to body, in the account of test:tester.
+    """
+    app = FakeSwift()
+    for container, objects in (containers or {}).iteritems():
+        app.create_container('test:tester', container)
+        for name, body in objects.iteritems():
+            app.put_object('test:tester', container, name, body)
+    return app
+
+
+def stored_objects(app, container):
+    """
+    Returns a dict of the name to body of the objects of a container.
+    """
+    cont = app.accounts['test:tester'][1][container]
+    return dict((name, cont.latest(name).body) for name in cont.names)
+
+
 def start_response(*args):
     pass
 
@@ -219,11 +258,12 @@ class TestSwift3(unittest.TestCase):
         code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
         self.assertEquals(code, 'InvalidURI')
 
-    def _test_method_error(self, cl, method, path, status, headers={}):
+    def _test_method_error(self, cl, method, path, status, headers={},
+                           environ={}):
         local_app = swift3.filter_factory({})(cl(status))
         headers.update({'Authorization': 'AWS test:tester:hmac'})
-        req = Request.blank(path, environ={'REQUEST_METHOD': method},
-                            headers=headers)
+        environ = dict(environ, REQUEST_METHOD=method)
+        req = Request.blank(path, environ=environ, headers=headers)
         resp = local_app(req.environ, start_response)
         dom = xml.dom.minidom.parseString("".join(resp))
         self.assertEquals(dom.firstChild.nodeName, 'Error')
@@ -683,5 +723,1102 @@ class TestSwift3(unittest.TestCase):
         self.assertEquals(req.headers['Authorization'], 'AWS Z:X')
         self.assertEquals(req.headers['Date'], 'Y')
 
+    def _verifying_app(self, app, conf={}):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, 'test:tester secret\n')
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        return swift3.filter_factory(dict(conf, verify_signature='true',
+                                          credential_store='file',
+                                          credential_file=path))(app)
+
+    def _signed_request(self, path, secret, **kwargs):
+        req = Request.blank(path, **kwargs)
+        req.headers['Date'] = email.utils.formatdate(usegmt=True)
+        signature = get_signature(secret, swift3.canonical_string(req))
+        req.headers['Authorization'] = 'AWS test:tester:%s' % signature
+        return req
+
+    def test_verify_signature(self):
+        local_app = self._verifying_app(FakeAppObject())
+        req = self._signed_request('/bucket/object', 'secret',
+                                   environ={'REQUEST_METHOD': 'GET'})
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[0].split()[0], '200')
+        self.assertEquals(req.environ['swift3.verified_access_key'],
+                          'test:tester')
+        # the secret is cached for the following requests
+        self.assertEquals(
+            local_app.credential_cache.get_secret({}, 'test:tester'),
+            'secret')
+
+    def test_verify_signature_mismatch(self):
+        class FakeApp(object):
+            def __call__(self, env, start_response):
+                raise Exception('backend should not be called')
+        local_app = self._verifying_app(FakeApp())
+        req = self._signed_request('/bucket/object', 'wrong',
+                                   environ={'REQUEST_METHOD': 'GET'})
+        resp = local_app(req.environ, start_response)
+        dom = xml.dom.minidom.parseString("".join(resp))
+        code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+        self.assertEquals(code, 'SignatureDoesNotMatch')
+
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = local_app(req.environ, start_response)
+        dom = xml.dom.minidom.parseString("".join(resp))
+        code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+        self.assertEquals(code, 'AccessDenied')
+
+    def test_verify_signature_unknown_key(self):
+        local_app = self._verifying_app(FakeAppObject())
+        req = self._signed_request('/bucket/object', 'secret',
+                                   environ={'REQUEST_METHOD': 'GET'})
+        req.headers['Authorization'] = 'AWS other:user:hmac'
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[0].split()[0], '200')
+        self.assertTrue('swift3.verified_access_key' not in req.environ)
+
+    def test_verify_signature_rotated_key(self):
+        local_app = self._verifying_app(FakeAppObject())
+        local_app.credential_cache.set_secret('test:tester', 'old')
+        req = self._signed_request('/bucket/object', 'secret',
+                                   environ={'REQUEST_METHOD': 'GET'})
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[0].split()[0], '200')
+        self.assertEquals(
+            local_app.credential_cache.get_secret({}, 'test:tester'),
+            'secret')
+
+    def test_x_amz_date(self):
+        local_app = self._verifying_app(FakeAppObject())
+
+        def get(amz_date):
+            req = Request.blank('/bucket/object',
+                                environ={'REQUEST_METHOD': 'GET'},
+                                headers={'X-Amz-Date': amz_date,
+                                         'Date': 'Tue, 27 Mar 2007'})
+            signature = get_signature('secret', swift3.canonical_string(req))
+            req.headers['Authorization'] = 'AWS test:tester:%s' % signature
+            resp = local_app(req.environ, start_response)
+            if resp == local_app.app.object_body:
+                return 'OK'
+            dom = xml.dom.minidom.parseString(''.join(resp))
+            return dom.getElementsByTagName('Code')[0].firstChild.data
+
+        self.assertEquals(get(email.utils.formatdate(usegmt=True)), 'OK')
+        self.assertEquals(get('Tue, 27 Mar 2007 19:36:42 +0000'),
+                          'RequestTimeTooSkewed')
+        self.assertEquals(get('yesterday'), 'AccessDenied')
+
+    def test_ratelimit(self):
+        local_app = swift3.filter_factory({'ratelimit_read': '1',
+                                           'ratelimit_buffer_seconds': '0'})(
+            FakeAppObject())
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[0].split()[0], '200')
+
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        local_app.app.response_args = []
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[0].split()[0], '503')
+        headers = dict(local_app.app.response_args[1])
+        self.assertEquals(headers['Retry-After'], '1')
+        dom = xml.dom.minidom.parseString("".join(resp))
+        code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+        self.assertEquals(code, 'SlowDown')
+
+    def test_ratelimit_verified_keys(self):
+        local_app = self._verifying_app(FakeAppObject(), {
+            'ratelimit_read': '1', 'ratelimit_buffer_seconds': '0'})
+
+        def get(access_key):
+            req = self._signed_request('/bucket/object', 'secret',
+                                       environ={'REQUEST_METHOD': 'GET'})
+            req.headers['Authorization'] = req.headers[
+                'Authorization'].replace('test:tester', access_key)
+            return ''.join(local_app(req.environ, start_response))
+
+        # the auth middleware checks the unknown keys, they are not charged
+        for i in range(3):
+            self.assertEquals(get('other:user'), 'hello')
+        self.assertEquals(get('test:tester'), 'hello')
+        self.assertTrue('SlowDown' in get('test:tester'))
+
+    def test_scheduler_shed(self):
+        local_app = swift3.filter_factory({'scheduler_max_inflight': '1',
+                                           'scheduler_queue_timeout': '0.01'})(
+            FakeAppObject())
+        local_app.scheduler.acquire('other')
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        dom = xml.dom.minidom.parseString("".join(resp))
+        code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+        self.assertEquals(code, 'ServiceUnavailable')
+
+        local_app.scheduler.release()
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'GET'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = local_app(req.environ, local_app.app.do_start_response)
+        self.assertEquals(local_app.app.response_args[-2].split()[0], '200')
+        # the slot is held until the body is closed
+        self.assertEquals(local_app.scheduler.stats()['inflight'], 1)
+        resp.close()
+        self.assertEquals(local_app.scheduler.stats()['inflight'], 0)
+
+    def test_circuit_breaker(self):
+        class FakeApp(object):
+            calls = 0
+            hang = False
+
+            def __call__(self, env, start_response):
+                self.calls += 1
+                if self.hang:
+                    eventlet.sleep(1)
+                start_response('503 Service Unavailable', [])
+                return []
+        app = FakeApp()
+        local_app = swift3.filter_factory({'breaker_threshold': '2'})(app)
+
+        def get_code():
+            req = Request.blank('/bucket/object',
+                                environ={'REQUEST_METHOD': 'GET'},
+                                headers={'Authorization':
+                                         'AWS test:tester:hmac'})
+            resp = local_app(req.environ, start_response)
+            dom = xml.dom.minidom.parseString("".join(resp))
+            return dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+
+        self.assertEquals(get_code(), 'InvalidURI')
+        self.assertEquals(get_code(), 'InvalidURI')
+        self.assertEquals(get_code(), 'ServiceUnavailable')
+        self.assertEquals(app.calls, 2)
+
+        # a probe killed before it completes opens the breaker again
+        local_app.breaker.open_time = 0
+        app.hang = True
+        probe = eventlet.spawn(get_code)
+        eventlet.sleep(0)
+        self.assertEquals(local_app.breaker.state('test:tester/bucket'),
+                          'half-open')
+        probe.kill()
+        self.assertEquals(local_app.breaker.state('test:tester/bucket'),
+                          'open')
+
+    def test_PUT_rejected_before_body_is_read(self):
+        def check(path, headers, expected):
+            code = self._test_method_error(
+                FakeAppObject, 'PUT', path, 201,
+                headers=dict(headers, Expect='100-continue'),
+                environ={'wsgi.input': UnreadableInput()})
+            self.assertEquals(code, expected)
+
+        check('/bucket/object', {'Content-Length': '-1'}, 'InvalidArgument')
+        check('/bucket/object', {'Content-Length': 'a'}, 'InvalidArgument')
+        check('/bucket/object?acl', {'Content-Length': '-1'},
+              'InvalidArgument')
+        check('/bucket/object', {'Content-MD5': 'invalid'}, 'InvalidDigest')
+        check('/bucket/object', {'Content-MD5': 'Zm9v'}, 'InvalidDigest')
+        check('/bucket?acl', {'x-amz-acl': 'authenticated-read'},
+              'Unsupported')
+        check('/bucket?acl', {'x-amz-acl': 'unknown'}, 'InvalidArgument')
+
+    def test_bucket_PUT_canned_acl(self):
+        class FakeApp(object):
+            def __call__(self, env, start_response):
+                self.req = Request(env)
+                start_response('204 No Content', [])
+                return []
+        app = FakeApp()
+        local_app = swift3.filter_factory({})(app)
+        req = Request.blank('/bucket?acl',
+                            environ={'REQUEST_METHOD': 'PUT',
+                                     'wsgi.input': UnreadableInput()},
+                            headers={'Authorization': 'AWS test:tester:hmac',
+                                     'x-amz-acl': 'public-read'})
+        resp = local_app(req.environ, lambda *args: None)
+        self.assertEquals(app.req.method, 'POST')
+        self.assertEquals(app.req.headers['X-Container-Read'],
+                          '.r:*,.rlistings')
+
+    def test_object_PUT_canned_acl(self):
+        class FakeApp(object):
+            def __call__(self, env, start_response):
+                self.req = Request(env)
+                start_response('202 Accepted', [])
+                return []
+        app = FakeApp()
+        local_app = swift3.filter_factory({})(app)
+        req = Request.blank('/bucket/object?acl',
+                            environ={'REQUEST_METHOD': 'PUT',
+                                     'wsgi.input': UnreadableInput()},
+                            headers={'Authorization': 'AWS test:tester:hmac',
+                                     'x-amz-acl': 'public-read'})
+        resp = local_app(req.environ, lambda *args: None)
+        self.assertEquals(app.req.method, 'POST')
+        self.assertEquals(app.req.headers['X-Object-Acl-Read'], '.r:*')
+        self.assertEquals(app.req.headers['X-Object-Acl-Write'], '')
+        self.assertTrue('X-Amz-Acl' not in app.req.headers)
+
+        for acl, expected in (('authenticated-read', 'Unsupported'),
+                              ('bogus', 'InvalidArgument')):
+            code = self._test_method_error(
+                lambda status: app, 'PUT', '/bucket/object', 201,
+                headers={'x-amz-acl': acl},
+                environ={'wsgi.input': UnreadableInput()})
+            self.assertEquals(code, expected)
+
+    def test_object_PUT_too_large(self):
+        code = self._test_method_error(
+            FakeAppObject, 'PUT', '/bucket/object', 201,
+            headers={'Content-Length': str(5 * 1024 ** 3 + 1)},
+            environ={'wsgi.input': UnreadableInput()})
+        self.assertEquals(code, 'EntityTooLarge')
+
+    def test_object_PUT_quota(self):
+        class FakeApp(object):
+            def __init__(self):
+                self.calls = []
+
+            def __call__(self, env, start_response):
+                self.calls.append((env['REQUEST_METHOD'], env['PATH_INFO']))
+                if env['PATH_INFO'] == '/v1/test:tester':
+                    start_response('204 No Content',
+                                   [('X-Account-Bytes-Used', '90'),
+                                    ('X-Account-Meta-Quota-Bytes', '100')])
+                elif env['REQUEST_METHOD'] == 'HEAD':
+                    # no segments container
+                    start_response('404 Not Found', [])
+                else:
+                    start_response('201 Created', [('etag', 'x')])
+                return []
+        app = FakeApp()
+        local_app = swift3.filter_factory({'check_account_quota': 'true'})(
+            app)
+
+        def put(length):
+            req = Request.blank('/bucket/object',
+                                environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Authorization':
+                                         'AWS test:tester:hmac',
+                                         'Content-Length': str(length)})
+            return local_app(req.environ, start_response)
+
+        put(5)
+        self.assertEquals(app.calls,
+                          [('HEAD', '/v1/test:tester'),
+                           ('HEAD', '/v1/test:tester/bucket+segments'),
+                           ('PUT', '/v1/test:tester/bucket/object')])
+        # the usage is cached and the upload accounted for
+        resp = put(6)
+        dom = xml.dom.minidom.parseString("".join(resp))
+        code = dom.getElementsByTagName('Code')[0].childNodes[0].nodeValue
+        self.assertEquals(code, 'QuotaExceeded')
+        self.assertEquals(len(app.calls), 3)
+        put(5)
+        self.assertEquals(len(app.calls), 5)
+
+    def _mpu_request(self, local_app, path, method, body=None, headers={}):
+        headers = dict(headers, Authorization='AWS test:tester:hmac')
+        req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                            headers=headers, body=body)
+        status = []
+        resp = local_app(req.environ, lambda s, h: status.append(s))
+        return status[0].split()[0], ''.join(resp)
+
+    def _initiate_upload(self, local_app):
+        status, body = self._mpu_request(local_app, '/bucket/object?uploads',
+                                         'POST',
+                                         headers={'Content-Type': 'text/x',
+                                                  'x-amz-meta-foo': 'bar'})
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        return dom.getElementsByTagName('UploadId')[0].firstChild.data
+
+    def test_multipart_upload(self):
+        app = fake_swift({'bucket': {}})
+        local_app = swift3.filter_factory({'min_part_size': '2'})(app)
+        upload_id = self._initiate_upload(local_app)
+        self.assertTrue('bucket+segments' in app.accounts['test:tester'][1])
+
+        etags = []
+        for number, data in ((1, 'aa'), (2, 'bb'), (3, 'c')):
+            status, body = self._mpu_request(
+                local_app, '/bucket/object?partNumber=%d&uploadId=%s' %
+                (number, upload_id), 'PUT', body=data)
+            self.assertEquals(status, '200')
+            etags.append(hashlib.md5(data).hexdigest())
+
+        complete = ('<CompleteMultipartUpload>%s</CompleteMultipartUpload>' %
+                    ''.join('<Part><PartNumber>%d</PartNumber>'
+                            '<ETag>"%s"</ETag></Part>' % (i + 1, etag)
+                            for i, etag in enumerate(etags[:2])))
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?uploadId=%s' % upload_id, 'POST',
+            body=complete)
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        etag = dom.getElementsByTagName('ETag')[0].firstChild.data
+        self.assertEquals(etag, '"%s"' % hashlib.md5(
+            ''.join(etags[:2])).hexdigest())
+
+        manifest_put = app.calls[-3]
+        self.assertEquals(manifest_put[:3],
+                          ('PUT', '/v1/test:tester/bucket/object',
+                           'multipart-manifest=put'))
+        manifest = app.get_object('test:tester', 'bucket', 'object')
+        self.assertEquals(
+            [(s['name'], s['bytes'])
+             for s in simplejson.loads(manifest.body)],
+            [('/bucket+segments/p/%s/00001' % upload_id, 2),
+             ('/bucket+segments/p/%s/00002' % upload_id, 2)])
+        self.assertEquals(manifest.headers['Content-Type'], 'text/x')
+        self.assertEquals(manifest.headers['X-Object-Meta-Foo'], 'bar')
+        # the upload record and the unused part are gone
+        self.assertEquals(
+            sorted(stored_objects(app, 'bucket+segments')),
+            ['p/%s/00001' % upload_id, 'p/%s/00002' % upload_id])
+        # HEAD, GET and the bucket listing serve the same ETag
+        req = Request.blank('/bucket/object',
+                            environ={'REQUEST_METHOD': 'HEAD'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        self.assertEquals(req.get_response(local_app).etag, etag.strip('"'))
+        req = Request.blank('/bucket/object',
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = req.get_response(local_app)
+        self.assertEquals((resp.body, resp.etag), ('aabb', etag.strip('"')))
+        status, body = self._mpu_request(local_app, '/bucket', 'GET')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(
+            dom.getElementsByTagName('ETag')[0].firstChild.data.strip('"'),
+            etag.strip('"'))
+        self.assertEquals(
+            dom.getElementsByTagName('Size')[0].firstChild.data, '4')
+
+    def test_multipart_upload_errors(self):
+        app = fake_swift()
+        local_app = swift3.filter_factory({})(app)
+        status, body = self._mpu_request(local_app, '/bucket/object?uploads',
+                                         'POST')
+        self.assertEquals(status, '404')
+
+        app.create_container('test:tester', 'bucket')
+        upload_id = self._initiate_upload(local_app)
+        for query, expected in (
+                ('partNumber=0&uploadId=%s', 'InvalidArgument'),
+                ('partNumber=x&uploadId=%s', 'InvalidArgument'),
+                ('partNumber=1&uploadId=%s-x', 'NoSuchUpload')):
+            code = self._test_method_error(
+                lambda status: app, 'PUT', '/bucket/object?' +
+                (query % upload_id), 201)
+            self.assertEquals(code, expected)
+
+        self._mpu_request(local_app, '/bucket/object?partNumber=1&'
+                          'uploadId=%s' % upload_id, 'PUT', body='a')
+        self._mpu_request(local_app, '/bucket/object?partNumber=2&'
+                          'uploadId=%s' % upload_id, 'PUT', body='b')
+        for parts, expected in (
+                ([(2, 'b'), (1, 'a')], 'InvalidPartOrder'),
+                ([(1, 'a'), (3, 'b')], 'InvalidPart'),
+                ([(1, 'b')], 'InvalidPart'),
+                ([(1, 'a'), (2, 'b')], 'EntityTooSmall')):
+            body = ''.join('<Part><PartNumber>%d</PartNumber>'
+                           '<ETag>%s</ETag></Part>' %
+                           (n, hashlib.md5(d).hexdigest()) for n, d in parts)
+            code = self._test_method_error(
+                lambda status: app, 'POST', '/bucket/object?uploadId=%s' %
+                upload_id, 200, environ={'wsgi.input': StringIO(
+                    '<CompleteMultipartUpload>%s</CompleteMultipartUpload>'
+                    % body)})
+            self.assertEquals(code, expected)
+        code = self._test_method_error(
+            lambda status: app, 'POST', '/bucket/object?uploadId=%s' %
+            upload_id, 200, environ={'wsgi.input': StringIO('<x')})
+        self.assertEquals(code, 'MalformedXML')
+
+    def test_multipart_abort(self):
+        app = fake_swift({'bucket': {}})
+        local_app = swift3.filter_factory({})(app)
+        upload_id = self._initiate_upload(local_app)
+        self._mpu_request(local_app, '/bucket/object?partNumber=1&'
+                          'uploadId=%s' % upload_id, 'PUT', body='a')
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?uploadId=%s' % upload_id, 'DELETE')
+        self.assertEquals(status, '204')
+        self.assertEquals(stored_objects(app, 'bucket+segments'), {})
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?uploadId=%s' % upload_id, 'DELETE')
+        self.assertEquals(status, '404')
+
+    def _complete_upload(self, local_app, path, parts):
+        status, body = self._mpu_request(local_app, path + '?uploads',
+                                         'POST')
+        self.assertEquals(status, '200')
+        upload_id = xml.dom.minidom.parseString(body).getElementsByTagName(
+            'UploadId')[0].firstChild.data
+        complete = ''
+        for number, data in enumerate(parts):
+            status, body = self._mpu_request(
+                local_app, '%s?partNumber=%d&uploadId=%s' %
+                (path, number + 1, upload_id), 'PUT', body=data)
+            self.assertEquals(status, '200')
+            complete += '<Part><PartNumber>%d</PartNumber>' \
+                '<ETag>%s</ETag></Part>' % (number + 1,
+                                            hashlib.md5(data).hexdigest())
+        status, body = self._mpu_request(
+            local_app, '%s?uploadId=%s' % (path, upload_id), 'POST',
+            body='<CompleteMultipartUpload>%s</CompleteMultipartUpload>' %
+            complete)
+        self.assertEquals(status, '200')
+        return upload_id
+
+    def test_multipart_object_DELETE(self):
+        app = FakeSwift()
+        app.create_container('test:tester', 'bucket')
+        local_app = swift3.filter_factory({'min_part_size': '1'})(app)
+        self._complete_upload(local_app, '/bucket/big', ['aa', 'bb'])
+        self._complete_upload(local_app, '/bucket/big2', ['cc'])
+        app.put_object('test:tester', 'bucket', 'small', 'x')
+        segments = app.accounts['test:tester'][1]['bucket+segments']
+        self.assertEquals(len(segments.names), 3)
+
+        status, body = self._mpu_request(local_app, '/bucket/big', 'DELETE')
+        self.assertEquals(status, '204')
+        self.assertEquals(app.get_object('test:tester', 'bucket', 'big'),
+                          None)
+        self.assertEquals(len(segments.names), 1)
+
+        body = '<Delete><Object><Key>big2</Key></Object>' \
+            '<Object><Key>small</Key></Object></Delete>'
+        status, body = self._mpu_request(
+            local_app, '/bucket?delete', 'POST', body=body,
+            headers={'Content-MD5': hashlib.md5(body).digest().encode(
+                'base64').strip()})
+        self.assertEquals(status, '200')
+        self.assertEquals(body.count('<Deleted>'), 2)
+        self.assertEquals(segments.names, [])
+
+    def test_multipart_object_overwrite(self):
+        app = FakeSwift()
+        app.create_container('test:tester', 'bucket')
+        local_app = swift3.filter_factory({'min_part_size': '1'})(app)
+        self._complete_upload(local_app, '/bucket/big', ['aa', 'bb'])
+        upload_id = self._complete_upload(local_app, '/bucket/big', ['cc'])
+        self.assertEquals(stored_objects(app, 'bucket+segments'),
+                          {'p/%s/00001' % upload_id: 'cc'})
+        self.assertEquals(self._mpu_request(local_app, '/bucket/big', 'GET'),
+                          ('200', 'cc'))
+
+        status, body = self._mpu_request(local_app, '/bucket/big', 'PUT',
+                                         body='dd')
+        self.assertEquals(status, '200')
+        self.assertEquals(stored_objects(app, 'bucket+segments'), {})
+        self.assertEquals(self._mpu_request(local_app, '/bucket/big', 'GET'),
+                          ('200', 'dd'))
+
+    def test_object_DELETE_without_uploads(self):
+        app = fake_swift({'bucket': {'object': 'x'}})
+        local_app = swift3.filter_factory({})(app)
+        status, body = self._mpu_request(local_app, '/bucket/object',
+                                         'DELETE')
+        self.assertEquals(status, '204')
+        self.assertEquals([call[:2] for call in app.calls],
+                          [('HEAD', '/v1/test:tester/bucket+segments'),
+                           ('DELETE', '/v1/test:tester/bucket/object')])
+
+    def test_multipart_object_DELETE_versioned(self):
+        app = FakeSwift()
+        app.create_container('test:tester', 'bucket',
+                             {'X-Container-Versioning': 'enabled'})
+        local_app = swift3.filter_factory({'min_part_size': '1'})(app)
+        self._complete_upload(local_app, '/bucket/big', ['aa', 'bb'])
+        status, body = self._mpu_request(local_app, '/bucket/big', 'DELETE')
+        self.assertEquals(status, '204')
+        # the older version of the object still uses its parts
+        segments = app.accounts['test:tester'][1]['bucket+segments']
+        self.assertEquals(len(segments.names), 2)
+
+    def test_multipart_upload_quota(self):
+        app = FakeSwift()
+        app.create_container('test:tester', 'bucket')
+        app.accounts['test:tester'][0]['X-Account-Meta-Quota-Bytes'] = '10'
+        local_app = swift3.filter_factory({'check_account_quota': 'true'})(
+            app)
+        upload_id = self._initiate_upload(local_app)
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?partNumber=1&uploadId=%s' % upload_id,
+            'PUT', body='x' * 11)
+        self.assertEquals(status, '403')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(dom.getElementsByTagName('Code')[0].firstChild.data,
+                          'QuotaExceeded')
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?partNumber=1&uploadId=%s' % upload_id,
+            'PUT', body='x' * 5)
+        self.assertEquals(status, '200')
+
+    def test_multipart_list_uploads(self):
+        app = fake_swift({'bucket': {}})
+        local_app = swift3.filter_factory({})(app)
+        status, body = self._mpu_request(local_app, '/bucket?uploads', 'GET')
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(dom.getElementsByTagName('Upload'), [])
+
+        upload_ids = [self._initiate_upload(local_app) for i in range(3)]
+        for name in ('dir/a', 'dir/b'):
+            self._mpu_request(local_app, '/bucket/%s?uploads' % name, 'POST')
+        upload_ids.sort()
+
+        status, body = self._mpu_request(
+            local_app, '/bucket?uploads&delimiter=/&max-uploads=2', 'GET')
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(
+            [n.firstChild.data for n in dom.getElementsByTagName('Prefix')
+             if n.parentNode.nodeName == 'CommonPrefixes'], ['dir/'])
+        self.assertEquals(
+            [n.firstChild.data for n in dom.getElementsByTagName('UploadId')],
+            upload_ids[:1])
+        self.assertEquals(
+            dom.getElementsByTagName('IsTruncated')[0].firstChild.data,
+            'true')
+        self.assertEquals(app.calls[-1][:2],
+                          ('GET', '/v1/test:tester/bucket+segments'))
+
+        status, body = self._mpu_request(
+            local_app, '/bucket?uploads&key-marker=object&'
+            'upload-id-marker=%s' % upload_ids[0], 'GET')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(
+            [n.firstChild.data for n in dom.getElementsByTagName('UploadId')],
+            upload_ids[1:])
+        self.assertEquals(
+            dom.getElementsByTagName('IsTruncated')[0].firstChild.data,
+            'false')
+
+        status, body = self._mpu_request(
+            local_app, '/bucket?uploads&key-marker=dir/a', 'GET')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(
+            [n.firstChild.data for n in dom.getElementsByTagName('Key')],
+            ['dir/b', 'object', 'object', 'object'])
+
+        status, body = self._mpu_request(local_app, '/nobucket?uploads',
+                                         'GET')
+        self.assertEquals(status, '404')
+
+    def test_multipart_list_parts(self):
+        app = fake_swift({'bucket': {}})
+        local_app = swift3.filter_factory({})(app)
+        upload_id = self._initiate_upload(local_app)
+        for number in range(1, 4):
+            self._mpu_request(local_app, '/bucket/object?partNumber=%d&'
+                              'uploadId=%s' % (number, upload_id), 'PUT',
+                              body='x' * number)
+
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?uploadId=%s&part-number-marker=1&'
+            'max-parts=1' % upload_id, 'GET')
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(
+            [n.firstChild.data for n in dom.getElementsByTagName('Size')],
+            ['2'])
+        self.assertEquals(
+            dom.getElementsByTagName('NextPartNumberMarker')[0]
+            .firstChild.data, '2')
+        self.assertEquals(
+            dom.getElementsByTagName('IsTruncated')[0].firstChild.data,
+            'true')
+        self.assertEquals(app.calls[-1][2],
+                          'format=json&prefix=p/%s/&limit=2&marker=p/%s/00001'
+                          % (upload_id, upload_id))
+
+        code = self._test_method_error(
+            lambda status: app, 'GET', '/bucket/object?uploadId=x', 200)
+        self.assertEquals(code, 'NoSuchUpload')
+        code = self._test_method_error(
+            lambda status: app, 'GET', '/bucket/object?uploadId=%s&'
+            'max-parts=x' % upload_id, 200)
+        self.assertEquals(code, 'InvalidArgument')
+
+    def test_multipart_upload_part_copy(self):
+        app = fake_swift({'bucket': {'source': '0123456789'}})
+        local_app = swift3.filter_factory({})(app)
+        upload_id = self._initiate_upload(local_app)
+        status, body = self._mpu_request(
+            local_app, '/bucket/object?partNumber=1&uploadId=%s' % upload_id,
+            'PUT', headers={'x-amz-copy-source': '/bucket/source',
+                            'x-amz-copy-source-range': 'bytes=2-5'})
+        self.assertEquals(status, '200')
+        dom = xml.dom.minidom.parseString(body)
+        self.assertEquals(dom.firstChild.nodeName, 'CopyPartResult')
+        self.assertEquals(dom.getElementsByTagName('ETag')[0].firstChild.data,
+                          '"%s"' % hashlib.md5('2345').hexdigest())
+        self.assertEquals(
+            stored_objects(app, 'bucket+segments')['p/%s/00001' % upload_id],
+            '2345')
+
+        for headers, expected in (
+                ({'x-amz-copy-source': '/bucket/source',
+                  'x-amz-copy-source-range': 'bytes=5-10'},
+                 'InvalidArgument'),
+                ({'x-amz-copy-source': '/bucket/source',
+                  'x-amz-copy-source-range': 'bytes=x'}, 'InvalidArgument'),
+                ({'x-amz-copy-source': '/bucket/missing'}, 'NoSuchKey')):
+            code = self._test_method_error(
+                lambda status: app, 'PUT', '/bucket/object?partNumber=2&'
+                'uploadId=%s' % upload_id, 201, headers=headers)
+            self.assertEquals(code, expected)
+
+    def test_object_GET_part_number(self):
+        segments = {'1': 'aaa', '2': 'bb'}
+        app = fake_swift({'bucket': {'plain': 'abc'}, 'segments': segments})
+        app.put_object('test:tester', 'bucket', 'slo', simplejson.dumps(
+            [{'name': '/segments/%s' % n, 'bytes': len(d),
+              'hash': hashlib.md5(d).hexdigest()}
+             for n, d in sorted(segments.items())]),
+            {'X-Static-Large-Object': 'True'})
+        local_app = swift3.filter_factory({})(app)
+
+        status, body = self._mpu_request(local_app, '/bucket/slo?partNumber=2',
+                                         'GET')
+        self.assertEquals(status, '206')
+        self.assertEquals(body, 'bb')
+        self.assertEquals(app.calls[-2], ('GET', '/v1/test:tester/bucket/slo',
+                                          'multipart-manifest=get'))
+        req = Request.blank('/bucket/slo?partNumber=1',
+                            environ={'REQUEST_METHOD': 'HEAD'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        resp = req.get_response(local_app)
+        self.assertEquals(resp.headers['x-amz-mp-parts-count'], '2')
+        self.assertEquals(resp.headers['Content-Range'], 'bytes 0-2/5')
+
+        status, body = self._mpu_request(
+            local_app, '/bucket/plain?partNumber=1', 'GET')
+        self.assertEquals((status, body), ('200', 'abc'))
+        for path, expected in (('/bucket/plain?partNumber=2',
+                                'InvalidPartNumber'),
+                               ('/bucket/slo?partNumber=3',
+                                'InvalidPartNumber'),
+                               ('/bucket/slo?partNumber=0',
+                                'InvalidArgument')):
+            code = self._test_method_error(lambda status: app, 'GET', path,
+                                           200)
+            self.assertEquals(code, expected)
+
+    def test_object_GET_passes_body_through(self):
+        class BodyIter(object):
+            closed = False
+
+            def __iter__(self):
+                return iter(['a' * 10])
+
+            def close(self):
+                self.closed = True
+
+        body = BodyIter()
+
+        def app(env, start_response):
+            start_response('200 OK', [('Content-Length', '10'),
+                                      ('X-Object-Meta-Foo', 'bar'),
+                                      ('X-Backend-Timestamp', '1')])
+            return body
+
+        local_app = swift3.filter_factory({})(app)
+        req = Request.blank('/bucket/object',
+                            environ={'swift.trans_id': 'tx123'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        headers = []
+        resp = local_app(req.environ,
+                         lambda status, h: headers.extend(h))
+        self.assertTrue(resp is body)
+        self.assertEquals(sorted(headers), [('Content-Length', '10'),
+                                            ('x-amz-id-2', 'dHgxMjM='),
+                                            ('x-amz-meta-Foo', 'bar'),
+                                            ('x-amz-request-id', 'tx123')])
+        resp.close()
+        self.assertTrue(body.closed)
+
+    def test_object_GET_conditional(self):
+        calls = []
+
+        def app(env, start_response):
+            calls.append(env)
+            etag = 'd41d8cd98f00b204e9800998ecf8427e'
+            if env.get('HTTP_IF_NONE_MATCH') == etag:
+                start_response('304 Not Modified', [('Etag', etag)])
+            elif env.get('HTTP_IF_MATCH', etag) != etag:
+                start_response('412 Precondition Failed', [])
+            else:
+                start_response('200 OK', [('Etag', etag)])
+            return []
+
+        local_app = swift3.filter_factory({})(app)
+        for method in ('GET', 'HEAD'):
+            req = Request.blank(
+                '/bucket/object', environ={'REQUEST_METHOD': method},
+                headers={'Authorization': 'AWS test:tester:hmac',
+                         'If-None-Match': 'd41d8cd98f00b204e9800998ecf8427e'})
+            resp = req.get_response(local_app)
+            self.assertEquals(resp.status_int, 304)
+            self.assertEquals(resp.body, '')
+            self.assertEquals(resp.etag, 'd41d8cd98f00b204e9800998ecf8427e')
+            self.assertEquals(calls[-1]['HTTP_IF_NONE_MATCH'],
+                              'd41d8cd98f00b204e9800998ecf8427e')
+            # a 304 has no body and no type
+            headers = []
+            local_app(req.environ,
+                      lambda status, h, exc_info=None: headers.extend(h))
+            self.assertEquals([h for h, v in headers
+                               if h.lower() == 'content-type'], [])
+
+        code = self._test_method_error(
+            lambda status: app, 'GET', '/bucket/object', 200,
+            headers={'If-Match': 'other'})
+        self.assertEquals(code, 'PreconditionFailed')
+
+    def test_object_cache(self):
+        calls = []
+
+        def app(env, start_response):
+            calls.append(env.get('HTTP_IF_NONE_MATCH'))
+            if env['REQUEST_METHOD'] != 'GET':
+                start_response('204 No Content', [])
+                return []
+            if env.get('HTTP_IF_NONE_MATCH') == '"etag"':
+                start_response('304 Not Modified', [('Etag', 'etag')])
+                return []
+            start_response('200 OK', [('Etag', 'etag'),
+                                      ('Content-Length', '4')])
+            return ['data']
+
+        local_app = swift3.filter_factory({'object_cache_size': '100'})(app)
+
+        def get(method='GET'):
+            req = Request.blank(
+                '/bucket/object', environ={'REQUEST_METHOD': method},
+                headers={'Authorization': 'AWS test:tester:hmac'})
+            return req.get_response(local_app)
+
+        for expected in (None, '"etag"'):
+            resp = get()
+            self.assertEquals((resp.status_int, resp.body), (200, 'data'))
+            self.assertEquals(resp.etag, 'etag')
+            self.assertEquals(calls[-1], expected)
+        get('DELETE')
+        resp = get()
+        self.assertEquals(calls[-1], None)
+        self.assertEquals(resp.body, 'data')
+
+    def test_negative_cache(self):
+        app = fake_swift({'bucket': {}})
+        local_app = self._verifying_app(app, {'negative_cache_ttl': '60'})
+
+        def request(path, method='GET', secret='secret'):
+            req = self._signed_request(path, secret,
+                                       environ={'REQUEST_METHOD': method})
+            return req.get_response(local_app).status_int
+
+        for i in range(2):
+            self.assertEquals(request('/bucket/object'), 404)
+            self.assertEquals(request('/nobucket'), 404)
+        self.assertEquals(len(app.calls), 2)
+        # the objects of a missing bucket are answered NoSuchBucket
+        req = self._signed_request('/nobucket/object', 'secret')
+        dom = xml.dom.minidom.parseString(req.get_response(local_app).body)
+        self.assertEquals(dom.getElementsByTagName('Code')[0].firstChild.data,
+                          'NoSuchBucket')
+        self.assertEquals(len(app.calls), 2)
+
+        # unverified requests do not use the cache
+        request('/bucket/object', secret='unknown')
+        self.assertEquals(len(app.calls), 2)
+        local_app.verify_signature = False
+        self.assertEquals(request('/bucket/object'), 404)
+        self.assertEquals(len(app.calls), 3)
+        local_app.verify_signature = True
+
+        self.assertEquals(request('/bucket/object', 'PUT'), 200)
+        self.assertEquals(request('/bucket/object'), 200)
+        self.assertEquals(request('/nobucket', 'PUT'), 200)
+        self.assertEquals(request('/nobucket'), 200)
+
+    def test_coalesce_reads(self):
+        calls = []
+
+        def app(env, start_response):
+            calls.append(env['REQUEST_METHOD'])
+            eventlet.sleep(0.01)
+            start_response('200 OK', [('Content-Length', '4')])
+            return []
+
+        local_app = swift3.filter_factory({'coalesce_reads': 'true'})(app)
+        date = email.utils.formatdate(usegmt=True)
+
+        def head(authorization):
+            req = Request.blank('/bucket/object',
+                                environ={'REQUEST_METHOD': 'HEAD'},
+                                headers={'Authorization': authorization,
+                                         'Date': date})
+            return req.get_response(local_app).status_int
+
+        threads = [eventlet.spawn(head, auth) for auth in
+                   ('AWS test:tester:hmac', 'AWS test:tester:hmac',
+                    'AWS test:tester:other')]
+        self.assertEquals([t.wait() for t in threads], [200, 200, 200])
+        self.assertEquals(calls, ['HEAD', 'HEAD'])
+        self.assertEquals(local_app.coalescer.shared_calls, 1)
+
+    def test_listing_prefetch(self):
+        app = fake_swift({'bucket': dict((name, '') for name in 'abcdef')})
+        local_app = self._verifying_app(app, {'listing_prefetch': 'true'})
+
+        requests = []
+
+        def listing(query):
+            req = self._signed_request('/bucket?' + query, 'secret')
+            requests.append(req)
+            resp = req.get_response(local_app)
+            dom = xml.dom.minidom.parseString(resp.body)
+            return [n.firstChild.data for n in dom.getElementsByTagName('Key')]
+
+        self.assertEquals(listing('max-keys=2'), ['a', 'b', 'c'])
+        eventlet.sleep(0)
+        self.assertEquals(len(app.calls), 2)
+        # the prefetch is not accounted to the request which triggered it
+        self.assertEquals(requests[0].environ['swift3.stats'].backend_calls,
+                          1)
+        self.assertEquals(app.calls[-1][2], 'format=json&limit=3&marker=c')
+        # the page prefetched next expires right away
+        local_app.prefetcher.ttl = -1
+        self.assertEquals(listing('max-keys=2&marker=c'), ['d', 'e', 'f'])
+        eventlet.sleep(0)
+        self.assertEquals(len(app.calls), 3)
+        self.assertEquals(local_app.prefetcher.hits, 1)
+        self.assertEquals(local_app.prefetcher.issued, 2)
+        local_app.prefetcher.get(None)
+        self.assertEquals(local_app.prefetcher.wasted, 1)
+
+    def test_phase_timings(self):
+        app = fake_swift({'bucket': {'object': 'data'}})
+        local_app = swift3.filter_factory({})(app)
+        for path in ('/bucket/object', '/bucket', '/bucket'):
+            status, body = self._mpu_request(local_app, path, 'GET')
+            self.assertEquals(status, '200')
+        timings = local_app.metrics.timings
+        for phase in ('request', 'parse', 'canonical', 'auth', 'dispatch',
+                      'backend'):
+            self.assertEquals(timings['GetObject.%s' % phase][0], 1)
+        for phase in ('backend', 'parse_response', 'render'):
+            self.assertEquals(timings['ListObjects.%s' % phase][0], 2)
+        self.assertFalse('GetObject.render' in timings)
+
+        # requests which are not S3 requests are not counted
+        Request.blank('/v1/AUTH_test').get_response(local_app)
+        self.assertEquals(timings['GetObject.request'][0], 1)
+
+    def test_metrics_endpoint(self):
+        app = fake_swift({'bucket': {'object': 'data'}})
+        local_app = swift3.filter_factory(
+            {'metrics_path': '/swift3/metrics',
+             'scheduler_max_inflight': '4'})(app)
+        self._mpu_request(local_app, '/bucket/object', 'GET')
+        self._mpu_request(local_app, '/bucket/missing', 'GET')
+        resp = Request.blank('/swift3/metrics').get_response(local_app)
+        self.assertEquals(resp.status_int, 200)
+        lines = resp.body.splitlines()
+        self.assertTrue('swift3_response_bytes_sum{'
+                        'operation="GetObject",status="200"} 4' in lines)
+        self.assertTrue('swift3_backend_calls_sum{'
+                        'operation="GetObject",status="404"} 1' in lines)
+        self.assertTrue('swift3_scheduler_queued 0' in lines)
+
+        # signed requests of the path are S3 requests of the object
+        app.create_container('test:tester', 'swift3')
+        app.put_object('test:tester', 'swift3', 'metrics', 'object')
+        self.assertEquals(
+            self._mpu_request(local_app, '/swift3/metrics', 'GET'),
+            ('200', 'object'))
+        resp = Request.blank('/swift3/metrics?AWSAccessKeyId=test:tester&'
+                             'Signature=hmac&Expires=%d' %
+                             (time.time() + 60)).get_response(local_app)
+        self.assertEquals(resp.body, 'object')
+
+    def test_slow_request_log(self):
+        app = fake_swift({'bucket': {'a': 'data', 'b': ''}})
+        local_app = swift3.filter_factory(
+            {'slow_request_threshold': '0.000001'})(app)
+        logged = []
+        local_app.logger.warning = lambda *args: logged.append(args)
+        self._mpu_request(local_app, '/bucket', 'GET')
+        self.assertEquals(len(logged), 1)
+        fields = dict(f.split('=') for f in logged[0][1].split())
+        self.assertEquals(fields['operation'], 'ListObjects')
+        self.assertEquals(fields['bucket'], 'bucket')
+        self.assertEquals(fields['status'], '200')
+        self.assertEquals(fields['backend_status'], '200')
+        self.assertEquals(fields['backend_calls'], '1')
+        self.assertEquals(fields['listing_entries'], '2')
+        self.assertTrue(int(fields['bytes_out']) > 0)
+        self.assertTrue('render' in fields)
+
+        local_app.slow_request_threshold = 60
+        self._mpu_request(local_app, '/bucket', 'GET')
+        self.assertEquals(len(logged), 1)
+
+    def test_bucket_logging(self):
+        app = fake_swift({'bucket': {}, 'logs': {}})
+        local_app = swift3.filter_factory({})(app)
+
+        def get_logging():
+            status, body = self._mpu_request(local_app, '/bucket?logging',
+                                             'GET')
+            self.assertEquals(status, '200')
+            dom = xml.dom.minidom.parseString(body)
+            enabled = dom.getElementsByTagName('LoggingEnabled')
+            if not enabled:
+                return None
+            return tuple(
+                enabled[0].getElementsByTagName(name)[0].firstChild.data
+                for name in ('TargetBucket', 'TargetPrefix'))
+
+        self.assertEquals(get_logging(), None)
+        status, _ = self._mpu_request(
+            local_app, '/bucket?logging', 'PUT',
+            body='<BucketLoggingStatus><LoggingEnabled>'
+                 '<TargetBucket>logs</TargetBucket>'
+                 '<TargetPrefix>bucket/</TargetPrefix>'
+                 '</LoggingEnabled></BucketLoggingStatus>')
+        self.assertEquals(status, '200')
+        self.assertEquals(get_logging(), ('logs', 'bucket/'))
+
+        status, body = self._mpu_request(
+            local_app, '/bucket?logging', 'PUT',
+            body='<BucketLoggingStatus><LoggingEnabled>'
+                 '<TargetBucket>missing</TargetBucket>'
+                 '</LoggingEnabled></BucketLoggingStatus>')
+        self.assertEquals(status, '400')
+        self.assertTrue('InvalidTargetBucketForLogging' in body)
+        status, body = self._mpu_request(local_app, '/bucket?logging', 'PUT',
+                                         body='<BucketLoggingStatus>')
+        self.assertEquals(status, '400')
+        self.assertTrue('MalformedXML' in body)
+        self.assertEquals(get_logging(), ('logs', 'bucket/'))
+
+        status, _ = self._mpu_request(local_app, '/bucket?logging', 'PUT',
+                                      body='<BucketLoggingStatus/>')
+        self.assertEquals(status, '200')
+        self.assertEquals(get_logging(), None)
+
+    def test_access_log(self):
+        app = fake_swift({'bucket': {'a': 'data'}, 'other': {}, 'logs': {}})
+        app.accounts['test:tester'][1]['bucket'].headers.update({
+            'X-Container-Meta-S3-Logging-Target-Bucket': 'logs',
+            'X-Container-Meta-S3-Logging-Target-Prefix': 'bucket/'})
+        local_app = swift3.filter_factory({'access_log': 'true'})(app)
+        self._mpu_request(local_app, '/bucket/a', 'GET')
+        self._mpu_request(local_app, '/bucket/b', 'GET')
+        self._mpu_request(local_app, '/other', 'GET')
+        # Nothing is written while the requests are served.
+        self.assertEquals(stored_objects(app, 'logs'), {})
+        self.assertFalse([call for call in app.calls
+                          if call[0] == 'HEAD'])
+
+        local_app.access_logger.flush()
+        self.assertEquals(len(stored_objects(app, 'logs')), 1)
+        name, body = stored_objects(app, 'logs').items()[0]
+        self.assertTrue(name.startswith('bucket/'))
+        records = [line.split(' ') for line in body.splitlines()]
+        self.assertEquals([r[7] for r in records], ['REST.GET.OBJECT'] * 2)
+        self.assertEquals([r[8] for r in records], ['a', 'b'])
+        self.assertEquals([r[12] for r in records], ['200', '404'])
+        self.assertEquals([r[13] for r in records], ['-', 'NoSuchKey'])
+        self.assertEquals(records[0][5], 'test:tester')
+
+        # The configuration of the buckets is cached.
+        self._mpu_request(local_app, '/other', 'GET')
+        self.assertEquals(local_app.access_logger.buffers, {})
+
+    def test_backend_exception(self):
+        def app(env, start_response):
+            raise IOError('backend went away')
+
+        local_app = swift3.filter_factory({})(app)
+        logged = []
+        local_app.logger.exception = lambda e: logged.append(e)
+        status, body = self._mpu_request(local_app, '/bucket/object', 'GET')
+        self.assertEquals(status, '503')
+        self.assertTrue('ServiceUnavailable' in body)
+        self.assertEquals(len(logged), 1)
+        self.assertTrue(isinstance(logged[0], IOError))
+
+    def test_request_ids(self):
+        local_app = swift3.filter_factory({})(fake_swift())
+        req = Request.blank('/bucket/missing',
+                            environ={'swift.trans_id': 'tx123'},
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        headers = []
+        resp = local_app(req.environ, lambda s, h: headers.extend(h))
+        headers = dict(headers)
+        self.assertEquals(headers['x-amz-request-id'], 'tx123')
+        self.assertEquals(headers['x-amz-id-2'], 'dHgxMjM=')
+        dom = xml.dom.minidom.parseString(''.join(resp))
+        self.assertEquals(
+            dom.getElementsByTagName('RequestId')[0].firstChild.data,
+            'tx123')
+        self.assertEquals(
+            dom.getElementsByTagName('HostId')[0].firstChild.data,
+            'dHgxMjM=')
+
+        # Requests without a transaction id get one.
+        req = Request.blank('/bucket/missing',
+                            headers={'Authorization': 'AWS test:tester:hmac'})
+        headers = []
+        local_app(req.environ, lambda s, h: headers.extend(h))
+        self.assertEquals(dict(headers)['x-amz-request-id'],
+                          req.environ['swift.trans_id'])
+
+        # Requests passed through to Swift are left alone.
+        req = Request.blank('/v1/AUTH_test/bucket')
+        headers = []
+        local_app(req.environ, lambda s, h: headers.extend(h))
+        self.assertFalse('x-amz-request-id' in dict(headers))
+
+    def test_span_export(self):
+        app = fake_swift({'bucket': {'a': 'data', 'b': ''}})
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        local_app = swift3.filter_factory(
+            {'span_sink': 'file', 'span_file': path})(app)
+        body = '<Delete><Object><Key>a</Key></Object>' \
+               '<Object><Key>b</Key></Object></Delete>'
+        status, _ = self._mpu_request(local_app, '/bucket?delete', 'POST',
+                                      body=body)
+        self.assertEquals(status, '200')
+        with open(path) as f:
+            records = [simplejson.loads(line) for line in f]
+        self.assertEquals(len(records), 1)
+        self.assertEquals(records[0]['operation'], 'DeleteObjects')
+        spans = records[0]['spans']
+        self.assertTrue(all(s['start'] <= s['end'] for s in spans))
+        self.assertTrue('auth' in [s['name'] for s in spans])
+        deletes = [s['path'] for s in spans if s['name'] == 'backend' and
+                   s['method'] == 'DELETE']
+        self.assertEquals(deletes, ['/v1/test:tester/bucket/a',
+                                    '/v1/test:tester/bucket/b'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import tempfile
+import unittest
+
+import simplejson
+
+from swift3.stats import RequestStats
+from swift3.tracing import FileSpanSink, get_request_ids, get_span_sink
+
+
+class ListSink(object):
+    def __init__(self, conf):
+        self.conf = conf
+
+
+class TestTracing(unittest.TestCase):
+    def test_get_request_ids(self):
+        env = {'swift.trans_id': 'tx123'}
+        self.assertEquals(get_request_ids(env), ('tx123', 'dHgxMjM='))
+        self.assertEquals(env['swift3.request_id'], 'tx123')
+        env = {}
+        request_id, host_id = get_request_ids(env, '-suffix')
+        self.assertTrue(request_id.startswith('tx'))
+        self.assertTrue(request_id.endswith('-suffix'))
+        self.assertEquals(env['swift.trans_id'], request_id)
+
+    def test_get_span_sink(self):
+        self.assertEquals(get_span_sink({}), None)
+        sink = get_span_sink({'span_sink': 'file', 'span_file': '/tmp/x'})
+        self.assertTrue(isinstance(sink, FileSpanSink))
+        self.assertEquals(sink.path, '/tmp/x')
+        conf = {'span_sink': '%s:ListSink' % __name__}
+        sink = get_span_sink(conf)
+        self.assertEquals(sink.__class__.__name__, 'ListSink')
+        self.assertEquals(sink.conf, conf)
+        self.assertRaises(ValueError, get_span_sink, {'span_sink': 'bogus'})
+
+    def test_file_sink(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        stats = RequestStats()
+        stats.spans = []
+        stats.operation = 'GetObject'
+        stats.mark('auth')
+        stats.add_backend_call(stats.start, 'GET', '/v1/a/c/o', 200)
+        sink = FileSpanSink(path)
+        sink.export('tx1', stats)
+        sink.export('tx2', stats)
+        with open(path) as f:
+            records = [simplejson.loads(line) for line in f]
+        self.assertEquals([r['request_id'] for r in records], ['tx1', 'tx2'])
+        spans = records[0]['spans']
+        self.assertEquals([s['name'] for s in spans], ['auth', 'backend'])
+        self.assertEquals(spans[1]['path'], '/v1/a/c/o')
+        self.assertEquals(spans[1]['status'], 200)
+        self.assertEquals(stats.backend_calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
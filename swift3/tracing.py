@@ -0,0 +1,91 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Request IDs and span export.
+
+Every S3 response carries an ``x-amz-request-id`` header holding the Swift
+transaction id of the request (``swift.trans_id``, generated by swift3 when
+no earlier middleware set it), and an ``x-amz-id-2`` header holding its
+base64 encoding.  The same values are the ``RequestId`` and ``HostId`` of
+the XML error bodies, so that a client error report can be matched with
+the proxy logs.
+
+When ``span_sink`` is set, the phases of every S3 request and each of its
+backend sub-requests (one per key of a multi-delete, per listing page...)
+are recorded as spans with their start and end times, and exported to the
+sink when the request is done:
+
+    * ``span_sink = file`` appends one JSON line per request to
+      ``span_file``.
+    * ``span_sink = <module>:<class>`` uses any other sink.  The class is
+      created with the filter configuration and must have an
+      ``export(request_id, stats)`` method taking the request id and the
+      :class:`~swift3.stats.RequestStats` of the request.
+"""
+
+import base64
+
+from simplejson import dumps
+
+from swift.common.utils import generate_trans_id
+
+
+def get_request_ids(env, trans_id_suffix=''):
+    """
+    Returns the (request id, host id) of a request, and stores them in
+    ``env['swift3.request_id']`` and ``env['swift3.host_id']``.
+    """
+    trans_id = env.get('swift.trans_id')
+    if not trans_id:
+        trans_id = env['swift.trans_id'] = generate_trans_id(trans_id_suffix)
+    env['swift3.request_id'] = trans_id
+    env['swift3.host_id'] = base64.b64encode(trans_id)
+    return env['swift3.request_id'], env['swift3.host_id']
+
+
+class FileSpanSink(object):
+    """
+    Appends the spans of every request to a file as JSON lines.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, request_id, stats):
+        record = {'request_id': request_id,
+                  'operation': stats.operation,
+                  'bucket': stats.bucket,
+                  'key': stats.key,
+                  'status': stats.status,
+                  'spans': [dict(attributes, name=name, start=start, end=end)
+                            for name, start, end, attributes in stats.spans]}
+        with open(self.path, 'a') as f:
+            f.write(dumps(record) + '\n')
+
+
+def get_span_sink(conf):
+    """
+    Returns the span sink configured in the swift3 filter section, or None.
+    """
+    sink = conf.get('span_sink', '')
+    if not sink:
+        return None
+    if sink.lower() == 'file':
+        return FileSpanSink(conf.get('span_file', '/var/log/swift/spans'))
+    if ':' not in sink:
+        raise ValueError('Unknown span_sink: %s' % sink)
+    module_name, class_name = sink.split(':', 1)
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)(conf)
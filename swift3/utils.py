@@ -14,7 +14,10 @@
 # limitations under the License.
 
 import re
+import hmac
+import base64
 import urlparse
+from hashlib import sha1
 from urllib import unquote, quote
 from xml.dom.minidom import parseString
 from xml.sax.saxutils import escape as xml_escape
@@ -24,10 +27,17 @@ from swift.common.middleware.s3acl import AUTHENTICATED_USERNAME
 from swift.common.middleware.acl import parse_acl
 from swift.common.http import HTTP_BAD_REQUEST, HTTP_FORBIDDEN, \
     HTTP_NOT_FOUND, HTTP_CONFLICT, HTTP_NOT_IMPLEMENTED, \
-    HTTP_LENGTH_REQUIRED, HTTP_SERVICE_UNAVAILABLE
+    HTTP_LENGTH_REQUIRED, HTTP_SERVICE_UNAVAILABLE, \
+    HTTP_REQUESTED_RANGE_NOT_SATISFIABLE, HTTP_PRECONDITION_FAILED
 
 
 MAX_BUCKET_LISTING = 1000
+# S3 rejects single PUT uploads larger than 5 GB.
+MAX_UPLOAD_SIZE = 5 * 1024 ** 3
+# Limits of multipart uploads, all the parts but the last one must be at
+# least MIN_PART_SIZE bytes.
+MAX_PARTS = 10000
+MIN_PART_SIZE = 5 * 1024 ** 2
 AMZ_ALL_USERS = 'http://acs.amazonaws.com/groups/global/AllUsers'
 AMZ_AUTHENTICATED_USERS = \
     'http://acs.amazonaws.com/groups/global/AuthenticatedUsers'
@@ -44,12 +54,48 @@ ALLOWED_SUB_RESOURCES = sorted([
 ])
 
 
+class BackendUnavailable(Exception):
+    """
+    Raised when swift3 refuses to make a backend call, the request is then
+    answered with ServiceUnavailable.
+    """
+    pass
+
+
+class ErrorResponse(Response):
+    """
+    S3 error response.  The request ID of the request it answers is added
+    to the body when it is sent.
+    """
+    def __init__(self, status, code, message):
+        Response.__init__(self, status=status, content_type='text/xml')
+        self.code = code
+        self.message = message
+        self.body = self._error_body()
+
+    def _error_body(self, request_id=None, host_id=None):
+        body = '<?xml version="1.0" encoding="UTF-8"?>\r\n<Error>\r\n  ' \
+               '<Code>%s</Code>\r\n  <Message>%s</Message>\r\n' \
+               % (self.code, self.message)
+        if request_id:
+            body += '  <RequestId>%s</RequestId>\r\n  ' \
+                    '<HostId>%s</HostId>\r\n' % (request_id, host_id)
+        return body + '</Error>\r\n'
+
+    def __call__(self, env, start_response):
+        env['swift3.error_code'] = self.code
+        if 'swift3.request_id' in env:
+            self.body = self._error_body(env['swift3.request_id'],
+                                         env['swift3.host_id'])
+        return Response.__call__(self, env, start_response)
+
+
 def get_err_response(code):
     """
     Given an HTTP response code, create a properly formatted xml error response
 
     :param code: error code
-    :returns: webob.response object
+    :returns: ErrorResponse object
     """
     error_table = {
         'AccessDenied':
@@ -66,6 +112,11 @@ def get_err_response(code):
         (HTTP_BAD_REQUEST, 'Could not parse the specified URI'),
         'InvalidDigest':
         (HTTP_BAD_REQUEST, 'The Content-MD5 you specified was invalid'),
+        'EntityTooLarge':
+        (HTTP_BAD_REQUEST, 'Your proposed upload exceeds the maximum '
+                           'allowed object size'),
+        'QuotaExceeded':
+        (HTTP_FORBIDDEN, 'The quota of the account has been exceeded'),
         'BadDigest':
         (HTTP_BAD_REQUEST, 'The Content-Length you specified was invalid'),
         'NoSuchBucket':
@@ -76,6 +127,25 @@ def get_err_response(code):
         'RequestTimeTooSkewed':
         (HTTP_FORBIDDEN, 'The difference between the request time and the'
         ' current time is too large'),
+        'NoSuchUpload':
+        (HTTP_NOT_FOUND, 'The specified multipart upload does not exist'),
+        'InvalidPart':
+        (HTTP_BAD_REQUEST, 'One or more of the specified parts could not be '
+                           'found'),
+        'InvalidPartOrder':
+        (HTTP_BAD_REQUEST, 'The list of parts was not in ascending order'),
+        'EntityTooSmall':
+        (HTTP_BAD_REQUEST, 'Your proposed upload is smaller than the minimum '
+                           'allowed object size'),
+        'PreconditionFailed':
+        (HTTP_PRECONDITION_FAILED, 'At least one of the preconditions you '
+                                   'specified did not hold'),
+        'InvalidPartNumber':
+        (HTTP_REQUESTED_RANGE_NOT_SATISFIABLE, 'The requested partnumber is '
+                                               'not satisfiable'),
+        'MalformedXML':
+        (HTTP_BAD_REQUEST, 'The XML you provided was not well-formed or did '
+                           'not validate against our published schema'),
         'NoSuchKey':
         (HTTP_NOT_FOUND, 'The resource you requested does not exist'),
         'Unsupported':
@@ -85,19 +155,35 @@ def get_err_response(code):
         (HTTP_LENGTH_REQUIRED, 'Length Required'),
         'ServiceUnavailable':
         (HTTP_SERVICE_UNAVAILABLE, 'Please reduce your request rate'),
+        'SlowDown':
+        (HTTP_SERVICE_UNAVAILABLE, 'Please reduce your request rate'),
         'IllegalVersioningConfigurationException':
         (HTTP_BAD_REQUEST, 'The specified versioning configuration invalid'),
         'MalformedACLError':
         (HTTP_BAD_REQUEST, 'The XML you provided was not well-formed or did '
-                           'not validate against our published schema')
+                           'not validate against our published schema'),
+        'InvalidTargetBucketForLogging':
+        (HTTP_BAD_REQUEST, 'The target bucket for logging does not exist')
     }
 
-    resp = Response(content_type='text/xml')
-    resp.status = error_table[code][0]
-    resp.body = '<?xml version="1.0" encoding="UTF-8"?>\r\n<Error>\r\n  ' \
-                '<Code>%s</Code>\r\n  <Message>%s</Message>\r\n</Error>\r\n' \
-                % (code, error_table[code][1])
-    return resp
+    return ErrorResponse(error_table[code][0], code, error_table[code][1])
+
+
+def validate_content_length(env):
+    """
+    Checks the Content-Length of a request.
+
+    :param env: WSGI enviroment dict
+    :returns: error response if the Content-Length is invalid, else None
+    """
+    if 'CONTENT_LENGTH' in env:
+        try:
+            content_length = int(env['CONTENT_LENGTH'])
+        except (ValueError, TypeError):
+            return get_err_response('InvalidArgument')
+        if content_length < 0:
+            return get_err_response('InvalidArgument')
+    return None
 
 
 def get_acl(account_name, headers):
@@ -447,6 +533,17 @@ def canonical_string(req):
     return buf + path
 
 
+def get_signature(secret, string_to_sign):
+    """
+    Returns the S3 (version 2) signature of a canonical string.
+
+    :param secret: secret access key
+    :param string_to_sign: string returned by canonical_string()
+    """
+    return base64.b64encode(
+        hmac.new(secret, string_to_sign, sha1).digest()).strip()
+
+
 def swift_acl_translate(acl, group='', user='', xml=False):
     """
     Takes an S3 style ACL and returns a list of header/value pairs that
@@ -495,6 +592,26 @@ def swift_acl_translate(acl, group='', user='', xml=False):
     return swift_acl[acl]
 
 
+def object_acl_translate(acl):
+    """
+    Takes a canned S3 ACL and returns a list of the object ACL header/value
+    pairs that implement it, or "Unsupported" or "InvalidArgument" like
+    swift_acl_translate().
+    """
+    translated_acl = swift_acl_translate(acl)
+    if isinstance(translated_acl, basestring):
+        return translated_acl
+    headers = dict.fromkeys(('HTTP_X_OBJECT_ACL_READ',
+                             'HTTP_X_OBJECT_ACL_WRITE',
+                             'HTTP_X_OBJECT_ACL_READ_ACP',
+                             'HTTP_X_OBJECT_ACL_WRITE_ACP'), '')
+    for header, value in translated_acl:
+        if value.startswith('.r:*'):
+            # len(HTTP_X_CONTAINER_) = 17
+            headers['HTTP_X_OBJECT_ACL_' + header[17:]] = '.r:*'
+    return headers.items()
+
+
 def validate_bucket_name(name):
     """
     Validates the name of the bucket against S3 criteria,